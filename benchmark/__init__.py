@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+
+from .dataset import Dataset, PublicStation, Station, StationModule
+from .stub_server import StubServer
+from .suite import Parameters, run
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import datetime
+import json
+import pathlib
+import platform
+import sys
+from typing import Any, Dict
+import sqlalchemy
+from .suite import Parameters, run
+
+
+def main() -> None:
+    # python -m benchmark [--quick] [--output report.json]
+    default = Parameters()
+    parser = argparse.ArgumentParser(
+            prog='python -m benchmark',
+            description='offline pyatmo benchmarks against a stub server')
+    parser.add_argument(
+            '--output',
+            type=pathlib.Path,
+            help='JSON report (default: stdout)')
+    parser.add_argument(
+            '--quick',
+            action='store_true',
+            help='small dataset for a smoke run')
+    parser.add_argument('--stations', type=int)
+    parser.add_argument('--days', type=float)
+    parser.add_argument('--public-stations', type=int)
+    parser.add_argument('--calls', type=int)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--queries', type=int)
+    parser.add_argument('--startups', type=int)
+    parser.add_argument(
+            '--backfill-rows',
+            type=int,
+            help='measurements of the register/update backfill (0: skip)')
+    parser.add_argument(
+            '--accounts',
+            type=int,
+            help='accounts sharing the stations (ClientPool when > 1)')
+    parser.add_argument(
+            '--request-interval',
+            type=float,
+            help='seconds between requests per account')
+    parser.add_argument(
+            '--latency',
+            type=float,
+            help='seconds added to each stub response')
+    parser.add_argument(
+            '--error-rate',
+            type=float,
+            help='probability of a 429 stub response')
+    parser.add_argument('--seed', type=int)
+    option = parser.parse_args()
+    override = {
+            name: getattr(option, name)
+            for name in default._fields
+            if getattr(option, name, None) is not None}
+    parameters = (
+            Parameters.quick(**override)
+            if option.quick
+            else Parameters(**override))
+    report: Dict[str, Any] = {
+            'created': datetime.datetime.now(
+                    datetime.timezone.utc).isoformat(),
+            'environment': {
+                    'python': platform.python_version(),
+                    'implementation': platform.python_implementation(),
+                    'platform': platform.platform(),
+                    'sqlalchemy': sqlalchemy.__version__},
+            'parameters': parameters._asdict(),
+            'results': run(parameters)}
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if option.output is not None:
+        option.output.write_text(text + '\n', encoding='utf-8')
+    else:
+        sys.stdout.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+import math
+import random
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+
+# 2024-01-01T00:00:00Z: fixed for reproducible datasets
+DEFAULT_END = 1704067200
+# data_type per module type
+MODULE_DATA_TYPE = {
+        'NAMain': ['Temperature', 'CO2', 'Humidity', 'Noise', 'Pressure'],
+        'NAModule1': ['Temperature', 'Humidity'],
+        'NAModule2': ['Wind'],
+        'NAModule3': ['Rain'],
+        'NAModule4': ['Temperature', 'CO2', 'Humidity']}
+# first byte of the module MAC address per module type
+_MODULE_PREFIX = {
+        'NAModule1': 0x02,
+        'NAModule2': 0x06,
+        'NAModule3': 0x05,
+        'NAModule4': 0x03}
+# percentage of the days with an outage of a few hours per module
+_OUTAGE_PERCENT = 2
+
+
+class StationModule(NamedTuple):
+    id: str
+    device_id: str
+    name: str
+    module_type: str
+    data_type: List[str]
+    # seed of the generated values
+    seed: int
+
+
+class Station(NamedTuple):
+    id: str
+    name: str
+    latitude: float
+    longitude: float
+    altitude: float
+    timezone: str
+    # main module first
+    modules: List[StationModule]
+
+
+class PublicStation(NamedTuple):
+    id: str
+    latitude: float
+    longitude: float
+    altitude: float
+
+
+class Dataset:
+    # measurements are computed from (module, timestamp), not stored:
+    # multi-year datasets cost no memory and pages are always consistent
+    def __init__(
+            self,
+            station_list: List[Station],
+            public_station_list: List[PublicStation],
+            begin: int,
+            end: int,
+            step: int = 300) -> None:
+        self._station_list = station_list
+        self._public_station_list = public_station_list
+        self._begin = begin
+        self._end = end
+        self._step = step
+        self._module_dict: Dict[str, Tuple[Station, StationModule]] = {
+                module.id: (station, module)
+                for station in station_list
+                for module in station.modules}
+
+    @classmethod
+    def generate(
+            cls,
+            stations: int = 4,
+            days: float = 365.0,
+            step: int = 300,
+            public_stations: int = 10000,
+            end: int = DEFAULT_END,
+            seed: int = 0) -> 'Dataset':
+        generator = random.Random(seed)
+        station_list: List[Station] = []
+        module_index = 0
+        for i in range(stations):
+            device_id = '70:ee:50:{0:02x}:{1:02x}:{2:02x}'.format(
+                    (i >> 16) & 0xff,
+                    (i >> 8) & 0xff,
+                    i & 0xff)
+            # indoor + outdoor, optional rain/wind/additional indoor modules
+            module_type_list = ['NAMain', 'NAModule1']
+            for module_type, probability in (
+                    ('NAModule3', 0.5),
+                    ('NAModule2', 0.3),
+                    ('NAModule4', 0.4),
+                    ('NAModule4', 0.2)):
+                if generator.random() < probability:
+                    module_type_list.append(module_type)
+            module_list: List[StationModule] = []
+            for j, module_type in enumerate(module_type_list):
+                module_list.append(StationModule(
+                        id=(device_id
+                            if j == 0
+                            else '{0:02x}:00:00:{1:02x}:{2:02x}:{3:02x}'
+                            .format(
+                                    _MODULE_PREFIX[module_type],
+                                    (i >> 8) & 0xff,
+                                    i & 0xff,
+                                    j)),
+                        device_id=device_id,
+                        name='{0} {1}'.format(module_type, j),
+                        module_type=module_type,
+                        data_type=MODULE_DATA_TYPE[module_type],
+                        seed=module_index))
+                module_index += 1
+            station_list.append(Station(
+                    id=device_id,
+                    name='station {0}'.format(i),
+                    latitude=round(generator.uniform(43.0, 51.0), 6),
+                    longitude=round(generator.uniform(-2.0, 8.0), 6),
+                    altitude=float(generator.randint(0, 1500)),
+                    timezone='Europe/Paris',
+                    modules=module_list))
+        public_station_list = [
+                PublicStation(
+                        id='70:ee:51:{0:02x}:{1:02x}:{2:02x}'.format(
+                                (i >> 16) & 0xff,
+                                (i >> 8) & 0xff,
+                                i & 0xff),
+                        latitude=round(generator.uniform(43.0, 51.0), 6),
+                        longitude=round(generator.uniform(-2.0, 8.0), 6),
+                        altitude=float(generator.randint(0, 1500)))
+                for i in range(public_stations)]
+        begin = end - int(days * 86400)
+        return cls(
+                station_list,
+                public_station_list,
+                begin - begin % step,
+                end,
+                step)
+
+    @property
+    def begin(self) -> int:
+        return self._begin
+
+    @property
+    def end(self) -> int:
+        return self._end
+
+    @property
+    def step(self) -> int:
+        return self._step
+
+    @property
+    def stations(self) -> List[Station]:
+        return self._station_list
+
+    @property
+    def public_stations(self) -> List[PublicStation]:
+        return self._public_station_list
+
+    def module(
+            self,
+            module_id: str) -> Optional[Tuple[Station, StationModule]]:
+        return self._module_dict.get(module_id)
+
+    def timestamps(
+            self,
+            module: StationModule,
+            begin: Optional[int] = None,
+            end: Optional[int] = None) -> Iterator[int]:
+        # [begin, end], outages excluded
+        first = self._begin + module.seed % self._step
+        begin = max(first, begin if begin is not None else first)
+        end = min(self._end, end if end is not None else self._end)
+        timestamp = first + -(-(begin - first) // self._step) * self._step
+        while timestamp <= end:
+            if not _is_outage(module.seed, timestamp):
+                yield timestamp
+            timestamp += self._step
+
+    def values(
+            self,
+            module: StationModule,
+            type_list: List[str],
+            timestamp: int) -> List[Optional[float]]:
+        is_indoor = module.module_type in ('NAMain', 'NAModule4')
+        return [
+                _value(type_name.lower(), module.seed, is_indoor, timestamp)
+                for type_name in type_list]
+
+
+def _hash(*values: int) -> int:
+    # deterministic & fast: 64-bit multiplicative mixing
+    result = 0x9e3779b97f4a7c15
+    for value in values:
+        result = ((result ^ value) * 0xbf58476d1ce4e5b9) & 0xffffffffffffffff
+        result ^= result >> 31
+    return result
+
+
+def _noise(module_index: int, kind: int, timestamp: int) -> float:
+    # [-1, 1)
+    return _hash(module_index, kind, timestamp) / 2.0 ** 63 - 1.0
+
+
+def _is_outage(module_index: int, timestamp: int) -> bool:
+    day, second = divmod(timestamp, 86400)
+    value = _hash(module_index, day)
+    if value % 100 >= _OUTAGE_PERCENT:
+        return False
+    start_hour = (value >> 8) % 21
+    return start_hour <= second // 3600 < start_hour + 3
+
+
+def _value(
+        type_name: str,
+        module_index: int,
+        is_indoor: bool,
+        timestamp: int) -> Optional[float]:
+    # daily & seasonal cycles (phase: 15:00 & late July) with noise
+    daily = math.sin(2 * math.pi * ((timestamp - 32400) % 86400) / 86400)
+    seasonal = math.sin(
+            2 * math.pi * ((timestamp - 9504000) % 31557600) / 31557600)
+    if type_name == 'temperature':
+        if is_indoor:
+            value = (21.0 + 1.5 * daily
+                     + 0.3 * _noise(module_index, 0, timestamp))
+        else:
+            value = (12.0 + 9.0 * seasonal + 5.0 * daily
+                     + 0.5 * _noise(module_index, 0, timestamp))
+        return round(value, 1)
+    if type_name == 'humidity':
+        return float(round(
+                (50.0 if is_indoor else 70.0) - 15.0 * daily
+                + 5.0 * _noise(module_index, 1, timestamp)))
+    if type_name == 'pressure':
+        weather = math.sin(2 * math.pi * timestamp / 432000 + module_index)
+        return round(
+                1013.0 + 12.0 * weather
+                + 0.2 * _noise(module_index, 2, timestamp), 1)
+    if type_name == 'co2':
+        return float(round(
+                700.0 + 300.0 * daily
+                + 100.0 * _noise(module_index, 3, timestamp)))
+    if type_name == 'noise':
+        return float(round(
+                40.0 + 8.0 * daily + 4.0 * _noise(module_index, 4, timestamp)))
+    if type_name == 'rain':
+        # rainy hours
+        if _hash(module_index, 5, timestamp // 3600) % 10 != 0:
+            return 0.0
+        return round(0.101 * (_hash(module_index, 6, timestamp) % 8), 3)
+    if type_name in ('windstrength', 'guststrength'):
+        strength = 12.0 + 8.0 * daily + 6.0 * _noise(
+                module_index,
+                7,
+                timestamp // 1800)
+        if type_name == 'guststrength':
+            strength *= 1.6
+        return float(max(0, round(strength)))
+    if type_name in ('windangle', 'gustangle'):
+        angle = (225.0
+                 + 60.0 * _noise(module_index, 8, timestamp // 3600)
+                 + (20.0 if type_name == 'gustangle' else 0.0))
+        return float(round(angle) % 360)
+    return None
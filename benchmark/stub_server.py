@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+
+import http.server
+import itertools
+import json
+import random
+import socket
+import threading
+import time
+import urllib.parse
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+from .dataset import Dataset, PublicStation, StationModule
+
+
+# maximum number of measurements per getmeasure response
+MEASURE_LIMIT = 1024
+# maximum number of stations per getpublicdata response
+PUBLIC_DATA_LIMIT = 500
+_WIND_TYPE_LIST = ['WindStrength', 'WindAngle', 'GustStrength', 'GustAngle']
+# password of every account
+PASSWORD = 'benchmark'
+
+
+class StubServer:
+    # local Netatmo API: /oauth2/token & /api/{getstationsdata,
+    # getmeasure,getpublicdata}, served from a generated Dataset
+    def __init__(
+            self,
+            dataset: Dataset,
+            latency: float = 0.0,
+            error_rate: float = 0.0,
+            token_lifetime: int = 10800,
+            accounts: int = 1,
+            favorites: Optional[Mapping[int, Sequence[str]]] = None,
+            seed: int = 0) -> None:
+        # latency: seconds added to each response
+        # error_rate: probability of a 429 (user usage reached) response
+        # accounts: station i belongs to account_username(i % accounts)
+        # favorites: account -> station ids (read only, get_favorites)
+        self._dataset = dataset
+        self._accounts = accounts
+        self._favorite_dict = {
+                account: set(station_id_list)
+                for account, station_id_list in (favorites or {}).items()}
+        self._account_dict = {
+                station.id: i % accounts
+                for i, station in enumerate(dataset.stations)}
+        self._latency = latency
+        self._error_rate = error_rate
+        self._token_lifetime = token_lifetime
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._token_counter = itertools.count(1)
+        # token -> account
+        self._access_token_dict: Dict[str, int] = {}
+        self._refresh_token_dict: Dict[str, int] = {}
+        self._request_count: Dict[str, int] = {}
+        self._connection_count = 0
+        self._server: Optional[http.server.ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> 'StubServer':
+        self.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+    @property
+    def url(self) -> str:
+        assert self._server is not None
+        port = self._server.server_address[1]
+        return 'http://127.0.0.1:{0}'.format(port)
+
+    @property
+    def request_count(self) -> Dict[str, int]:
+        # path -> number of requests
+        with self._lock:
+            return dict(self._request_count)
+
+    @property
+    def connection_count(self) -> int:
+        # number of accepted TCP connections
+        with self._lock:
+            return self._connection_count
+
+    def start(self) -> None:
+        stub = self
+
+        class Handler(_Handler):
+            server_stub = stub
+
+        self._server = _HTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(
+                target=self._server.serve_forever,
+                name='pyatmo_stub_server',
+                daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def connected(self) -> None:
+        with self._lock:
+            self._connection_count += 1
+
+    def handle(
+            self,
+            path: str,
+            params: Dict[str, str]) -> Tuple[int, Dict[str, Any]]:
+        # (status code, JSON body)
+        with self._lock:
+            self._request_count[path] = self._request_count.get(path, 0) + 1
+            is_error = self._random.random() < self._error_rate
+        if self._latency > 0:
+            time.sleep(self._latency)
+        if is_error:
+            return 429, _error(26, 'User usage reached')
+        if path == '/oauth2/token':
+            return self._token(params)
+        if path.startswith('/api/'):
+            with self._lock:
+                account = self._access_token_dict.get(
+                        params.get('access_token', ''))
+            if account is None:
+                return 403, _error(2, 'Invalid access token')
+            if path == '/api/getstationsdata':
+                return 200, _ok(self._stations_data(account, params))
+            if path == '/api/getmeasure':
+                return self._measure(account, params)
+            if path == '/api/getpublicdata':
+                return self._public_data(params)
+        return 404, _error(404, 'Not found')
+
+    def _token(self, params: Dict[str, str]) -> Tuple[int, Dict[str, Any]]:
+        grant_type = params.get('grant_type')
+        with self._lock:
+            if grant_type == 'refresh_token':
+                # the refresh token is used once
+                account = self._refresh_token_dict.pop(
+                        params.get('refresh_token', ''),
+                        None)
+                if account is None:
+                    return 400, {'error': 'invalid_grant'}
+            elif grant_type == 'password':
+                account = next(
+                        (i for i in range(self._accounts)
+                         if params.get('username') == account_username(i)),
+                        None)
+                if account is None or params.get('password') != PASSWORD:
+                    return 400, {'error': 'invalid_grant'}
+            else:
+                return 400, {'error': 'unsupported_grant_type'}
+            number = next(self._token_counter)
+            access_token = 'access-{0}'.format(number)
+            refresh_token = 'refresh-{0}'.format(number)
+            self._access_token_dict[access_token] = account
+            self._refresh_token_dict[refresh_token] = account
+        return 200, {
+                'access_token': access_token,
+                'refresh_token': refresh_token,
+                'expires_in': self._token_lifetime,
+                'expire_in': self._token_lifetime,
+                'scope': params.get('scope', 'read_station').split()}
+
+    def _stations_data(
+            self,
+            account: int,
+            params: Dict[str, str]) -> Dict[str, Any]:
+        device_list: List[Dict[str, Any]] = []
+        get_favorites = params.get('get_favorites', '').lower() == 'true'
+        for station in self._dataset.stations:
+            is_favorite = (
+                    self._account_dict[station.id] != account
+                    and station.id in self._favorite_dict.get(account, ()))
+            if (self._account_dict[station.id] != account
+                    and not (get_favorites and is_favorite)):
+                continue
+            if ('device_id' in params
+                    and params['device_id'] != station.id):
+                continue
+            main_module = station.modules[0]
+            device_list.append({
+                    '_id': station.id,
+                    'read_only': is_favorite,
+                    'station_name': station.name,
+                    'module_name': main_module.name,
+                    'type': main_module.module_type,
+                    'data_type': main_module.data_type,
+                    'place': {
+                            'location': [station.longitude, station.latitude],
+                            'altitude': station.altitude,
+                            'timezone': station.timezone},
+                    'modules': [
+                            {'_id': module.id,
+                             'module_name': module.name,
+                             'type': module.module_type,
+                             'data_type': module.data_type}
+                            for module in station.modules[1:]]})
+        return {
+                'devices': device_list,
+                'user': {'mail': account_username(account)}}
+
+    def _measure(
+            self,
+            account: int,
+            params: Dict[str, str]) -> Tuple[int, Dict[str, Any]]:
+        found = self._dataset.module(params.get('module_id', ''))
+        if (found is None
+                or found[0].id != params.get('device_id')
+                or (self._account_dict[found[0].id] != account
+                    and found[0].id not in self._favorite_dict.get(
+                            account,
+                            ()))):
+            return 400, _error(9, 'Device not found')
+        if params.get('scale', 'max') != 'max':
+            return 400, _error(21, 'Only scale=max is supported by the stub')
+        module = found[1]
+        type_list: List[str] = []
+        for type_name in params.get('type', '').split(','):
+            if type_name.strip().lower() == 'wind':
+                type_list.extend(_WIND_TYPE_LIST)
+            elif type_name.strip():
+                type_list.append(type_name.strip())
+        limit = min(int(params.get('limit', MEASURE_LIMIT)), MEASURE_LIMIT)
+        # date_begin omitted: from the first measurement
+        timestamp_list = list(itertools.islice(
+                self._dataset.timestamps(
+                        module,
+                        _optional_int(params.get('date_begin')),
+                        _optional_int(params.get('date_end'))),
+                limit))
+        if params.get('optimize', 'false').lower() != 'true':
+            return 200, _ok({
+                    str(timestamp): self._dataset.values(
+                            module,
+                            type_list,
+                            timestamp)
+                    for timestamp in timestamp_list})
+        return 200, _ok(self._optimized_body(
+                module,
+                type_list,
+                timestamp_list))
+
+    def _optimized_body(
+            self,
+            module: StationModule,
+            type_list: List[str],
+            timestamp_list: List[int]) -> List[Dict[str, Any]]:
+        # runs of a constant step: [{'beg_time', 'step_time', 'value'}]
+        body: List[Dict[str, Any]] = []
+        for timestamp in timestamp_list:
+            value = self._dataset.values(module, type_list, timestamp)
+            if body:
+                run = body[-1]
+                expected = (run['beg_time']
+                            + len(run['value']) * run.get('step_time', 0))
+                if len(run['value']) == 1:
+                    run['step_time'] = timestamp - run['beg_time']
+                    run['value'].append(value)
+                    continue
+                if timestamp == expected:
+                    run['value'].append(value)
+                    continue
+            body.append({'beg_time': timestamp, 'value': [value]})
+        return body
+
+    def _public_data(
+            self,
+            params: Dict[str, str]) -> Tuple[int, Dict[str, Any]]:
+        try:
+            lat_ne = float(params['lat_ne'])
+            lon_ne = float(params['lon_ne'])
+            lat_sw = float(params['lat_sw'])
+            lon_sw = float(params['lon_sw'])
+        except (KeyError, ValueError):
+            return 400, _error(21, 'Invalid bounding box')
+        station_list = [
+                station for station in self._dataset.public_stations
+                if (lat_sw <= station.latitude <= lat_ne
+                    and lon_sw <= station.longitude <= lon_ne)]
+        # thinned out like the real API
+        timestamp = self._dataset.end - self._dataset.end % 600
+        return 200, _ok([
+                _public_station(station, timestamp)
+                for station in station_list[:PUBLIC_DATA_LIMIT]])
+
+
+class _HTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_stub: StubServer
+
+    def setup(self) -> None:
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server_stub.connected()
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        self._respond(url.path, url.query)
+
+    def do_POST(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        length = int(self.headers.get('Content-Length', 0))
+        query = self.rfile.read(length).decode('utf-8')
+        if url.query:
+            query = '{0}&{1}'.format(url.query, query)
+        self._respond(url.path, query)
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def _respond(self, path: str, query: str) -> None:
+        params = dict(urllib.parse.parse_qsl(query))
+        status_code, body = self.server_stub.handle(path, params)
+        content = json.dumps(body, separators=(',', ':')).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def account_username(index: int) -> str:
+    return 'account{0}@example.com'.format(index)
+
+
+def _ok(body: Any) -> Dict[str, Any]:
+    return {'body': body, 'status': 'ok', 'time_server': int(time.time())}
+
+
+def _error(code: int, message: str) -> Dict[str, Any]:
+    return {'error': {'code': code, 'message': message}}
+
+
+def _optional_int(value: Optional[str]) -> Optional[int]:
+    return int(value) if value is not None else None
+
+
+def _public_station(
+        station: PublicStation,
+        timestamp: int) -> Dict[str, Any]:
+    module_id = '02:00:00{0}'.format(station.id[8:])
+    return {
+            '_id': station.id,
+            'place': {
+                    'location': [station.longitude, station.latitude],
+                    'altitude': station.altitude,
+                    'timezone': 'Europe/Paris'},
+            'mark': 10,
+            'measures': {
+                    station.id: {
+                            'res': {str(timestamp): [1013.2]},
+                            'type': ['pressure']},
+                    module_id: {
+                            'res': {str(timestamp): [12.3, 71]},
+                            'type': ['temperature', 'humidity']}},
+            'modules': [module_id],
+            'module_types': {module_id: 'NAModule1'}}
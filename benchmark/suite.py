@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+
+import concurrent.futures
+import json
+import logging
+import os
+import pathlib
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple, Union
+import sqlalchemy
+import sqlalchemy.orm
+import pyatmo
+import pyatmo.weather
+from .dataset import Dataset
+from .stub_server import PASSWORD, StubServer, account_username
+
+
+# cron-like run in a fresh interpreter: import, open, no-op update
+_STARTUP_SCRIPT = '''
+import json, pathlib, sys, time
+start_time = time.perf_counter()
+import pyatmo
+import pyatmo.weather
+import_time = time.perf_counter()
+client = pyatmo.Client('client_id', 'client_secret', base_url=sys.argv[2])
+database = pyatmo.weather.Database(pathlib.Path(sys.argv[1]), client)
+open_time = time.perf_counter()
+database.update(request_limit=0)
+update_time = time.perf_counter()
+json.dump([
+        import_time - start_time,
+        open_time - import_time,
+        update_time - open_time], sys.stdout)
+'''
+
+
+class Parameters(NamedTuple):
+    stations: int = 4
+    days: float = 365.0
+    step: int = 300
+    public_stations: int = 10000
+    # client throughput
+    calls: int = 500
+    workers: int = 8
+    # measurements queries per window
+    queries: int = 50
+    # interpreter startups
+    startups: int = 10
+    # measurements of the register/update backfill (0: skipped)
+    backfill_rows: int = 1000000
+    # Netatmo accounts (ClientPool when > 1) & seconds between requests
+    # per account (0: no rate limit)
+    accounts: int = 1
+    request_interval: float = 0.0
+    latency: float = 0.0
+    error_rate: float = 0.0
+    seed: int = 0
+
+    @classmethod
+    def quick(cls, **kwargs: Any) -> 'Parameters':
+        values: Dict[str, Any] = {
+                'stations': 2,
+                'days': 30.0,
+                'public_stations': 1000,
+                'calls': 100,
+                'queries': 10,
+                'startups': 3,
+                'backfill_rows': 50000}
+        values.update(kwargs)
+        return cls(**values)
+
+
+def run(parameters: Parameters) -> Dict[str, Any]:
+    # results per benchmark
+    dataset = Dataset.generate(
+            stations=parameters.stations,
+            days=parameters.days,
+            step=parameters.step,
+            public_stations=parameters.public_stations,
+            seed=parameters.seed)
+    result: Dict[str, Any] = {}
+    with StubServer(
+            dataset,
+            latency=parameters.latency,
+            error_rate=parameters.error_rate,
+            accounts=parameters.accounts,
+            seed=parameters.seed) as server:
+        result['client'] = client_throughput(dataset, server, parameters)
+        with tempfile.TemporaryDirectory() as directory:
+            database_result = database_benchmark(
+                    dataset,
+                    server,
+                    pathlib.Path(directory).joinpath('benchmark.sqlite3'),
+                    parameters)
+        result.update(database_result)
+        result['server_requests'] = server.request_count
+    if parameters.backfill_rows > 0:
+        result['backfill'] = backfill_benchmark(parameters)
+    return result
+
+
+def create_client(
+        server: StubServer,
+        metrics: pyatmo.Metrics,
+        parameters: Parameters) -> Union[pyatmo.Client, pyatmo.ClientPool]:
+    # a ClientPool of one Client per account when accounts > 1
+    # no retry: measure pyatmo, not the retries
+    logger = logging.getLogger('benchmark.pyatmo')
+    logger.setLevel(logging.CRITICAL)
+    client_list: List[pyatmo.Client] = []
+    for account in range(parameters.accounts):
+        client = pyatmo.Client(
+                'client_id',
+                'client_secret',
+                request_interval=parameters.request_interval or None,
+                pool_size=parameters.workers,
+                max_retries=0,
+                metrics=metrics,
+                base_url=server.url,
+                logger=logger)
+        client.authorize(account_username(account), PASSWORD)
+        client_list.append(client)
+    if len(client_list) == 1:
+        return client_list[0]
+    return pyatmo.ClientPool(client_list, logger=logger)
+
+
+def client_throughput(
+        dataset: Dataset,
+        server: StubServer,
+        parameters: Parameters) -> Dict[str, Any]:
+    # concurrent get_measure calls on distinct pages (nothing coalesced)
+    metrics = pyatmo.InMemoryMetrics()
+    client = create_client(server, metrics, parameters)
+    generator = random.Random(parameters.seed)
+    module_list = [
+            module
+            for station in dataset.stations
+            for module in station.modules]
+    # (module index, date_begin): distinct
+    call_set: Set[Tuple[int, int]] = set()
+    while len(call_set) < parameters.calls:
+        call_set.add((
+                generator.randrange(len(module_list)),
+                generator.randrange(
+                        dataset.begin,
+                        dataset.end,
+                        dataset.step)))
+    call_list = sorted(call_set)
+    generator.shuffle(call_list)
+
+    def call(module_index: int, date_begin: int) -> float:
+        module = module_list[module_index]
+        start_time = time.perf_counter()
+        client.get_measure(
+                device_id=module.device_id,
+                module_id=module.id,
+                scale='max',
+                type_list=module.data_type,
+                date_begin=date_begin,
+                optimize=True)
+        return time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=parameters.workers) as executor:
+        latency_list = list(executor.map(lambda x: call(*x), call_list))
+    elapsed_time = time.perf_counter() - start_time
+    client.close()
+    snapshot = metrics.snapshot()
+    status_dict = {
+            dict(labels)['status']: int(value)
+            for (name, labels), value in snapshot.counters.items()
+            if name == 'pyatmo_requests_total'
+            and dict(labels).get('endpoint') == 'getmeasure'}
+    return {
+            'calls': parameters.calls,
+            'workers': parameters.workers,
+            'seconds': elapsed_time,
+            'calls_per_second': parameters.calls / elapsed_time,
+            'latency': summarize(latency_list),
+            'status': status_dict,
+            'response_bytes': snapshot.counter(
+                    'pyatmo_response_bytes_total',
+                    endpoint='getmeasure')}
+
+
+def database_benchmark(
+        dataset: Dataset,
+        server: StubServer,
+        path: pathlib.Path,
+        parameters: Parameters) -> Dict[str, Any]:
+    metrics = pyatmo.InMemoryMetrics()
+    client = create_client(server, metrics, parameters)
+    logger = logging.getLogger('benchmark.database')
+    logger.setLevel(logging.CRITICAL)
+    database = pyatmo.weather.Database(
+            path,
+            client,
+            logger=logger,
+            metrics=metrics)
+    result: Dict[str, Any] = {}
+    # register
+    start_time = time.perf_counter()
+    database.register()
+    result['register'] = {
+            'devices': len(dataset.stations),
+            'seconds': time.perf_counter() - start_time}
+    # update: from scratch to the end of the dataset
+    start_time = time.perf_counter()
+    database.update(min_update_interval=None, max_workers=parameters.workers)
+    elapsed_time = time.perf_counter() - start_time
+    rows = sum(
+            value
+            for (name, _), value in metrics.snapshot().counters.items()
+            if name == 'pyatmo_update_committed_rows_total')
+    result['update'] = {
+            'rows': int(rows),
+            'seconds': elapsed_time,
+            'rows_per_second': rows / elapsed_time,
+            'database_bytes': path.stat().st_size}
+    # measurements: random windows
+    generator = random.Random(parameters.seed)
+    module_list = [
+            module
+            for device in database.all_device()
+            for module in device.modules]
+    query_dict: Dict[str, Any] = {}
+    for days in (1, 7, 30):
+        window = days * 86400
+        if window >= dataset.end - dataset.begin:
+            continue
+        latency_list: List[float] = []
+        row_count = 0
+        for _ in range(parameters.queries):
+            module = generator.choice(module_list)
+            begin = generator.randrange(dataset.begin, dataset.end - window)
+            start_time = time.perf_counter()
+            row_count += len(database.measurements(
+                    module,
+                    begin,
+                    begin + window))
+            latency_list.append(time.perf_counter() - start_time)
+        query_dict['{0}d'.format(days)] = {
+                'queries': parameters.queries,
+                'rows': row_count,
+                'latency': summarize(latency_list)}
+    result['measurements'] = query_dict
+    client.close()
+    result['startup'] = startup_benchmark(server, path, parameters)
+    return result
+
+
+def backfill_benchmark(parameters: Parameters) -> Dict[str, Any]:
+    # register & update of an empty database from a dataset of about
+    # backfill_rows measurements, per insert path:
+    #   executemany: Database.update (one statement per page)
+    #   orm: one Measurements object per row (insert path before bulk)
+    module_count = sum(
+            len(station.modules)
+            for station in Dataset.generate(
+                    stations=parameters.stations,
+                    days=1.0,
+                    step=parameters.step,
+                    public_stations=0,
+                    seed=parameters.seed).stations)
+    dataset = Dataset.generate(
+            stations=parameters.stations,
+            days=(parameters.backfill_rows * parameters.step
+                  / (86400.0 * module_count)),
+            step=parameters.step,
+            public_stations=0,
+            seed=parameters.seed)
+    result: Dict[str, Any] = {
+            'stations': len(dataset.stations),
+            'modules': module_count}
+    with StubServer(dataset, seed=parameters.seed) as server:
+        for storage_name, storage in (
+                ('executemany', pyatmo.weather.SQLStorage()),
+                ('orm', _ORMStorage())):
+            metrics = pyatmo.InMemoryMetrics()
+            client = create_client(server, metrics, parameters)
+            logger = logging.getLogger('benchmark.database')
+            logger.setLevel(logging.CRITICAL)
+            with tempfile.TemporaryDirectory() as directory:
+                database = pyatmo.weather.Database(
+                        pathlib.Path(directory).joinpath('backfill.sqlite3'),
+                        client,
+                        storage=storage,
+                        logger=logger,
+                        metrics=metrics)
+                start_time = time.perf_counter()
+                database.register()
+                register_time = time.perf_counter() - start_time
+                start_time = time.perf_counter()
+                database.update(
+                        min_update_interval=None,
+                        max_workers=parameters.workers)
+                update_time = time.perf_counter() - start_time
+            client.close()
+            rows = sum(
+                    value
+                    for (name, _), value in metrics.snapshot().counters.items()
+                    if name == 'pyatmo_update_committed_rows_total')
+            result[storage_name] = {
+                    'rows': int(rows),
+                    'register_seconds': register_time,
+                    'update_seconds': update_time,
+                    'rows_per_second': rows / update_time}
+    result['speedup'] = (
+            result['executemany']['rows_per_second']
+            / result['orm']['rows_per_second'])
+    return result
+
+
+class _ORMStorage(pyatmo.weather.SQLStorage):
+    # reference: a Measurements object & session.add per row, flushed
+    # once per page
+    def insert(
+            self,
+            connection: sqlalchemy.engine.Connection,
+            module_id: str,
+            rows: List[Dict[str, Any]]) -> None:
+        session = sqlalchemy.orm.Session(bind=connection)
+        for row in rows:
+            session.add(pyatmo.weather.Measurements(**row))
+        session.flush()
+        # joins the transaction of the connection: committed by update
+        session.commit()
+        session.close()
+
+
+def startup_benchmark(
+        server: StubServer,
+        path: pathlib.Path,
+        parameters: Parameters) -> Dict[str, Any]:
+    # seconds per phase of a fresh interpreter on the populated database
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(
+            [str(pathlib.Path(pyatmo.__file__).parents[1])]
+            + ([environment['PYTHONPATH']]
+               if environment.get('PYTHONPATH')
+               else []))
+    phase_dict: Dict[str, List[float]] = {
+            'process': [],
+            'import': [],
+            'open': [],
+            'noop_update': []}
+    for _ in range(parameters.startups):
+        start_time = time.perf_counter()
+        output = subprocess.run(
+                [sys.executable, '-c', _STARTUP_SCRIPT, str(path), server.url],
+                env=environment,
+                stdout=subprocess.PIPE,
+                check=True).stdout
+        phase_dict['process'].append(time.perf_counter() - start_time)
+        for name, value in zip(
+                ('import', 'open', 'noop_update'),
+                json.loads(output)):
+            phase_dict[name].append(value)
+    return {name: summarize(value_list)
+            for name, value_list in phase_dict.items()}
+
+
+def summarize(value_list: List[float]) -> Dict[str, Optional[float]]:
+    # seconds: mean & nearest-rank percentiles
+    if not value_list:
+        return {'mean': None, 'p50': None, 'p95': None, 'max': None}
+    sorted_list = sorted(value_list)
+
+    def percentile(percent: float) -> float:
+        index = max(0, -(-len(sorted_list) * percent // 100) - 1)
+        return sorted_list[int(index)]
+
+    return {
+            'mean': sum(sorted_list) / len(sorted_list),
+            'p50': percentile(50),
+            'p95': percentile(95),
+            'max': sorted_list[-1]}
@@ -1,4 +1,37 @@
 # -*- coding: utf-8 -*-
 
-from ._client import Client
-from ._scope import Scope
+from typing import TYPE_CHECKING, Any, List
+from ._lazy import lazy_attribute
+if TYPE_CHECKING:
+    from ._async_client import AsyncClient
+    from ._cache import ResponseCache
+    from ._client import Client
+    from ._client_pool import ClientPool
+    from ._metrics import (
+            CallbackMetrics, InMemoryMetrics, Metrics, PrometheusMetrics)
+    from ._rate_limiter import RateLimiter
+    from ._scope import Scope
+
+
+# public name -> submodule, imported on first access (PEP 562):
+# import pyatmo does not load requests, yaml or asyncio
+_LAZY_ATTRIBUTES = {
+        'AsyncClient': '._async_client',
+        'ResponseCache': '._cache',
+        'Client': '._client',
+        'ClientPool': '._client_pool',
+        'CallbackMetrics': '._metrics',
+        'InMemoryMetrics': '._metrics',
+        'Metrics': '._metrics',
+        'PrometheusMetrics': '._metrics',
+        'RateLimiter': '._rate_limiter',
+        'Scope': '._scope'}
+__all__ = sorted(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name: str) -> Any:
+    return lazy_attribute(__name__, _LAZY_ATTRIBUTES, globals(), name)
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
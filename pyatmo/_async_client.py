@@ -0,0 +1,221 @@
+#  -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import pathlib
+from typing import Any, Dict, List, Optional
+from ._client import (
+        _MEASURE_PATH, _PUBLIC_DATA_PATH, _STATIONS_DATA_PATH,
+        has_measure_scope, has_stations_data_scope, log_response,
+        measure_params, public_data_params, stations_data_params)
+from ._cache import cache_key
+from ._metrics import Metrics
+from ._oauth import CredentialFilter, OAuth
+from ._rate_limiter import RateLimiter
+from ._request import BASE_URL, AsyncRequest, AsyncResponse, Request
+from ._scope import Scope
+from ._single_flight import AsyncSingleFlight, SingleFlightStats
+
+
+class AsyncClient:
+    def __init__(
+            self,
+            client_id: str,
+            client_secret: str,
+            scope_list: Optional[List[Scope]] = None,
+            token_file: Optional[pathlib.Path] = None,
+            request_interval: Optional[float] = 1.0,
+            request_burst: int = 1,
+            requests_per_10s: Optional[int] = None,
+            requests_per_hour: Optional[int] = None,
+            rate_limiter: Optional[RateLimiter] = None,
+            pool_size: int = 10,
+            timeout: Optional[float] = None,
+            max_retries: int = 3,
+            metrics: Optional[Metrics] = None,
+            base_url: str = BASE_URL,
+            token_refresh_margin: Optional[float] = 300.0,
+            logger: Optional[logging.Logger] = None) -> None:
+        # logger
+        self._logger = logger or logging.getLogger(__name__)
+        self._credential_filter = CredentialFilter()
+        for handler in self._logger.handlers:
+            handler.addFilter(self._credential_filter)
+        # metrics
+        self._metrics = metrics or Metrics()
+        # endpoints
+        base_url = base_url.rstrip('/')
+        self._stations_data_url = base_url + _STATIONS_DATA_PATH
+        self._measure_url = base_url + _MEASURE_PATH
+        self._public_data_url = base_url + _PUBLIC_DATA_PATH
+        # request
+        self._request = AsyncRequest(
+                rate_limiter=rate_limiter or RateLimiter.create(
+                        request_interval=request_interval,
+                        burst=request_burst,
+                        requests_per_10s=requests_per_10s,
+                        requests_per_hour=requests_per_hour),
+                pool_size=pool_size,
+                timeout=timeout,
+                max_retries=max_retries,
+                metrics=self._metrics)
+        # oauth: token requests are rare and run in the default executor
+        self._oauth = OAuth(
+                client_id,
+                client_secret,
+                scope_list=scope_list,
+                token_file=token_file,
+                request=Request(
+                        rate_limiter=self._request.rate_limiter,
+                        timeout=timeout,
+                        max_retries=max_retries,
+                        metrics=self._metrics),
+                credential_filter=self._credential_filter,
+                metrics=self._metrics,
+                base_url=base_url,
+                refresh_margin=token_refresh_margin,
+                logger=self._logger.getChild('oauth'))
+        self._token_lock: Optional[asyncio.Lock] = None
+        # identical concurrent requests share one response
+        self._single_flight = AsyncSingleFlight()
+
+    @property
+    def metrics(self) -> Metrics:
+        return self._metrics
+
+    @property
+    def single_flight_stats(self) -> SingleFlightStats:
+        return self._single_flight.stats
+
+    async def close(self) -> None:
+        self._oauth.close()
+        await self._request.close()
+        for handler in self._logger.handlers:
+            handler.removeFilter(self._credential_filter)
+
+    async def authorize(
+            self,
+            username: str,
+            password: str) -> None:
+        await asyncio.get_running_loop().run_in_executor(
+                None,
+                self._oauth.get_access_token,
+                username,
+                password)
+
+    async def get_stations_data(
+            self,
+            device_id: Optional[str] = None,
+            get_favorites: Optional[bool] = None) -> Optional[Dict[str, Any]]:
+        self._logger.info('get stations data')
+        if not has_stations_data_scope(self._oauth, self._logger):
+            return None
+        data = stations_data_params(
+                await self._access_token(),
+                device_id=device_id,
+                get_favorites=get_favorites)
+        self._logger.debug('data: %s', data)
+        response = await self._post(self._stations_data_url, data)
+        log_response(
+                self._logger,
+                'get stations data',
+                response.ok,
+                response.status_code,
+                response.content)
+        if response.ok:
+            return response.json()
+        return None
+
+    async def get_measure(
+            self,
+            device_id: str,
+            module_id: str,
+            scale: str,
+            type_list: List[str],
+            date_begin: Optional[int] = None,
+            date_end: Optional[int] = None,
+            limit: Optional[int] = None,
+            optimize: Optional[bool] = None,
+            real_time: Optional[bool] = None) -> Optional[Dict[str, Any]]:
+        self._logger.info('get measure')
+        if not has_measure_scope(self._oauth, self._logger):
+            return None
+        data = measure_params(
+                await self._access_token(),
+                device_id=device_id,
+                module_id=module_id,
+                scale=scale,
+                type_list=type_list,
+                date_begin=date_begin,
+                date_end=date_end,
+                limit=limit,
+                optimize=optimize,
+                real_time=real_time)
+        self._logger.debug('data: %s', data)
+        response = await self._post(self._measure_url, data)
+        log_response(
+                self._logger,
+                'get measure',
+                response.ok,
+                response.status_code,
+                response.content)
+        if response.ok:
+            return response.json()
+        return None
+
+    async def get_public_data(
+            self,
+            lat_le: float,
+            lon_ne: float,
+            lat_sw: float,
+            lon_sw: float,
+            required_data: Optional[str] = None,
+            filter: Optional[bool] = None) -> Optional[Dict[str, Any]]:
+        self._logger.info('get public data')
+        data = public_data_params(
+                await self._access_token(),
+                lat_le=lat_le,
+                lon_ne=lon_ne,
+                lat_sw=lat_sw,
+                lon_sw=lon_sw,
+                required_data=required_data,
+                filter=filter)
+        self._logger.debug('data: %s', data)
+        response = await self._post(self._public_data_url, data)
+        log_response(
+                self._logger,
+                'get public data',
+                response.ok,
+                response.status_code,
+                response.content)
+        if response.ok:
+            return response.json()
+        return None
+
+    async def _post(
+            self,
+            url: str,
+            data: Dict[str, Any]) -> AsyncResponse:
+        return await self._single_flight.do(
+                cache_key(url, data),
+                lambda: self._request.request(
+                        'post',
+                        url,
+                        data=form_data(data)))
+
+    async def _access_token(self) -> Optional[str]:
+        # the lock is created lazily to bind it to the running event loop
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        async with self._token_lock:
+            if self._oauth.is_expired:
+                await asyncio.get_running_loop().run_in_executor(
+                        None,
+                        self._oauth.refresh_token)
+        return self._oauth.access_token
+
+
+def form_data(data: Dict[str, Any]) -> Dict[str, str]:
+    # encode values in the same way as requests
+    return {key: str(value) for key, value in data.items()
+            if value is not None}
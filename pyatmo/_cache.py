@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+
+__all__ = ['ResponseCache']
+
+
+# Netatmo stations upload every 10 minutes
+DEFAULT_TTL = {
+        'getstationsdata': 600.0,
+        'getmeasure': 600.0,
+        'getpublicdata': 600.0}
+# the disk tier is pruned at most once per interval (seconds),
+# or after writing 1/16 of max_directory_bytes
+_PRUNE_INTERVAL = 3600.0
+
+
+# (expiration time or None, response text)
+_Entry = Tuple[Optional[float], str]
+
+
+class ResponseCache:
+    # LRU in memory bounded by the size of the response texts,
+    # optionally backed by a directory shared between processes:
+    #   {hash}.json: immutable, mtime is the last use
+    #   {hash}.ttl.json: expiring, mtime is the expiration time
+    # the access token is not a part of the key:
+    # share a cache only between clients of the same account
+    def __init__(
+            self,
+            ttl: Optional[Mapping[str, float]] = None,
+            max_bytes: int = 64 * 1024 * 1024,
+            directory: Optional[pathlib.Path] = None,
+            max_directory_bytes: int = 256 * 1024 * 1024) -> None:
+        # ttl: seconds per endpoint (getstationsdata, getmeasure, ...)
+        # max_directory_bytes: size of the files in directory
+        self._ttl = dict(DEFAULT_TTL)
+        if ttl is not None:
+            self._ttl.update(ttl)
+        self._max_bytes = max_bytes
+        self._directory = directory
+        if self._directory is not None:
+            self._directory.mkdir(parents=True, exist_ok=True)
+        self._entries: 'collections.OrderedDict[str, _Entry]' = (
+                collections.OrderedDict())
+        self._size = 0
+        self._lock = threading.Lock()
+        self._max_directory_bytes = max_directory_bytes
+        # bytes written & time since the last prune
+        self._written_bytes = 0
+        self._prune_time: Optional[float] = None
+
+    @property
+    def size(self) -> int:
+        # bytes in memory
+        return self._size
+
+    def get(
+            self,
+            url: str,
+            data: Mapping[str, Any]) -> Optional[str]:
+        key = cache_key(url, data)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] is None or now < entry[0]:
+                    self._entries.move_to_end(key)
+                    return entry[1]
+                self._pop(key)
+        if self._directory is None:
+            return None
+        entry = self._read_file(key)
+        if entry is None or (entry[0] is not None and entry[0] <= now):
+            return None
+        with self._lock:
+            self._put(key, entry)
+        return entry[1]
+
+    def set(
+            self,
+            url: str,
+            data: Mapping[str, Any],
+            text: str,
+            is_immutable: bool = False) -> None:
+        # immutable: cached without expiration
+        endpoint = url.rsplit('/', 1)[-1]
+        ttl = self._ttl.get(endpoint)
+        expiration_time: Optional[float] = None
+        if not is_immutable:
+            if not ttl:
+                return
+            expiration_time = time.time() + ttl
+        key = cache_key(url, data)
+        entry = (expiration_time, text)
+        with self._lock:
+            self._put(key, entry)
+        if self._directory is not None:
+            # the disk tier is best effort: a failed write is a miss later
+            try:
+                self._write_file(key, entry)
+            except OSError:
+                return
+            self._prune_if_needed(len(text))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+        if self._directory is not None:
+            for path in self._directory.glob('*.json'):
+                _unlink(path)
+
+    def prune(self) -> None:
+        # delete the expired files, then the least recently used files
+        # (expiring first) above max_directory_bytes
+        if self._directory is None:
+            return
+        now = time.time()
+        file_list: List[Tuple[float, int, pathlib.Path]] = []
+        for path in self._directory.iterdir():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if path.name.endswith('.tmp'):
+                # left by a killed process
+                if stat.st_mtime + _PRUNE_INTERVAL < now:
+                    _unlink(path)
+            elif path.name.endswith('.ttl.json'):
+                if stat.st_mtime <= now:
+                    _unlink(path)
+                else:
+                    file_list.append((0.0, stat.st_size, path))
+            elif path.name.endswith('.json'):
+                file_list.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in file_list)
+        for _, size, path in sorted(file_list):
+            if total_size <= self._max_directory_bytes:
+                break
+            _unlink(path)
+            total_size -= size
+
+    def _put(
+            self,
+            key: str,
+            entry: _Entry) -> None:
+        self._pop(key)
+        if len(entry[1]) > self._max_bytes:
+            return
+        self._entries[key] = entry
+        self._size += len(entry[1])
+        # evict least recently used
+        while self._size > self._max_bytes:
+            self._pop(next(iter(self._entries)))
+
+    def _pop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+    def _prune_if_needed(self, size: int) -> None:
+        now = time.time()
+        with self._lock:
+            self._written_bytes += size
+            if (self._prune_time is not None
+                    and now < self._prune_time + _PRUNE_INTERVAL
+                    and self._written_bytes
+                    < self._max_directory_bytes // 16):
+                return
+            self._written_bytes = 0
+            self._prune_time = now
+        self.prune()
+
+    def _path(self, key: str, is_immutable: bool) -> pathlib.Path:
+        assert self._directory is not None
+        return self._directory.joinpath('{0}{1}.json'.format(
+                hashlib.sha256(key.encode('utf-8')).hexdigest(),
+                '' if is_immutable else '.ttl'))
+
+    def _read_file(self, key: str) -> Optional[_Entry]:
+        for is_immutable in (True, False):
+            path = self._path(key, is_immutable)
+            try:
+                with path.open(encoding='utf-8') as cache_file:
+                    value = json.load(cache_file)
+            except (OSError, ValueError):
+                continue
+            if value.get('key') != key:
+                continue
+            if is_immutable:
+                # mtime: the last use
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+            return value['expiration_time'], value['text']
+        return None
+
+    def _write_file(
+            self,
+            key: str,
+            entry: _Entry) -> None:
+        # atomic replace: other processes never read a partial file
+        # unique temporary file per write: threads may write the same key
+        path = self._path(key, entry[0] is None)
+        file_descriptor, temporary_name = tempfile.mkstemp(
+                dir=str(path.parent),
+                prefix='{0}.'.format(path.name),
+                suffix='.tmp')
+        try:
+            with os.fdopen(
+                    file_descriptor,
+                    'w',
+                    encoding='utf-8') as cache_file:
+                json.dump(
+                        {'key': key,
+                         'expiration_time': entry[0],
+                         'text': entry[1]},
+                        cache_file)
+            if entry[0] is not None:
+                # mtime: the expiration time, pruned without reading
+                os.utime(temporary_name, (time.time(), entry[0]))
+            os.replace(temporary_name, str(path))
+        except BaseException:
+            _unlink(pathlib.Path(temporary_name))
+            raise
+        if entry[0] is None:
+            # a page which was expiring has become immutable
+            _unlink(self._path(key, False))
+
+
+def cache_key(url: str, data: Mapping[str, Any]) -> str:
+    # endpoint URL & parameters except the access token
+    params: Dict[str, str] = {
+            key: str(value)
+            for key, value in data.items()
+            if key != 'access_token' and value is not None}
+    return '{0}?{1}'.format(url, json.dumps(params, sort_keys=True))
+
+
+def _unlink(path: pathlib.Path) -> None:
+    # removed by another process meanwhile
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
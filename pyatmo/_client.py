@@ -1,11 +1,32 @@
 #  -*- coding: utf-8 -*-
 
+import concurrent.futures
+import json
 import logging
 import pathlib
-from typing import Any, Dict, List, Optional
+import time
+from typing import (
+        TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Set,
+        Tuple)
+from ._cache import ResponseCache, cache_key
+from ._metrics import Metrics, endpoint_name
 from ._oauth import CredentialFilter, OAuth
-from ._request import interval, request
+from ._public_data import BoundingBox, Tile
+from ._rate_limiter import RateLimiter
+from ._request import BASE_URL, Request
 from ._scope import Scope
+from ._single_flight import SingleFlight, SingleFlightStats
+if TYPE_CHECKING:
+    import requests
+
+
+_STATIONS_DATA_PATH = '/api/getstationsdata'
+_MEASURE_PATH = '/api/getmeasure'
+_PUBLIC_DATA_PATH = '/api/getpublicdata'
+# maximum number of measurements per getmeasure request
+_MEASURE_LIMIT = 1024
+# maximum number of bytes of a response body in logs
+_LOG_BODY_LIMIT = 1024
 
 
 class Client:
@@ -16,21 +37,78 @@ class Client:
             scope_list: Optional[List[Scope]] = None,
             token_file: Optional[pathlib.Path] = None,
             request_interval: Optional[float] = 1.0,
+            request_burst: int = 1,
+            requests_per_10s: Optional[int] = None,
+            requests_per_hour: Optional[int] = None,
+            rate_limiter: Optional[RateLimiter] = None,
+            pool_size: int = 10,
+            timeout: Optional[float] = None,
+            max_retries: int = 3,
+            session: Optional['requests.Session'] = None,
+            cache: Optional[ResponseCache] = None,
+            metrics: Optional[Metrics] = None,
+            base_url: str = BASE_URL,
+            token_refresh_margin: Optional[float] = 300.0,
             logger: Optional[logging.Logger] = None) -> None:
         # logger
         self._logger = logger or logging.getLogger(__name__)
+        self._credential_filter = CredentialFilter()
         for handler in self._logger.handlers:
-            handler.addFilter(CredentialFilter())
-        # request interval
-        interval(request_interval)
+            handler.addFilter(self._credential_filter)
+        # metrics
+        self._metrics = metrics or Metrics()
+        # endpoints
+        base_url = base_url.rstrip('/')
+        self._stations_data_url = base_url + _STATIONS_DATA_PATH
+        self._measure_url = base_url + _MEASURE_PATH
+        self._public_data_url = base_url + _PUBLIC_DATA_PATH
+        # request
+        self._request = Request(
+                rate_limiter=rate_limiter or RateLimiter.create(
+                        request_interval=request_interval,
+                        burst=request_burst,
+                        requests_per_10s=requests_per_10s,
+                        requests_per_hour=requests_per_hour),
+                session=session,
+                pool_size=pool_size,
+                timeout=timeout,
+                max_retries=max_retries,
+                metrics=self._metrics)
+        # response cache
+        self._cache = cache
+        # identical concurrent requests share one response
+        self._single_flight = SingleFlight()
         # oauth
         self._oauth = OAuth(
                 client_id,
                 client_secret,
                 scope_list=scope_list,
                 token_file=token_file,
+                request=self._request,
+                credential_filter=self._credential_filter,
+                metrics=self._metrics,
+                base_url=base_url,
+                refresh_margin=token_refresh_margin,
                 logger=self._logger.getChild('oauth'))
 
+    @property
+    def metrics(self) -> Metrics:
+        return self._metrics
+
+    @property
+    def single_flight_stats(self) -> SingleFlightStats:
+        return self._single_flight.stats
+
+    @property
+    def rate_limiter(self) -> Optional[RateLimiter]:
+        return self._request.rate_limiter
+
+    def close(self) -> None:
+        self._oauth.close()
+        self._request.close()
+        for handler in self._logger.handlers:
+            handler.removeFilter(self._credential_filter)
+
     def authorize(
             self,
             username: str,
@@ -42,33 +120,25 @@ class Client:
             device_id: Optional[str] = None,
             get_favorites: Optional[bool] = None) -> Optional[Dict[str, Any]]:
         self._logger.info('get stations data')
-        if not self._oauth.is_included(Scope.READ_STATION):
-            self._logger.error('get stations data: failure')
-            self._logger.error('dose not have good scope rights')
+        if not has_stations_data_scope(self._oauth, self._logger):
             return None
-        url = 'https://api.netatmo.com/api/getstationsdata'
-        data: Dict[str, Any] = {}
-        data['access_token'] = self._oauth.access_token
-        if device_id is not None:
-            data['device_id'] = device_id
-        if get_favorites is not None:
-            data['get_favorites'] = get_favorites
+        data = stations_data_params(
+                self._oauth.access_token,
+                device_id=device_id,
+                get_favorites=get_favorites)
         self._logger.debug('data: %s', data)
-        response = request('post', url, data=data)
-        self._logger.log(
-                logging.INFO if response.ok else logging.ERROR,
-                'get public data: %s',
-                'success' if response.ok else 'failure')
-        self._logger.log(
-                logging.DEBUG if response.ok else logging.ERROR,
-                'status_code: %s',
-                response.status_code)
-        self._logger.log(
-                logging.DEBUG if response.ok else logging.ERROR,
-                'text: %s',
-                response.text)
-        if response.ok:
-            return response.json()
+        cached = self._cached_response(self._stations_data_url, data)
+        if cached is not None:
+            return cached
+        response, text = self._post(self._stations_data_url, data)
+        log_response(
+                self._logger,
+                'get stations data',
+                response.ok,
+                response.status_code,
+                response.content)
+        if text is not None:
+            return json.loads(text)
         return None
 
     def get_measure(
@@ -83,46 +153,81 @@ class Client:
             optimize: Optional[bool] = None,
             real_time: Optional[bool] = None) -> Optional[Dict[str, Any]]:
         self._logger.info('get measure')
-        if (not self._oauth.is_included(Scope.READ_STATION)
-                and not self._oauth.is_included(Scope.READ_THERMOSTAT)):
-            self._logger.error('get measure: failure')
-            self._logger.error('dose not have good scope rights')
+        if not has_measure_scope(self._oauth, self._logger):
             return None
-        url = 'https://api.netatmo.com/api/getmeasure'
-        data: Dict[str, Any] = {}
-        data['access_token'] = self._oauth.access_token
-        data['device_id'] = device_id
-        data['module_id'] = module_id
-        data['scale'] = scale
-        data['type'] = ','.join(type_list)
-        if date_begin is not None:
-            data['date_begin'] = date_begin
-        if date_end is not None:
-            data['date_end'] = date_end
-        if limit is not None:
-            data['limit'] = limit
-        if optimize is not None:
-            data['optimize'] = optimize
-        if real_time is not None:
-            data['real_time'] = real_time
+        data = measure_params(
+                self._oauth.access_token,
+                device_id=device_id,
+                module_id=module_id,
+                scale=scale,
+                type_list=type_list,
+                date_begin=date_begin,
+                date_end=date_end,
+                limit=limit,
+                optimize=optimize,
+                real_time=real_time)
         self._logger.debug('data: %s', data)
-        response = request('post', url, data=data)
-        self._logger.log(
-                logging.INFO if response.ok else logging.ERROR,
-                'get public data: %s',
-                'success' if response.ok else 'failure')
-        self._logger.log(
-                logging.DEBUG if response.ok else logging.ERROR,
-                'status_code: %s',
-                response.status_code)
-        self._logger.log(
-                logging.DEBUG if response.ok else logging.ERROR,
-                'text: %s',
-                response.text)
-        if response.ok:
-            return response.json()
+        cached = self._cached_response(self._measure_url, data)
+        if cached is not None:
+            return cached
+        # measurements before date_end never change
+        response, text = self._post(
+                self._measure_url,
+                data,
+                is_immutable=is_past_measure(date_end))
+        log_response(
+                self._logger,
+                'get measure',
+                response.ok,
+                response.status_code,
+                response.content)
+        if text is not None:
+            return json.loads(text)
         return None
 
+    def iter_measure(
+            self,
+            device_id: str,
+            module_id: str,
+            scale: str,
+            type_list: List[str],
+            date_begin: Optional[int] = None,
+            date_end: Optional[int] = None,
+            batch_size: int = 1024,
+            real_time: Optional[bool] = None
+            ) -> Iterator[List[Tuple[int, List[Optional[float]]]]]:
+        self._logger.info('iter measure')
+        batch: List[Tuple[int, List[Optional[float]]]] = []
+        while date_end is None or date_begin is None or date_begin <= date_end:
+            response = self.get_measure(
+                    device_id=device_id,
+                    module_id=module_id,
+                    scale=scale,
+                    type_list=type_list,
+                    date_begin=date_begin,
+                    date_end=date_end,
+                    limit=_MEASURE_LIMIT,
+                    optimize=True,
+                    real_time=real_time)
+            if response is None:
+                self._logger.error('iter measure: failure')
+                break
+            if not response['body']:
+                break
+            latest: Optional[int] = None
+            for timestamp, value in expand_measure(response['body']):
+                batch.append((timestamp, value))
+                latest = timestamp
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if latest is None:
+                break
+            # next page
+            date_begin = latest + 1
+        if batch:
+            yield batch
+
     def get_public_data(
             self,
             lat_le: float,
@@ -132,31 +237,276 @@ class Client:
             required_data: Optional[str] = None,
             filter: Optional[bool] = None) -> Optional[Dict[str, Any]]:
         self._logger.info('get public data')
-        url = 'https://api.netatmo.com/api/getpublicdata'
-        data: Dict[str, Any] = {}
-        data['access_token'] = self._oauth.access_token
-        data['lat_ne'] = lat_le
-        data['lon_ne'] = lon_ne
-        data['lat_sw'] = lat_sw
-        data['lon_sw'] = lon_sw
-        if required_data is not None:
-            data['required_data'] = required_data
-        if filter is not None:
-            data['filter'] = filter
+        data = public_data_params(
+                self._oauth.access_token,
+                lat_le=lat_le,
+                lon_ne=lon_ne,
+                lat_sw=lat_sw,
+                lon_sw=lon_sw,
+                required_data=required_data,
+                filter=filter)
         self._logger.debug('data: %s', data)
-        response = request('post', url, data=data)
-        self._logger.log(
-                logging.INFO if response.ok else logging.ERROR,
-                'get public data: %s',
-                'success' if response.ok else 'failure')
-        self._logger.log(
-                logging.DEBUG if response.ok else logging.ERROR,
-                'status_code: %s',
-                response.status_code)
-        self._logger.log(
-                logging.DEBUG if response.ok else logging.ERROR,
-                'text: %s',
-                response.text)
-        if response.ok:
-            return response.json()
+        cached = self._cached_response(self._public_data_url, data)
+        if cached is not None:
+            return cached
+        response, text = self._post(self._public_data_url, data)
+        log_response(
+                self._logger,
+                'get public data',
+                response.ok,
+                response.status_code,
+                response.content)
+        if text is not None:
+            return json.loads(text)
         return None
+
+    def iter_public_data(
+            self,
+            lat_ne: float,
+            lon_ne: float,
+            lat_sw: float,
+            lon_sw: float,
+            required_data: Optional[str] = None,
+            filter: Optional[bool] = None,
+            tile_limit: int = 500,
+            max_depth: int = 6,
+            max_workers: int = 4) -> Iterator[Dict[str, Any]]:
+        self._logger.info('iter public data')
+        return iter_public_data(
+                self.get_public_data,
+                self._logger,
+                lat_ne,
+                lon_ne,
+                lat_sw,
+                lon_sw,
+                required_data=required_data,
+                filter=filter,
+                tile_limit=tile_limit,
+                max_depth=max_depth,
+                max_workers=max_workers)
+
+    def _post(
+            self,
+            url: str,
+            data: Dict[str, Any],
+            is_immutable: bool = False
+            ) -> Tuple['requests.Response', Optional[str]]:
+        # (response, body if successful)
+        # the leader decodes & caches the body once for coalesced callers
+        # (requests decodes it on every .text)
+        def post() -> Tuple['requests.Response', Optional[str]]:
+            response = self._request.request('post', url, data=data)
+            if not response.ok:
+                return response, None
+            text = response.content.decode('utf-8')
+            if self._cache is not None:
+                self._cache.set(url, data, text, is_immutable=is_immutable)
+            return response, text
+
+        return self._single_flight.do(cache_key(url, data), post)
+
+    def _cached_response(
+            self,
+            url: str,
+            data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if self._cache is None:
+            return None
+        text = self._cache.get(url, data)
+        self._metrics.increment(
+                'pyatmo_cache_requests_total',
+                endpoint=endpoint_name(url),
+                result='miss' if text is None else 'hit')
+        if text is None:
+            return None
+        self._logger.debug('cache hit: %s', url)
+        return json.loads(text)
+
+
+def has_stations_data_scope(
+        oauth: OAuth,
+        logger: logging.Logger) -> bool:
+    if not oauth.is_included(Scope.READ_STATION):
+        logger.error('get stations data: failure')
+        logger.error('dose not have good scope rights')
+        return False
+    return True
+
+
+def has_measure_scope(
+        oauth: OAuth,
+        logger: logging.Logger) -> bool:
+    if (not oauth.is_included(Scope.READ_STATION)
+            and not oauth.is_included(Scope.READ_THERMOSTAT)):
+        logger.error('get measure: failure')
+        logger.error('dose not have good scope rights')
+        return False
+    return True
+
+
+def stations_data_params(
+        access_token: Optional[str],
+        device_id: Optional[str] = None,
+        get_favorites: Optional[bool] = None) -> Dict[str, Any]:
+    data: Dict[str, Any] = {}
+    data['access_token'] = access_token
+    if device_id is not None:
+        data['device_id'] = device_id
+    if get_favorites is not None:
+        data['get_favorites'] = get_favorites
+    return data
+
+
+def measure_params(
+        access_token: Optional[str],
+        device_id: str,
+        module_id: str,
+        scale: str,
+        type_list: List[str],
+        date_begin: Optional[int] = None,
+        date_end: Optional[int] = None,
+        limit: Optional[int] = None,
+        optimize: Optional[bool] = None,
+        real_time: Optional[bool] = None) -> Dict[str, Any]:
+    data: Dict[str, Any] = {}
+    data['access_token'] = access_token
+    data['device_id'] = device_id
+    data['module_id'] = module_id
+    data['scale'] = scale
+    data['type'] = ','.join(type_list)
+    if date_begin is not None:
+        data['date_begin'] = date_begin
+    if date_end is not None:
+        data['date_end'] = date_end
+    if limit is not None:
+        data['limit'] = limit
+    if optimize is not None:
+        data['optimize'] = optimize
+    if real_time is not None:
+        data['real_time'] = real_time
+    return data
+
+
+def public_data_params(
+        access_token: Optional[str],
+        lat_le: float,
+        lon_ne: float,
+        lat_sw: float,
+        lon_sw: float,
+        required_data: Optional[str] = None,
+        filter: Optional[bool] = None) -> Dict[str, Any]:
+    data: Dict[str, Any] = {}
+    data['access_token'] = access_token
+    data['lat_ne'] = lat_le
+    data['lon_ne'] = lon_ne
+    data['lat_sw'] = lat_sw
+    data['lon_sw'] = lon_sw
+    if required_data is not None:
+        data['required_data'] = required_data
+    if filter is not None:
+        data['filter'] = filter
+    return data
+
+
+def expand_measure(
+        body: List[Dict[str, Any]]
+        ) -> Iterator[Tuple[int, List[Optional[float]]]]:
+    # optimize=True: [{'beg_time': ..., 'step_time': ..., 'value': [...]}]
+    for value_set in body:
+        begin_time: int = value_set['beg_time']
+        step_time: int = value_set.get('step_time', 0)
+        for i, value in enumerate(value_set['value']):
+            yield begin_time + i * step_time, value
+
+
+def iter_public_data(
+        get_public_data: Callable[..., Optional[Dict[str, Any]]],
+        logger: logging.Logger,
+        lat_ne: float,
+        lon_ne: float,
+        lat_sw: float,
+        lon_sw: float,
+        required_data: Optional[str] = None,
+        filter: Optional[bool] = None,
+        tile_limit: int = 500,
+        max_depth: int = 6,
+        max_workers: int = 4) -> Iterator[Dict[str, Any]]:
+    # a tile returning tile_limit stations or more is thinned out,
+    # so it is split into 4 sub-tiles up to max_depth
+    executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='pyatmo_public_data')
+    pending: Dict['concurrent.futures.Future[Optional[Dict[str, Any]]]',
+                  Tile] = {}
+
+    def submit(tile: Tile) -> None:
+        logger.debug('tile(depth=%d): %s', tile.depth, tile.box)
+        future = executor.submit(
+                get_public_data,
+                tile.box.lat_ne,
+                tile.box.lon_ne,
+                tile.box.lat_sw,
+                tile.box.lon_sw,
+                required_data=required_data,
+                filter=filter)
+        pending[future] = tile
+
+    station_id_set: Set[str] = set()
+    try:
+        submit(Tile(BoundingBox(lat_ne, lon_ne, lat_sw, lon_sw), 0))
+        while pending:
+            done, _ = concurrent.futures.wait(
+                    pending,
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                tile = pending.pop(future)
+                response = future.result()
+                if response is None:
+                    logger.error('tile is skipped: %s', tile.box)
+                    continue
+                station_list = response['body']
+                if (len(station_list) >= tile_limit
+                        and tile.depth < max_depth):
+                    for child in tile.split():
+                        submit(child)
+                for station in station_list:
+                    if station['_id'] not in station_id_set:
+                        station_id_set.add(station['_id'])
+                        yield station
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def is_past_measure(date_end: Optional[int]) -> bool:
+    # uploads are delayed up to the refresh interval (10 minutes)
+    return date_end is not None and date_end < time.time() - 600
+
+
+def log_response(
+        logger: logging.Logger,
+        name: str,
+        ok: bool,
+        status_code: int,
+        content: bytes) -> None:
+    logger.log(
+            logging.INFO if ok else logging.ERROR,
+            '%s: %s',
+            name,
+            'success' if ok else 'failure')
+    # the body is decoded only if it is logged
+    level = logging.DEBUG if ok else logging.ERROR
+    if logger.isEnabledFor(level):
+        logger.log(level, 'status_code: %s', status_code)
+        logger.log(level, 'text: %s', summarize_body(content))
+
+
+def summarize_body(
+        content: bytes,
+        limit: int = _LOG_BODY_LIMIT) -> str:
+    # large bodies are truncated to limit bytes
+    if len(content) <= limit:
+        return content.decode('utf-8', errors='replace')
+    return '{0}... ({1} bytes)'.format(
+            content[:limit].decode('utf-8', errors='ignore'),
+            len(content))
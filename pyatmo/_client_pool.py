@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from typing import (
+        Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple,
+        TypeVar)
+from ._client import Client, iter_public_data
+
+
+__all__ = ['ClientPool']
+
+
+_T = TypeVar('_T')
+# seconds before a device which was not found is looked up again
+_NOT_FOUND_TTL = 600.0
+
+
+class ClientPool:
+    # Client per account (credentials, rate limit, token file):
+    #   get_stations_data: all the accounts, merged
+    #   get_measure: the account owning the device
+    #   get_public_data: the least loaded account
+    def __init__(
+            self,
+            client_list: Sequence[Client],
+            logger: Optional[logging.Logger] = None) -> None:
+        if not client_list:
+            raise ValueError('client_list is empty')
+        # logger
+        self._logger = logger or logging.getLogger(__name__)
+        self._client_list = list(client_list)
+        self._lock = threading.Lock()
+        # device id -> client index
+        self._owner_dict: Dict[str, int] = {}
+        # unknown devices are looked up one at a time
+        self._lookup_lock = threading.Lock()
+        # device id -> time of the lookup which did not find it
+        self._not_found_dict: Dict[str, float] = {}
+        # calls in progress per client
+        self._running_list = [0] * len(self._client_list)
+
+    @property
+    def clients(self) -> List[Client]:
+        return list(self._client_list)
+
+    def close(self) -> None:
+        for client in self._client_list:
+            client.close()
+
+    def owner(self, device_id: str) -> Optional[Client]:
+        # None: not found in the stations data of any account
+        index = self._owner_index(device_id)
+        return self._client_list[index] if index is not None else None
+
+    def get_stations_data(
+            self,
+            device_id: Optional[str] = None,
+            get_favorites: Optional[bool] = None) -> Optional[Dict[str, Any]]:
+        if device_id is not None:
+            index = self._owner_index(device_id)
+            if index is None:
+                self._logger.error('device is not found: %s', device_id)
+                return None
+            return self._call(
+                    index,
+                    lambda client: client.get_stations_data(
+                            device_id=device_id,
+                            get_favorites=get_favorites))
+        # devices of every account, the first account wins on duplicates
+        response_list: List[Dict[str, Any]] = []
+        for index in range(len(self._client_list)):
+            response = self._call(
+                    index,
+                    lambda client: client.get_stations_data(
+                            get_favorites=get_favorites))
+            if response is None:
+                # a partial list would look like removed devices
+                self._logger.error('get stations data: client %d', index)
+                return None
+            response_list.append(response)
+        device_list: List[Dict[str, Any]] = []
+        device_id_set = set()
+        with self._lock:
+            for index, response in enumerate(response_list):
+                for device in response['body']['devices']:
+                    # a favorite (read only) yields to its owner
+                    if (not device.get('read_only')
+                            or device['_id'] not in self._owner_dict):
+                        self._owner_dict[device['_id']] = index
+                    if device['_id'] not in device_id_set:
+                        device_id_set.add(device['_id'])
+                        device_list.append(device)
+        result = dict(response_list[0])
+        result['body'] = dict(result['body'], devices=device_list)
+        return result
+
+    def get_measure(
+            self,
+            device_id: str,
+            module_id: str,
+            scale: str,
+            type_list: List[str],
+            date_begin: Optional[int] = None,
+            date_end: Optional[int] = None,
+            limit: Optional[int] = None,
+            optimize: Optional[bool] = None,
+            real_time: Optional[bool] = None) -> Optional[Dict[str, Any]]:
+        index = self._owner_index(device_id)
+        if index is None:
+            self._logger.error('device is not found: %s', device_id)
+            return None
+        return self._call(
+                index,
+                lambda client: client.get_measure(
+                        device_id=device_id,
+                        module_id=module_id,
+                        scale=scale,
+                        type_list=type_list,
+                        date_begin=date_begin,
+                        date_end=date_end,
+                        limit=limit,
+                        optimize=optimize,
+                        real_time=real_time))
+
+    def iter_measure(
+            self,
+            device_id: str,
+            module_id: str,
+            scale: str,
+            type_list: List[str],
+            date_begin: Optional[int] = None,
+            date_end: Optional[int] = None,
+            batch_size: int = 1024,
+            real_time: Optional[bool] = None
+            ) -> Iterator[List[Tuple[int, List[Optional[float]]]]]:
+        client = self.owner(device_id)
+        if client is None:
+            self._logger.error('device is not found: %s', device_id)
+            return iter([])
+        return client.iter_measure(
+                device_id=device_id,
+                module_id=module_id,
+                scale=scale,
+                type_list=type_list,
+                date_begin=date_begin,
+                date_end=date_end,
+                batch_size=batch_size,
+                real_time=real_time)
+
+    def get_public_data(
+            self,
+            lat_le: float,
+            lon_ne: float,
+            lat_sw: float,
+            lon_sw: float,
+            required_data: Optional[str] = None,
+            filter: Optional[bool] = None) -> Optional[Dict[str, Any]]:
+        return self._call(
+                None,
+                lambda client: client.get_public_data(
+                        lat_le,
+                        lon_ne,
+                        lat_sw,
+                        lon_sw,
+                        required_data=required_data,
+                        filter=filter))
+
+    def iter_public_data(
+            self,
+            lat_ne: float,
+            lon_ne: float,
+            lat_sw: float,
+            lon_sw: float,
+            required_data: Optional[str] = None,
+            filter: Optional[bool] = None,
+            tile_limit: int = 500,
+            max_depth: int = 6,
+            max_workers: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        # max_workers: 4 per account by default
+        self._logger.info('iter public data')
+        return iter_public_data(
+                self.get_public_data,
+                self._logger,
+                lat_ne,
+                lon_ne,
+                lat_sw,
+                lon_sw,
+                required_data=required_data,
+                filter=filter,
+                tile_limit=tile_limit,
+                max_depth=max_depth,
+                max_workers=(
+                        max_workers
+                        if max_workers is not None
+                        else 4 * len(self._client_list)))
+
+    def _owner_index(self, device_id: str) -> Optional[int]:
+        index = self._cached_owner_index(device_id)
+        if index is not None or self._is_not_found(device_id):
+            return index
+        with self._lookup_lock:
+            # found by a lookup which was running
+            index = self._cached_owner_index(device_id)
+            if index is not None or self._is_not_found(device_id):
+                return index
+            # the stations data & favorites of every account
+            self._logger.info('find the owner: %s', device_id)
+            if self.get_stations_data(get_favorites=True) is None:
+                return None
+            index = self._cached_owner_index(device_id)
+            if index is None:
+                with self._lock:
+                    self._not_found_dict[device_id] = time.monotonic()
+        return index
+
+    def _cached_owner_index(self, device_id: str) -> Optional[int]:
+        with self._lock:
+            return self._owner_dict.get(device_id)
+
+    def _is_not_found(self, device_id: str) -> bool:
+        with self._lock:
+            lookup_time = self._not_found_dict.get(device_id)
+            if lookup_time is None:
+                return False
+            if time.monotonic() < lookup_time + _NOT_FOUND_TTL:
+                return True
+            del self._not_found_dict[device_id]
+            return False
+
+    def _call(
+            self,
+            index: Optional[int],
+            function: Callable[[Client], _T]) -> _T:
+        # index None: the least loaded client, chosen & counted at once
+        with self._lock:
+            if index is None:
+                index = min(
+                        range(len(self._client_list)),
+                        key=lambda i: (
+                                _delay(self._client_list[i]),
+                                self._running_list[i]))
+            self._running_list[index] += 1
+        try:
+            return function(self._client_list[index])
+        finally:
+            with self._lock:
+                self._running_list[index] -= 1
+
+
+def _delay(client: Client) -> float:
+    rate_limiter = client.rate_limiter
+    return rate_limiter.delay() if rate_limiter is not None else 0.0
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+
+import importlib
+from typing import Any, Dict
+
+
+def lazy_attribute(
+        package: str,
+        attribute_dict: Dict[str, str],
+        namespace: Dict[str, Any],
+        name: str) -> Any:
+    # module __getattr__ (PEP 562): import the submodule on first access
+    module_name = attribute_dict.get(name)
+    if module_name is None:
+        raise AttributeError('module {0!r} has no attribute {1!r}'.format(
+                package,
+                name))
+    value = getattr(importlib.import_module(module_name, package), name)
+    # cached in the package: __getattr__ is not called again
+    namespace[name] = value
+    return value
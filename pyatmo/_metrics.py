@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import math
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+
+__all__ = [
+        'CallbackMetrics', 'Histogram', 'InMemoryMetrics', 'Metrics',
+        'MetricsSnapshot', 'PrometheusMetrics']
+
+
+# seconds: Prometheus client defaults
+DEFAULT_BUCKETS = (
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# ((label name, label value), ...) sorted by name
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Metrics:
+    # null sink: instrumentation is disabled
+    # metric names:
+    #   pyatmo_requests_total{endpoint, status}
+    #   pyatmo_request_seconds{endpoint}
+    #   pyatmo_response_bytes_total{endpoint}
+    #   pyatmo_request_retries_total{endpoint}
+    #   pyatmo_rate_limiter_wait_seconds
+    #   pyatmo_rate_limiter_throttle_total
+    #   pyatmo_cache_requests_total{endpoint, result}
+    #   pyatmo_token_refresh_total{result}
+    #   pyatmo_token_refresh_seconds
+    #   pyatmo_update_seconds
+    #   pyatmo_update_rows_total{module_id}
+    #   pyatmo_update_committed_rows_total{module_id}
+    enabled = False
+
+    def increment(
+            self,
+            name: str,
+            value: float = 1.0,
+            **labels: str) -> None:
+        pass
+
+    def observe(
+            self,
+            name: str,
+            value: float,
+            **labels: str) -> None:
+        pass
+
+
+class Histogram(NamedTuple):
+    # upper bounds (+Inf excluded), cumulative counts per upper bound
+    buckets: Tuple[float, ...]
+    counts: Tuple[int, ...]
+    # sum & number of the observed values
+    total: float
+    samples: int
+
+
+class MetricsSnapshot(NamedTuple):
+    counters: Dict[Tuple[str, Labels], float]
+    histograms: Dict[Tuple[str, Labels], Histogram]
+
+    def counter(self, name: str, **labels: str) -> float:
+        return self.counters.get((name, to_labels(labels)), 0.0)
+
+    def histogram(self, name: str, **labels: str) -> Optional[Histogram]:
+        return self.histograms.get((name, to_labels(labels)))
+
+
+class InMemoryMetrics(Metrics):
+    # in-process aggregation: see snapshot()
+    enabled = True
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self._buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        # counts per bucket (+Inf last) & sum
+        self._bucket_counts: Dict[Tuple[str, Labels], List[int]] = {}
+        self._sums: Dict[Tuple[str, Labels], float] = {}
+
+    def increment(
+            self,
+            name: str,
+            value: float = 1.0,
+            **labels: str) -> None:
+        key = (name, to_labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(
+            self,
+            name: str,
+            value: float,
+            **labels: str) -> None:
+        key = (name, to_labels(labels))
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            counts = self._bucket_counts.get(key)
+            if counts is None:
+                counts = [0] * (len(self._buckets) + 1)
+                self._bucket_counts[key] = counts
+            counts[index] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def snapshot(self) -> MetricsSnapshot:
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {
+                    key: _cumulative(self._buckets, counts, self._sums[key])
+                    for key, counts in self._bucket_counts.items()}
+        return MetricsSnapshot(counters, histograms)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._bucket_counts.clear()
+            self._sums.clear()
+
+
+class PrometheusMetrics(InMemoryMetrics):
+    def text(self) -> str:
+        # Prometheus text exposition format (version 0.0.4)
+        snapshot = self.snapshot()
+        line_list: List[str] = []
+        type_set = set()
+        for (name, labels), value in sorted(snapshot.counters.items()):
+            if name not in type_set:
+                type_set.add(name)
+                line_list.append('# TYPE {0} counter'.format(name))
+            line_list.append('{0}{1} {2}'.format(
+                    name,
+                    _format_labels(labels),
+                    _format_value(value)))
+        for (name, labels), histogram in sorted(
+                snapshot.histograms.items()):
+            if name not in type_set:
+                type_set.add(name)
+                line_list.append('# TYPE {0} histogram'.format(name))
+            for bound, count in zip(
+                    histogram.buckets + (math.inf,),
+                    histogram.counts + (histogram.samples,)):
+                line_list.append('{0}_bucket{1} {2}'.format(
+                        name,
+                        _format_labels(
+                                labels + (('le', _format_value(bound)),)),
+                        count))
+            line_list.append('{0}_sum{1} {2}'.format(
+                    name,
+                    _format_labels(labels),
+                    _format_value(histogram.total)))
+            line_list.append('{0}_count{1} {2}'.format(
+                    name,
+                    _format_labels(labels),
+                    histogram.samples))
+        return ''.join('{0}\n'.format(line) for line in line_list)
+
+
+class CallbackMetrics(Metrics):
+    # callback(kind ('counter' or 'histogram'), name, value, labels)
+    enabled = True
+
+    def __init__(
+            self,
+            callback: Callable[[str, str, float, Dict[str, str]], None]
+            ) -> None:
+        self._callback = callback
+
+    def increment(
+            self,
+            name: str,
+            value: float = 1.0,
+            **labels: str) -> None:
+        self._callback('counter', name, value, labels)
+
+    def observe(
+            self,
+            name: str,
+            value: float,
+            **labels: str) -> None:
+        self._callback('histogram', name, value, labels)
+
+
+def to_labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+
+def endpoint_name(url: str) -> str:
+    # https://api.netatmo.com/api/getmeasure -> getmeasure
+    return url.rsplit('/', 1)[-1]
+
+
+def _cumulative(
+        buckets: Tuple[float, ...],
+        counts: List[int],
+        total: float) -> Histogram:
+    cumulative_list: List[int] = []
+    count = 0
+    for bucket_count in counts[:-1]:
+        count += bucket_count
+        cumulative_list.append(count)
+    return Histogram(
+            buckets=buckets,
+            counts=tuple(cumulative_list),
+            total=total,
+            samples=count + counts[-1])
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    return '{{{0}}}'.format(','.join(
+            '{0}="{1}"'.format(
+                    key,
+                    value.replace('\\', '\\\\')
+                    .replace('"', '\\"')
+                    .replace('\n', '\\n'))
+            for key, value in labels))
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
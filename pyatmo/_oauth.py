@@ -3,16 +3,23 @@
 import datetime
 import logging
 import pathlib
-from typing import Any, Dict, List, NamedTuple, Optional, Tuple
-import yaml
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from ._metrics import Metrics
 from ._scope import Scope
-from ._request import request
+from ._request import BASE_URL, Request
+from ._token_store import TokenStore
 
 
 __all__ = ['CredentialFilter', 'OAuth']
 
 
-_TOKEN_URL = 'https://api.netatmo.com/oauth2/token'
+_TOKEN_PATH = '/oauth2/token'
+# seconds between background refresh attempts after a failure
+_REFRESH_RETRY_INTERVAL = 60.0
+# seconds to wait for a background refresh in progress on close
+_CLOSE_TIMEOUT = 10.0
 
 
 class OAuth:
@@ -22,15 +29,29 @@ class OAuth:
             client_secret: str,
             scope_list: Optional[List[Scope]] = None,
             token_file: Optional[pathlib.Path] = None,
+            request: Optional[Request] = None,
+            credential_filter: Optional['CredentialFilter'] = None,
+            metrics: Optional[Metrics] = None,
+            base_url: str = BASE_URL,
+            refresh_margin: Optional[float] = 300.0,
             logger: Optional[logging.Logger] = None) -> None:
+        # refresh_margin: seconds before the expiration at which
+        #   a background thread refreshes the token (None: on expiry only)
         # register to filter
-        CredentialFilter.register_credential(client_id, 'CLIENT_ID')
-        CredentialFilter.register_credential(client_secret, 'CLIENT_SECRET')
+        self._credential_filter = credential_filter or CredentialFilter()
+        self._credential_filter.register_credential(client_id, 'CLIENT_ID')
+        self._credential_filter.register_credential(
+                client_secret,
+                'CLIENT_SECRET')
         # logger
         self._logger = logger or logging.getLogger(__name__)
         # client
         self._client_id = client_id
         self._client_secret = client_secret
+        # request
+        self._request = request or Request()
+        self._token_url = base_url.rstrip('/') + _TOKEN_PATH
+        self._metrics = metrics or Metrics()
         # token
         self._access_token: Optional[str] = None
         self._refresh_token: Optional[str] = None
@@ -43,18 +64,36 @@ class OAuth:
         if scope_list is not None and scope_list:
             self._scope_list = tuple(sorted(scope_list, key=lambda x: x.value))
         assert self._scope_list is None or self._scope_list
+        # refresh: one at a time, ahead of the expiration
+        self._refresh_lock = threading.Lock()
+        self._refresh_margin = refresh_margin
+        self._refresher: Optional[threading.Thread] = None
+        self._refresher_event = threading.Event()
+        self._is_closed = False
         # token file
         self._token_file = token_file
-        if self._token_file is not None and self._token_file.exists():
-            self.load_token(self._token_file)
+        self._token_store: Optional[TokenStore] = None
+        if self._token_file is not None:
+            self._token_store = TokenStore(self._token_file)
+            if self._token_store.exists():
+                self.load_token(self._token_file)
+
+    def close(self) -> None:
+        # stop the background refresh
+        self._is_closed = True
+        self._refresher_event.set()
+        refresher = self._refresher
+        if (refresher is not None
+                and refresher is not threading.current_thread()):
+            refresher.join(_CLOSE_TIMEOUT)
 
     def get_access_token(
             self,
             username: str,
             password: str) -> None:
         # register to filter
-        CredentialFilter.register_credential(username, 'USERNAME')
-        CredentialFilter.register_credential(password, 'PASSWORD')
+        self._credential_filter.register_credential(username, 'USERNAME')
+        self._credential_filter.register_credential(password, 'PASSWORD')
         # request
         self._logger.info('get access token')
         data = {'grant_type': 'password',
@@ -65,42 +104,43 @@ class OAuth:
         if self._scope_list is not None:
             data['scope'] = ' '.join(map(str, self._scope_list))
         self._logger.debug('data: %s', data)
-        response = request('post', _TOKEN_URL, data=data)
+        response = self._request.request(
+                'post',
+                self._token_url,
+                retry=False,
+                data=data)
         if response.ok:
             self._logger.info('get access token: success')
-            self._update_token(response.json())
+            with self._refresh_lock:
+                self._update_token(response.json())
             self._logger.debug('status_code: %s', response.status_code)
             self._logger.debug('text: %s', response.text)
             # save
-            if self._token_file is not None:
-                self.save_token(self._token_file)
+            if self._token_store is not None:
+                with self._token_store.lock():
+                    self._token_store.write(self._token_data())
         else:
             self._logger.error('get access token: failure')
             self._logger.error('status_code: %s', response.status_code)
             self._logger.error('text: %s', response.text)
 
     def refresh_token(self) -> None:
-        self._logger.info('refresh token')
-        if self._refresh_token is None:
-            self._logger.error('refresh token: refresh token is None')
-            return
-        data = {'grant_type': 'refresh_token',
-                'client_id': self._client_id,
-                'client_secret': self._client_secret,
-                'refresh_token': self._refresh_token}
-        response = request('post', _TOKEN_URL, data=data)
-        if response.ok:
-            self._logger.info('refresh token: success')
-            self._update_token(response.json())
-            self._logger.debug('status_code: %s', response.status_code)
-            self._logger.debug('text: %s', response.text)
-            # save
-            if self._token_file is not None:
-                self.save_token(self._token_file)
-        else:
-            self._logger.error('refresh token: failure')
-            self._logger.error('status_code: %s', response.status_code)
-            self._logger.error('text: %s', response.text)
+        # single flight: callers queued behind a refresh reuse its token
+        access_token = self._access_token
+        with self._refresh_lock:
+            if self._access_token != access_token:
+                self._logger.info('refresh token: already refreshed')
+                return
+            if self._token_store is None:
+                self._request_refresh()
+                return
+            # processes sharing the token file refresh one at a time
+            with self._token_store.lock():
+                if self._reload_token():
+                    return
+                # closed: the owner may have removed the token file
+                if self._request_refresh() and not self._is_closed:
+                    self._token_store.write(self._token_data())
 
     def save_token(self, path: pathlib.Path) -> None:
         self._logger.info('save token: %s', path)
@@ -108,58 +148,17 @@ class OAuth:
                 and self._refresh_token is not None
                 and self._token_created_time is not None
                 and self._token_expiration_time is not None):
-            with path.open(mode='w') as outfile:
-                data: Dict[str, Any] = {}
-                # token
-                data['access_token'] = self._access_token
-                data['refresh_token'] = self._refresh_token
-                # time
-                data['created_time'] = {
-                        'timestamp': self._token_created_time.timestamp(),
-                        'date': str(self._token_created_time)}
-                data['expiration_time'] = {
-                        'timestamp': self._token_expiration_time.timestamp(),
-                        'date': str(self._token_expiration_time)}
-                # scope
-                if self._scope_list is not None:
-                    data['scope_list'] = list(map(str, self._scope_list))
-                yaml.dump(data, outfile, default_flow_style=False)
+            TokenStore(path).write(self._token_data())
         else:
             self._logger.error('token is None')
 
     def load_token(self, path: pathlib.Path) -> None:
         self._logger.info('load token: %s', path)
-        with path.open() as token_file:
-            data = yaml.load(
-                token_file,
-                Loader=yaml.SafeLoader)
-            # scope match
-            scope_list: Optional[Tuple[Scope, ...]] = (
-                    tuple(sorted(
-                            (scope for scope in Scope
-                             if str(scope) in data['scope_list']),
-                            key=lambda x: x.value))
-                    if 'scope_list' in data
-                    else None)
-            if scope_list != self._scope_list:
-                self._logger.error(
-                        'scope mismatch: \'%s\' (self) &  \'%s\' (file)',
-                        ', '.join(map(str, self._scope_list))
-                        if self._scope_list is not None
-                        else self._scope_list,
-                        ', '.join(map(str, scope_list))
-                        if scope_list is not None
-                        else scope_list)
-            assert scope_list == self._scope_list
-            # token
-            self._set_token(data['access_token'], data['refresh_token'])
-            # time
-            self._token_created_time = datetime.datetime.fromtimestamp(
-                    int(data['created_time']['timestamp']),
-                    self._timezone)
-            self._token_expiration_time = datetime.datetime.fromtimestamp(
-                    int(data['expiration_time']['timestamp']),
-                    self._timezone)
+        data = TokenStore(path).read()
+        assert data is not None
+        self._check_scope(data)
+        with self._refresh_lock:
+            self._load_token_data(data)
 
     def is_included(self, scope: Scope) -> bool:
         if self._scope_list is not None:
@@ -167,60 +166,267 @@ class OAuth:
         return scope is Scope.default()
 
     @property
-    def access_token(self) -> Optional[str]:
-        # expiration check
-        if (self._token_expiration_time is not None
+    def is_expired(self) -> bool:
+        return (self._token_expiration_time is not None
                 and (datetime.datetime.now(tz=self._timezone)
-                     >= self._token_expiration_time)):
+                     >= self._token_expiration_time))
+
+    @property
+    def access_token(self) -> Optional[str]:
+        # expiration check: the background refresh did not run in time
+        if self.is_expired:
             self._logger.info('access token is expired')
             self.refresh_token()
         return self._access_token
 
+    def _request_refresh(self) -> bool:
+        self._logger.info('refresh token')
+        if self._refresh_token is None:
+            self._logger.error('refresh token: refresh token is None')
+            return False
+        data = {'grant_type': 'refresh_token',
+                'client_id': self._client_id,
+                'client_secret': self._client_secret,
+                'refresh_token': self._refresh_token}
+        start_time = time.perf_counter()
+        response = self._request.request(
+                'post',
+                self._token_url,
+                retry=False,
+                data=data)
+        self._metrics.observe(
+                'pyatmo_token_refresh_seconds',
+                time.perf_counter() - start_time)
+        self._metrics.increment(
+                'pyatmo_token_refresh_total',
+                result='success' if response.ok else 'failure')
+        if response.ok:
+            self._logger.info('refresh token: success')
+            self._update_token(response.json())
+            self._logger.debug('status_code: %s', response.status_code)
+            self._logger.debug('text: %s', response.text)
+        else:
+            self._logger.error('refresh token: failure')
+            self._logger.error('status_code: %s', response.status_code)
+            self._logger.error('text: %s', response.text)
+        return response.ok
+
+    def _reload_token(self) -> bool:
+        # adopt a newer token written by another process
+        assert self._token_store is not None
+        data = self._token_store.read()
+        if (data is None
+                or data['access_token'] == self._access_token
+                or (self._token_created_time is not None
+                    and int(data['created_time']['timestamp'])
+                    <= int(self._token_created_time.timestamp()))):
+            return False
+        self._logger.info('refresh token: reloaded from the token file')
+        self._load_token_data(data)
+        self._metrics.increment(
+                'pyatmo_token_refresh_total',
+                result='reloaded')
+        return True
+
+    def _check_scope(self, data: Dict[str, Any]) -> None:
+        scope_list: Optional[Tuple[Scope, ...]] = (
+                tuple(sorted(
+                        (scope for scope in Scope
+                         if str(scope) in data['scope_list']),
+                        key=lambda x: x.value))
+                if 'scope_list' in data
+                else None)
+        if scope_list != self._scope_list:
+            self._logger.error(
+                    'scope mismatch: \'%s\' (self) &  \'%s\' (file)',
+                    ', '.join(map(str, self._scope_list))
+                    if self._scope_list is not None
+                    else self._scope_list,
+                    ', '.join(map(str, scope_list))
+                    if scope_list is not None
+                    else scope_list)
+        assert scope_list == self._scope_list
+
+    def _token_data(self) -> Dict[str, Any]:
+        assert self._token_created_time is not None
+        assert self._token_expiration_time is not None
+        data: Dict[str, Any] = {}
+        # token
+        data['access_token'] = self._access_token
+        data['refresh_token'] = self._refresh_token
+        # time
+        data['created_time'] = {
+                'timestamp': self._token_created_time.timestamp(),
+                'date': str(self._token_created_time)}
+        data['expiration_time'] = {
+                'timestamp': self._token_expiration_time.timestamp(),
+                'date': str(self._token_expiration_time)}
+        # scope
+        if self._scope_list is not None:
+            data['scope_list'] = list(map(str, self._scope_list))
+        return data
+
+    def _load_token_data(self, data: Dict[str, Any]) -> None:
+        # token
+        self._set_token(data['access_token'], data['refresh_token'])
+        # time
+        self._token_created_time = datetime.datetime.fromtimestamp(
+                int(data['created_time']['timestamp']),
+                self._timezone)
+        self._token_expiration_time = datetime.datetime.fromtimestamp(
+                int(data['expiration_time']['timestamp']),
+                self._timezone)
+        self._start_refresher()
+
     def _update_token(self, data: Dict[str, str]) -> None:
         self._set_token(data['access_token'], data['refresh_token'])
         self._token_created_time = datetime.datetime.now().astimezone()
         self._token_expiration_time = (
                 self._token_created_time
                 + datetime.timedelta(seconds=int(data['expires_in'])))
+        self._start_refresher()
 
     def _set_token(self, access_token: str, refresh_token: str) -> None:
         # unregister to fileter
         if self._access_token is not None:
-            CredentialFilter.unregister_credential(
+            self._credential_filter.unregister_credential(
                     self._access_token,
                     'ACCESS_TOKEN')
         if self._refresh_token is not None:
-            CredentialFilter.unregister_credential(
+            self._credential_filter.unregister_credential(
                     self._refresh_token,
                     'REFRESH_TOKEN')
         # set token
         self._access_token = access_token
         self._refresh_token = refresh_token
         # register to fileter
-        CredentialFilter.register_credential(self._access_token, 'ACCESS_TOKEN')
-        CredentialFilter.register_credential(self._refresh_token, 'REFRESH_TOKEN')
+        self._credential_filter.register_credential(
+                self._access_token,
+                'ACCESS_TOKEN')
+        self._credential_filter.register_credential(
+                self._refresh_token,
+                'REFRESH_TOKEN')
+
+    def _start_refresher(self) -> None:
+        # a new token: (re)schedule the background refresh
+        if self._refresh_margin is None or self._is_closed:
+            return
+        self._refresher_event.set()
+        if self._refresher is None:
+            self._refresher = threading.Thread(
+                    target=self._run_refresher,
+                    name='pyatmo_token_refresh',
+                    daemon=True)
+            self._refresher.start()
 
+    def _run_refresher(self) -> None:
+        while not self._is_closed:
+            wait_time = self._refresh_wait_time()
+            if wait_time is None or wait_time > 0.0:
+                self._refresher_event.wait(wait_time)
+                self._refresher_event.clear()
+                continue
+            access_token = self._access_token
+            try:
+                self.refresh_token()
+            except Exception:
+                # the thread keeps running: a dead refresher never
+                # refreshes again
+                self._logger.exception('background refresh token: failure')
+            if self._access_token == access_token and not self._is_closed:
+                # failure: retry later (an expired token is refreshed
+                # by the next API call)
+                self._refresher_event.wait(_REFRESH_RETRY_INTERVAL)
+                self._refresher_event.clear()
 
-class CredentialFilter(logging.Filter):
-    class Credential(NamedTuple):
-        name: str
-        value: str
+    def _refresh_wait_time(self) -> Optional[float]:
+        # seconds until the refresh, None without a token
+        if (self._refresh_margin is None
+                or self._token_created_time is None
+                or self._token_expiration_time is None):
+            return None
+        # short-lived tokens: not before half of the lifetime
+        refresh_time = max(
+                self._token_expiration_time.timestamp()
+                - self._refresh_margin,
+                (self._token_created_time.timestamp()
+                 + self._token_expiration_time.timestamp()) / 2)
+        return refresh_time - time.time()
 
-    _credential_list: List[Credential] = []
+
+class CredentialFilter(logging.Filter):
+    # registered credentials are redacted in the message and the arguments
+    # formatting is deferred until a handler emits the record
+    def __init__(self) -> None:
+        super().__init__()
+        self._lock = threading.Lock()
+        # credential -> name
+        self._credential_dict: Dict[str, str] = {}
+        # (credential, replacement): replaced as a whole on change
+        self._replacement_list: Tuple[Tuple[str, str], ...] = ()
 
     def filter(self, record: logging.LogRecord) -> bool:
-        message = str(record.msg)
-        for credential in self._credential_list:
-            message = message.replace(
-                    credential.name,
-                    '***{0}***'.format(credential.value))
-        record.msg = message
+        if isinstance(record.msg, _RedactedMessage):
+            record.msg.add_filter(self)
+        elif self._replacement_list:
+            record.msg = _RedactedMessage(record.msg, record.args, self)
+            record.args = None
         return True
 
-    @classmethod
-    def register_credential(cls, name: str, value: str):
-        cls._credential_list.append(cls.Credential(name, value))
+    def redact(self, message: str) -> str:
+        for credential, replacement in self._replacement_list:
+            # substring search is much faster than a regex alternation
+            if credential in message:
+                message = message.replace(credential, replacement)
+        return message
+
+    def register_credential(self, name: str, value: str) -> None:
+        with self._lock:
+            if self._credential_dict.get(name) == value:
+                return
+            self._credential_dict[name] = value
+            self._compile()
+
+    def unregister_credential(self, name: str, value: str) -> None:
+        with self._lock:
+            if self._credential_dict.get(name) != value:
+                return
+            del self._credential_dict[name]
+            self._compile()
+
+    def _compile(self) -> None:
+        # rebuilt only when the credentials change
+        # longest first: a credential containing another one wins
+        self._replacement_list = tuple(
+                (credential, '***{0}***'.format(name))
+                for credential, name in sorted(
+                        self._credential_dict.items(),
+                        key=lambda item: len(item[0]),
+                        reverse=True))
+
+
+class _RedactedMessage:
+    def __init__(
+            self,
+            message: Any,
+            args: Any,
+            credential_filter: CredentialFilter) -> None:
+        self._message = message
+        self._args = args
+        self._filter_list = [credential_filter]
+        self._text: Optional[str] = None
+
+    def add_filter(self, credential_filter: CredentialFilter) -> None:
+        if credential_filter not in self._filter_list:
+            self._filter_list.append(credential_filter)
+            self._text = None
 
-    @classmethod
-    def unregister_credential(cls, name: str, value: str):
-        cls._credential_list.remove(cls.Credential(name, value))
+    def __str__(self) -> str:
+        if self._text is None:
+            text = str(self._message)
+            if self._args:
+                text = text % self._args
+            for credential_filter in self._filter_list:
+                text = credential_filter.redact(text)
+            self._text = text
+        return self._text
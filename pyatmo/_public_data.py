@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+from typing import List, NamedTuple
+
+
+class BoundingBox(NamedTuple):
+    lat_ne: float
+    lon_ne: float
+    lat_sw: float
+    lon_sw: float
+
+    def split(self) -> List['BoundingBox']:
+        # quadtree: NE, NW, SE, SW
+        lat_center = (self.lat_ne + self.lat_sw) / 2
+        lon_center = (self.lon_ne + self.lon_sw) / 2
+        return [
+                BoundingBox(self.lat_ne, self.lon_ne, lat_center, lon_center),
+                BoundingBox(self.lat_ne, lon_center, lat_center, self.lon_sw),
+                BoundingBox(lat_center, self.lon_ne, self.lat_sw, lon_center),
+                BoundingBox(lat_center, lon_center, self.lat_sw, self.lon_sw)]
+
+
+class Tile(NamedTuple):
+    box: BoundingBox
+    depth: int
+
+    def split(self) -> List['Tile']:
+        return [Tile(box, self.depth + 1) for box in self.box.split()]
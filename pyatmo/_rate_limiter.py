@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from typing import Callable, List, Optional
+
+
+__all__ = ['RateLimiter', 'TokenBucket']
+
+
+class TokenBucket:
+    def __init__(
+            self,
+            rate: float,
+            capacity: float) -> None:
+        # rate: tokens per second
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        # set by the first refill: the clock belongs to the rate limiter
+        self._updated_time: Optional[float] = None
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    @property
+    def capacity(self) -> float:
+        return self._capacity
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens
+
+    def refill(self, now: float, scale: float) -> None:
+        if self._updated_time is None:
+            self._updated_time = now
+        self._tokens = min(
+                self._capacity,
+                self._tokens + (now - self._updated_time) * self._rate * scale)
+        self._updated_time = now
+
+    def take(self, scale: float) -> float:
+        # tokens may become negative: the caller waits for the debt
+        self._tokens -= 1.0
+        if self._tokens >= 0.0:
+            return 0.0
+        return -self._tokens / (self._rate * scale)
+
+    def drain(self) -> None:
+        self._tokens = min(self._tokens, 0.0)
+
+
+class RateLimiter:
+    # multiplicative decrease on 'usage reached', additive increase on success
+    _min_scale = 1.0 / 32
+    _recovery_step = 1.0 / 16
+
+    def __init__(
+            self,
+            bucket_list: List[TokenBucket],
+            clock: Callable[[], float] = time.monotonic) -> None:
+        # clock: seconds (monotonic), injected by tests
+        self._bucket_list = bucket_list
+        self._clock = clock
+        self._scale = 1.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(
+            cls,
+            request_interval: Optional[float] = None,
+            burst: int = 1,
+            requests_per_10s: Optional[int] = None,
+            requests_per_hour: Optional[int] = None,
+            clock: Callable[[], float] = time.monotonic) -> 'RateLimiter':
+        bucket_list: List[TokenBucket] = []
+        if request_interval is not None and request_interval > 0:
+            bucket_list.append(TokenBucket(1.0 / request_interval, burst))
+        if requests_per_10s is not None:
+            bucket_list.append(
+                    TokenBucket(requests_per_10s / 10.0, requests_per_10s))
+        if requests_per_hour is not None:
+            bucket_list.append(
+                    TokenBucket(requests_per_hour / 3600.0, requests_per_hour))
+        return cls(bucket_list, clock=clock)
+
+    @property
+    def scale(self) -> float:
+        return self._scale
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = self._clock()
+            wait_time = 0.0
+            for bucket in self._bucket_list:
+                bucket.refill(now, self._scale)
+                wait_time = max(wait_time, bucket.take(self._scale))
+            return wait_time
+
+    def delay(self) -> float:
+        # seconds before the next request would be sent (nothing is taken)
+        # acquire() reserves before sleeping: waiting requests are included
+        with self._lock:
+            now = self._clock()
+            wait_time = 0.0
+            for bucket in self._bucket_list:
+                bucket.refill(now, self._scale)
+                if bucket.tokens < 1.0:
+                    wait_time = max(
+                            wait_time,
+                            (1.0 - bucket.tokens)
+                            / (bucket.rate * self._scale))
+            return wait_time
+
+    def acquire(self) -> float:
+        wait_time = self.reserve()
+        if wait_time > 0.0:
+            time.sleep(wait_time)
+        return wait_time
+
+    async def acquire_async(self) -> float:
+        wait_time = self.reserve()
+        if wait_time > 0.0:
+            import asyncio
+            await asyncio.sleep(wait_time)
+        return wait_time
+
+    def throttle(self) -> None:
+        with self._lock:
+            now = self._clock()
+            for bucket in self._bucket_list:
+                bucket.refill(now, self._scale)
+                bucket.drain()
+            self._scale = max(self._min_scale, self._scale / 2.0)
+
+    def recover(self) -> None:
+        if self._scale >= 1.0:
+            return
+        with self._lock:
+            now = self._clock()
+            for bucket in self._bucket_list:
+                bucket.refill(now, self._scale)
+            self._scale = min(1.0, self._scale + self._recovery_step)
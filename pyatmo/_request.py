@@ -1,47 +1,241 @@
 # -*- coding: utf-8 -*-
 
-import threading
+import json
 import time
-from typing import Optional
-import requests
+from typing import TYPE_CHECKING, Any, NamedTuple, Optional
+from ._metrics import Metrics, endpoint_name
+from ._rate_limiter import RateLimiter
+if TYPE_CHECKING:
+    import aiohttp
+    import requests
 
 
+# Netatmo API server
+BASE_URL = 'https://api.netatmo.com'
+# transient server errors to be retried
+_RETRY_STATUS = (500, 502, 503, 504)
+
 
 class Request:
-    _interval: Optional[float] = None
-    _timer: Optional[threading.Thread] = None
+    def __init__(
+            self,
+            rate_limiter: Optional[RateLimiter] = None,
+            session: Optional['requests.Session'] = None,
+            pool_size: int = 10,
+            timeout: Optional[float] = None,
+            max_retries: int = 3,
+            backoff_factor: float = 0.5,
+            metrics: Optional[Metrics] = None) -> None:
+        # imported on first use: import pyatmo stays cheap
+        import requests
+        import requests.adapters
+        self._requests = requests
+        self._rate_limiter = rate_limiter
+        self._timeout = timeout
+        self._max_retries = max_retries
+        self._backoff_factor = backoff_factor
+        self._metrics = metrics or Metrics()
+        # session
+        # retried here, not by urllib3: each attempt is rate limited
+        # and recorded
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=pool_size,
+                    pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        self._session = session
+
+    @property
+    def rate_limiter(self) -> Optional[RateLimiter]:
+        return self._rate_limiter
 
-    @classmethod
     def request(
-            cls,
+            self,
             method: str,
             url: str,
-            **kwargs) -> requests.Response:
-        if cls._timer is not None:
-            cls._timer.join()
-            cls._timer = None
-        response = requests.request(method, url, **kwargs)
-        if cls._interval is not None:
-            cls._timer = threading.Thread(
-                    name='pyatmo_request_interval_adjustment',
-                    target=time.sleep,
-                    args=(cls._interval,))
-            cls._timer.start()
-        return response
-
-    @classmethod
-    def interval(
-            cls,
-            seconds: Optional[float]) -> None:
-        cls._interval = seconds
-
-
-def request(
-        method: str,
+            retry: bool = True,
+            **kwargs) -> 'requests.Response':
+        # retry: False if the request must not be sent twice
+        #   (e.g. a single-use refresh token)
+        kwargs.setdefault('timeout', self._timeout)
+        max_retries = self._max_retries if retry else 0
+        attempt = 0
+        while True:
+            if self._rate_limiter is not None:
+                self._metrics.observe(
+                        'pyatmo_rate_limiter_wait_seconds',
+                        self._rate_limiter.acquire())
+            start_time = time.perf_counter()
+            try:
+                response = self._session.request(method, url, **kwargs)
+            except self._requests.RequestException as error:
+                record_request(self._metrics, url, start_time, None, 0)
+                if (attempt >= max_retries
+                        or not isinstance(
+                                error,
+                                (self._requests.ConnectionError,
+                                 self._requests.Timeout))):
+                    raise
+            else:
+                record_request(
+                        self._metrics,
+                        url,
+                        start_time,
+                        response.status_code,
+                        len(response.content))
+                if self._rate_limiter is not None:
+                    adapt_rate(self._rate_limiter, self._metrics, response)
+                if (response.status_code not in _RETRY_STATUS
+                        or attempt >= max_retries):
+                    return response
+            self._metrics.increment(
+                    'pyatmo_request_retries_total',
+                    endpoint=endpoint_name(url))
+            time.sleep(self._backoff_factor * (2 ** attempt))
+            attempt += 1
+
+    def close(self) -> None:
+        self._session.close()
+
+
+def record_request(
+        metrics: Metrics,
         url: str,
-        **kwargs) -> requests.Response:
-    return Request.request(method, url, **kwargs)
+        start_time: float,
+        status_code: Optional[int],
+        size: int) -> None:
+    # status_code: None if the request failed without a response
+    if not metrics.enabled:
+        return
+    endpoint = endpoint_name(url)
+    metrics.observe(
+            'pyatmo_request_seconds',
+            time.perf_counter() - start_time,
+            endpoint=endpoint)
+    metrics.increment(
+            'pyatmo_requests_total',
+            endpoint=endpoint,
+            status=str(status_code) if status_code is not None else 'error')
+    metrics.increment('pyatmo_response_bytes_total', size, endpoint=endpoint)
+
+
+def adapt_rate(
+        rate_limiter: RateLimiter,
+        metrics: Metrics,
+        response: Any) -> None:
+    # slow down on 'usage reached', speed up again on other responses
+    if (not response.ok
+            and is_usage_reached(response.status_code, response.text)):
+        rate_limiter.throttle()
+        metrics.increment('pyatmo_rate_limiter_throttle_total')
+    else:
+        rate_limiter.recover()
+
+
+def is_usage_reached(status_code: int, text: str) -> bool:
+    # 429: too many requests, 403 (error code 26): user usage reached
+    if status_code == 429:
+        return True
+    return status_code == 403 and 'usage reached' in text.lower()
+
+
+class AsyncResponse(NamedTuple):
+    status_code: int
+    content: bytes
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+
+class AsyncRequest:
+    def __init__(
+            self,
+            rate_limiter: Optional[RateLimiter] = None,
+            pool_size: int = 10,
+            timeout: Optional[float] = None,
+            max_retries: int = 3,
+            backoff_factor: float = 0.5,
+            metrics: Optional[Metrics] = None) -> None:
+        # aiohttp is an optional dependency: pip install pyatmo[async]
+        import asyncio
+        import aiohttp
+        self._asyncio = asyncio
+        self._aiohttp = aiohttp
+        self._rate_limiter = rate_limiter
+        self._metrics = metrics or Metrics()
+        self._pool_size = pool_size
+        self._timeout = timeout
+        self._max_retries = max_retries
+        self._backoff_factor = backoff_factor
+        # the session is bound to the running event loop
+        self._session: Optional['aiohttp.ClientSession'] = None
+
+    @property
+    def rate_limiter(self) -> Optional[RateLimiter]:
+        return self._rate_limiter
+
+    async def request(
+            self,
+            method: str,
+            url: str,
+            **kwargs) -> AsyncResponse:
+        # every attempt goes through the rate limiter & the metrics
+        session = self._client_session()
+        attempt = 0
+        while True:
+            if self._rate_limiter is not None:
+                self._metrics.observe(
+                        'pyatmo_rate_limiter_wait_seconds',
+                        await self._rate_limiter.acquire_async())
+            start_time = time.perf_counter()
+            try:
+                async with session.request(method, url, **kwargs) as response:
+                    result = AsyncResponse(
+                            status_code=response.status,
+                            content=await response.read())
+            except (self._aiohttp.ClientConnectionError,
+                    self._asyncio.TimeoutError):
+                # TimeoutError: ClientTimeout expired
+                record_request(self._metrics, url, start_time, None, 0)
+                if attempt >= self._max_retries:
+                    raise
+            else:
+                record_request(
+                        self._metrics,
+                        url,
+                        start_time,
+                        result.status_code,
+                        len(result.content))
+                if self._rate_limiter is not None:
+                    adapt_rate(self._rate_limiter, self._metrics, result)
+                if (result.status_code not in _RETRY_STATUS
+                        or attempt >= self._max_retries):
+                    return result
+            self._metrics.increment(
+                    'pyatmo_request_retries_total',
+                    endpoint=endpoint_name(url))
+            await self._asyncio.sleep(self._backoff_factor * (2 ** attempt))
+            attempt += 1
 
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
 
-def interval(seconds: Optional[float]) -> None:
-    Request.interval(seconds)
+    def _client_session(self) -> 'aiohttp.ClientSession':
+        if self._session is None:
+            self._session = self._aiohttp.ClientSession(
+                    connector=self._aiohttp.TCPConnector(
+                            limit=self._pool_size),
+                    timeout=self._aiohttp.ClientTimeout(total=self._timeout))
+        return self._session
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from typing import (
+        TYPE_CHECKING, Any, Awaitable, Callable, Dict, Generic, NamedTuple,
+        Optional, TypeVar, cast)
+if TYPE_CHECKING:
+    import asyncio
+
+
+__all__ = ['AsyncSingleFlight', 'SingleFlight', 'SingleFlightStats']
+
+
+_T = TypeVar('_T')
+
+
+class SingleFlightStats(NamedTuple):
+    # calls sent
+    executed: int
+    # calls which shared the result of an in-flight call
+    coalesced: int
+
+
+class _Call(Generic[_T]):
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.result: Optional[_T] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    # concurrent calls with the same key share one execution (threads)
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._call_dict: Dict[str, _Call[Any]] = {}
+        self._executed = 0
+        self._coalesced = 0
+
+    @property
+    def stats(self) -> SingleFlightStats:
+        with self._lock:
+            return SingleFlightStats(self._executed, self._coalesced)
+
+    def do(self, key: str, function: Callable[[], _T]) -> _T:
+        with self._lock:
+            call = self._call_dict.get(key)
+            is_leader = call is None
+            if call is None:
+                call = _Call()
+                self._call_dict[key] = call
+                self._executed += 1
+            else:
+                self._coalesced += 1
+        if not is_leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return cast(_T, call.result)
+        try:
+            call.result = function()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._call_dict[key]
+            call.event.set()
+        return call.result
+
+
+class AsyncSingleFlight:
+    # concurrent calls with the same key share one execution (asyncio)
+    def __init__(self) -> None:
+        self._task_dict: Dict[str, 'asyncio.Task[Any]'] = {}
+        self._executed = 0
+        self._coalesced = 0
+
+    @property
+    def stats(self) -> SingleFlightStats:
+        return SingleFlightStats(self._executed, self._coalesced)
+
+    async def do(
+            self,
+            key: str,
+            function: Callable[[], Awaitable[_T]]) -> _T:
+        import asyncio
+        task = self._task_dict.get(key)
+        if task is None:
+            task = asyncio.ensure_future(function())
+            self._task_dict[key] = task
+            task.add_done_callback(lambda _: self._task_dict.pop(key, None))
+            self._executed += 1
+        else:
+            self._coalesced += 1
+        # a cancelled caller does not cancel the shared call
+        return await asyncio.shield(task)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+import os
+import pathlib
+import stat
+import threading
+from typing import Any, Dict, Iterator, Optional
+
+
+__all__ = ['TokenStore']
+
+
+class TokenStore:
+    # YAML token file shared between threads and processes
+    # writes replace the file atomically: reads never see a partial file
+    # lock() serializes read-refresh-write sections (fcntl on POSIX)
+    def __init__(self, path: pathlib.Path) -> None:
+        self._path = path
+        self._lock_path = path.with_name('{0}.lock'.format(path.name))
+        # threads of this process (the only lock on non-POSIX platforms)
+        self._thread_lock = threading.Lock()
+
+    @property
+    def path(self) -> pathlib.Path:
+        return self._path
+
+    def exists(self) -> bool:
+        return self._path.exists()
+
+    @contextlib.contextmanager
+    def lock(self) -> Iterator[None]:
+        with self._thread_lock:
+            try:
+                import fcntl
+            except ImportError:
+                # not POSIX: atomic replace only
+                yield
+                return
+            with self._lock_path.open('a') as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def read(self) -> Optional[Dict[str, Any]]:
+        import yaml
+        try:
+            with self._path.open() as token_file:
+                data = yaml.load(token_file, Loader=yaml.SafeLoader)
+        except FileNotFoundError:
+            return None
+        return data if isinstance(data, dict) else None
+
+    def write(self, data: Dict[str, Any]) -> None:
+        import yaml
+        # the mode of the replaced file, owner only for a new file:
+        # the tokens are credentials
+        try:
+            mode = stat.S_IMODE(self._path.stat().st_mode)
+        except FileNotFoundError:
+            mode = 0o600
+        temporary_path = self._path.with_name('{0}.{1}.{2}.tmp'.format(
+                self._path.name,
+                os.getpid(),
+                threading.get_ident()))
+        file_descriptor = os.open(
+                str(temporary_path),
+                os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                0o600)
+        try:
+            with os.fdopen(file_descriptor, mode='w') as outfile:
+                yaml.dump(data, outfile, default_flow_style=False)
+                outfile.flush()
+                os.fsync(outfile.fileno())
+            # not reduced by the umask
+            os.chmod(str(temporary_path), mode)
+            os.replace(temporary_path, self._path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                temporary_path.unlink()
+            raise
@@ -1,4 +1,42 @@
 # -*- coding: utf-8 -*-
 
-from ._database import Database, SQLLoggingLevel
-from ._table import Device, Module, Measurements
+from typing import TYPE_CHECKING, Any, List
+from .._lazy import lazy_attribute
+if TYPE_CHECKING:
+    from ._archive import ArchiveReader
+    from ._database import (
+            Database, RegisterResult, SQLiteProfile, SQLLoggingLevel)
+    from ._storage import LongStorage, ParquetStorage, SQLStorage, Storage
+    from ._table import (
+            Device, Module, Measurements, MeasurementsDaily,
+            MeasurementsHourly, MeasurementsLong, ModuleSyncState)
+
+
+# public name -> submodule, imported on first access (PEP 562):
+# import pyatmo.weather does not load SQLAlchemy or map the tables
+_LAZY_ATTRIBUTES = {
+        'ArchiveReader': '._archive',
+        'Database': '._database',
+        'RegisterResult': '._database',
+        'SQLiteProfile': '._database',
+        'SQLLoggingLevel': '._database',
+        'LongStorage': '._storage',
+        'ParquetStorage': '._storage',
+        'SQLStorage': '._storage',
+        'Storage': '._storage',
+        'Device': '._table',
+        'Module': '._table',
+        'Measurements': '._table',
+        'MeasurementsDaily': '._table',
+        'MeasurementsHourly': '._table',
+        'MeasurementsLong': '._table',
+        'ModuleSyncState': '._table'}
+__all__ = sorted(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name: str) -> Any:
+    return lazy_attribute(__name__, _LAZY_ATTRIBUTES, globals(), name)
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
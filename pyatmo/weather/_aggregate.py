@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+import math
+import re
+import sqlite3
+from typing import (
+        Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union)
+import sqlalchemy
+from ._table import MEASUREMENTS_ANGLE_COLUMNS
+
+
+# aggregate functions
+FUNCTIONS = ('min', 'max', 'avg', 'sum', 'count')
+
+_BUCKET_UNIT = {
+        's': 1,
+        'm': 60,
+        'min': 60,
+        'h': 3600,
+        'd': 86400,
+        'w': 604800}
+
+# partial aggregates: {partial name: SQL expression}
+PartialColumns = Callable[[str], Dict[str, Any]]
+
+
+def bucket_seconds(bucket: Union[int, str]) -> int:
+    if isinstance(bucket, int):
+        result = bucket
+    else:
+        match = re.fullmatch(r'\s*(\d+)\s*([a-z]+)\s*', bucket)
+        if match is None or match.group(2) not in _BUCKET_UNIT:
+            raise ValueError('invalid bucket: {0}'.format(bucket))
+        result = int(match.group(1)) * _BUCKET_UNIT[match.group(2)]
+    if result <= 0:
+        raise ValueError('invalid bucket: {0}'.format(bucket))
+    return result
+
+
+def value_partials(table: sqlalchemy.sql.FromClause) -> PartialColumns:
+    # table: measurements or a selectable with the same value columns
+    def partials(column: str) -> Dict[str, Any]:
+        value = table.c[column]
+        result: Dict[str, Any] = {
+                'count': sqlalchemy.func.count(value),
+                'min': sqlalchemy.func.min(value),
+                'max': sqlalchemy.func.max(value),
+                'sum': sqlalchemy.func.sum(value)}
+        if column in MEASUREMENTS_ANGLE_COLUMNS:
+            radians = sqlalchemy.func.radians(value)
+            result['sin'] = sqlalchemy.func.sum(sqlalchemy.func.sin(radians))
+            result['cos'] = sqlalchemy.func.sum(sqlalchemy.func.cos(radians))
+        return result
+    return partials
+
+
+def aggregate(
+        connection: sqlalchemy.engine.Connection,
+        table: sqlalchemy.Table,
+        partials: PartialColumns,
+        module_id: str,
+        begin_timestamp: Optional[int],
+        end_timestamp: Optional[int],
+        bucket: int,
+        function_list: Sequence[str],
+        column_list: Sequence[str]) -> List[Dict[str, Any]]:
+    _check_functions(function_list)
+    # buckets are aligned to the unix epoch (UTC)
+    timestamp = table.c.timestamp - table.c.timestamp % bucket
+    select_list = [timestamp.label('timestamp')]
+    for column in column_list:
+        for key, expression in partials(column).items():
+            if key in _required_partials(column, function_list):
+                select_list.append(
+                        expression.label('{0}__{1}'.format(column, key)))
+    query = (sqlalchemy
+             .select(select_list)
+             .where(table.c.module_id == module_id)
+             .group_by(timestamp)
+             .order_by(timestamp))
+    if begin_timestamp is not None:
+        query = query.where(table.c.timestamp >= begin_timestamp)
+    if end_timestamp is not None:
+        query = query.where(table.c.timestamp <= end_timestamp)
+    return [_finalize_row(row, column_list, function_list)
+            for row in connection.execute(query)]
+
+
+def aggregate_rows(
+        rows: Iterable[Tuple[Any, ...]],
+        bucket: int,
+        function_list: Sequence[str],
+        column_list: Sequence[str]) -> List[Dict[str, Any]]:
+    # same as aggregate, in Python: rows [(timestamp, *column_list)]
+    # from a storage outside of the SQL database
+    _check_functions(function_list)
+    bucket_dict: Dict[int, Dict[str, Any]] = {}
+    for row in rows:
+        timestamp = row[0] - row[0] % bucket
+        partials = bucket_dict.get(timestamp)
+        if partials is None:
+            partials = {'timestamp': timestamp}
+            for column in column_list:
+                partials.update({
+                        '{0}__{1}'.format(column, key): initial
+                        for key, initial in (
+                                ('count', 0),
+                                ('min', None),
+                                ('max', None),
+                                ('sum', None),
+                                ('sin', None),
+                                ('cos', None))})
+            bucket_dict[timestamp] = partials
+        for column, value in zip(column_list, row[1:]):
+            if value is not None:
+                _add_partials(partials, column, value)
+    return [_finalize_row(bucket_dict[timestamp], column_list, function_list)
+            for timestamp in sorted(bucket_dict)]
+
+
+def register_sqlite_functions(
+        dbapi_connection: Any,
+        connection_record: Any) -> None:
+    # math functions are built into SQLite only since 3.35
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    try:
+        dbapi_connection.execute('SELECT sin(0), cos(0), radians(0)')
+    except sqlite3.OperationalError:
+        for name, function in (('sin', math.sin),
+                               ('cos', math.cos),
+                               ('radians', math.radians)):
+            dbapi_connection.create_function(
+                    name,
+                    1,
+                    _null_safe(function),
+                    deterministic=True)
+
+
+def _check_functions(function_list: Sequence[str]) -> None:
+    for function in function_list:
+        if function not in FUNCTIONS:
+            raise ValueError('invalid function: {0}'.format(function))
+
+
+def _add_partials(
+        partials: Dict[str, Any],
+        column: str,
+        value: float) -> None:
+    # NULL-ignoring like the SQL aggregate functions
+    def key(name: str) -> str:
+        return '{0}__{1}'.format(column, name)
+    partials[key('count')] += 1
+    for name, function in (('min', min), ('max', max)):
+        current = partials[key(name)]
+        partials[key(name)] = (
+                value if current is None else function(current, value))
+    for name, term in (
+            ('sum', value),
+            ('sin', math.sin(math.radians(value))),
+            ('cos', math.cos(math.radians(value)))):
+        current = partials[key(name)]
+        partials[key(name)] = term if current is None else current + term
+
+
+def _finalize_row(
+        row: Any,
+        column_list: Sequence[str],
+        function_list: Sequence[str]) -> Dict[str, Any]:
+    values: Dict[str, Any] = {'timestamp': row['timestamp']}
+    for column in column_list:
+        for function in function_list:
+            values['{0}_{1}'.format(column, function)] = _finalize(
+                    row,
+                    column,
+                    function)
+    return values
+
+
+def _required_partials(
+        column: str,
+        function_list: Sequence[str]) -> List[str]:
+    result: List[str] = []
+    for function in function_list:
+        if function == 'avg':
+            if column in MEASUREMENTS_ANGLE_COLUMNS:
+                result.extend(['sin', 'cos'])
+            else:
+                result.extend(['sum', 'count'])
+        else:
+            result.append(function)
+    return result
+
+
+def _finalize(
+        row: Any,
+        column: str,
+        function: str) -> Optional[float]:
+    def partial(key: str) -> Any:
+        return row['{0}__{1}'.format(column, key)]
+    if function != 'avg':
+        return partial(function)
+    if column in MEASUREMENTS_ANGLE_COLUMNS:
+        # circular mean
+        sin, cos = partial('sin'), partial('cos')
+        if sin is None or cos is None:
+            return None
+        return math.degrees(math.atan2(sin, cos)) % 360.0
+    total, count = partial('sum'), partial('count')
+    if total is None or not count:
+        return None
+    return total / count
+
+
+def _null_safe(function: Callable[..., float]) -> Callable[..., Any]:
+    def wrapper(*args: Any) -> Optional[float]:
+        if any(arg is None for arg in args):
+            return None
+        return function(*args)
+    return wrapper
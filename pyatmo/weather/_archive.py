@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import datetime
+import itertools
+import json
+import math
+import mmap
+import os
+import pathlib
+import struct
+import tempfile
+import urllib.parse
+from typing import Any, List, NamedTuple, Optional, Sequence, Tuple
+
+
+# file layout:
+#   magic (8 bytes) | header length (uint32 LE) | header (JSON) | blocks
+# block layout (little endian, standard sizes of struct):
+#   first timestamp (int64) | timestamp deltas (uint16 or uint32) x (n - 1)
+#   | column values (float64, NaN: NULL) x n for each column
+ARCHIVE_SUFFIX = '.pyatmo'
+_MAGIC = b'PYATMO\x00\x01'
+_PREFIX = struct.Struct('<8sI')
+_TIMESTAMP = struct.Struct('<q')
+# struct format per delta size
+_DELTA_FORMAT = {2: 'H', 4: 'I'}
+
+
+class ArchiveBlock(NamedTuple):
+    begin: int
+    end: int
+    size: int
+    # offset from the end of the header
+    offset: int
+    # bytes per timestamp delta
+    delta_size: int
+
+
+def write_archive(
+        path: pathlib.Path,
+        module_id: str,
+        column_list: Sequence[str],
+        rows: Sequence[Tuple[Any, ...]],
+        block_size: int = 4096) -> None:
+    # rows: [(timestamp, *columns)] ordered by timestamp
+    block_list: List[ArchiveBlock] = []
+    data = bytearray()
+    for i in range(0, len(rows), block_size):
+        block_rows = rows[i:i + block_size]
+        timestamps = [row[0] for row in block_rows]
+        deltas = [b - a for a, b in zip(timestamps, timestamps[1:])]
+        delta_size = 2 if max(deltas, default=0) <= 0xffff else 4
+        block_list.append(ArchiveBlock(
+                begin=timestamps[0],
+                end=timestamps[-1],
+                size=len(block_rows),
+                offset=len(data),
+                delta_size=delta_size))
+        data.extend(_TIMESTAMP.pack(timestamps[0]))
+        data.extend(_pack(_DELTA_FORMAT[delta_size], deltas))
+        for j in range(len(column_list)):
+            data.extend(_pack(
+                    'd',
+                    [math.nan if row[j + 1] is None else row[j + 1]
+                     for row in block_rows]))
+    header = json.dumps({
+            'module_id': module_id,
+            'column_list': list(column_list),
+            'block_list': [block._asdict() for block in block_list]},
+            separators=(',', ':')).encode('utf-8')
+    # atomic replace, unique temporary file per write
+    path.parent.mkdir(parents=True, exist_ok=True)
+    file_descriptor, temporary_name = tempfile.mkstemp(
+            dir=str(path.parent),
+            prefix='{0}.'.format(path.name),
+            suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as archive_file:
+            archive_file.write(_PREFIX.pack(_MAGIC, len(header)))
+            archive_file.write(header)
+            archive_file.write(data)
+        os.replace(temporary_name, str(path))
+    except BaseException:
+        os.unlink(temporary_name)
+        raise
+
+
+class ArchiveReader:
+    def __init__(self, path: pathlib.Path) -> None:
+        self._file = path.open('rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_length = _PREFIX.unpack_from(self._map, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError('not a pyatmo archive: {0}'.format(path))
+        header = json.loads(
+                self._map[_PREFIX.size:_PREFIX.size + header_length]
+                .decode('utf-8'))
+        self._data_offset = _PREFIX.size + header_length
+        self._module_id: str = header['module_id']
+        self._column_list: List[str] = header['column_list']
+        self._block_list = [
+                ArchiveBlock(**block) for block in header['block_list']]
+
+    def __enter__(self) -> 'ArchiveReader':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    @property
+    def module_id(self) -> str:
+        return self._module_id
+
+    @property
+    def column_list(self) -> List[str]:
+        return self._column_list
+
+    def __len__(self) -> int:
+        return sum(block.size for block in self._block_list)
+
+    def read(
+            self,
+            begin_timestamp: Optional[int] = None,
+            end_timestamp: Optional[int] = None,
+            column_list: Optional[Sequence[str]] = None
+            ) -> List[Tuple[Any, ...]]:
+        # [(timestamp, *columns)]: only overlapping blocks are decoded
+        if column_list is None:
+            column_list = self._column_list
+        result: List[Tuple[Any, ...]] = []
+        for block in self._block_list:
+            if ((begin_timestamp is not None and block.end < begin_timestamp)
+                    or (end_timestamp is not None
+                        and end_timestamp < block.begin)):
+                continue
+            result.extend(self._read_block(
+                    block,
+                    begin_timestamp,
+                    end_timestamp,
+                    column_list))
+        return result
+
+    def close(self) -> None:
+        if not self._map.closed:
+            self._map.close()
+        self._file.close()
+
+    def _read_block(
+            self,
+            block: ArchiveBlock,
+            begin_timestamp: Optional[int],
+            end_timestamp: Optional[int],
+            column_list: Sequence[str]) -> List[Tuple[Any, ...]]:
+        offset = self._data_offset + block.offset
+        (first,) = _TIMESTAMP.unpack_from(self._map, offset)
+        offset += _TIMESTAMP.size
+        deltas = self._unpack(
+                _DELTA_FORMAT[block.delta_size],
+                offset,
+                block.size - 1)
+        offset += block.delta_size * (block.size - 1)
+        timestamps = list(itertools.accumulate(
+                itertools.chain([first], deltas)))
+        # rows in [begin_timestamp, end_timestamp]
+        start = (bisect.bisect_left(timestamps, begin_timestamp)
+                 if begin_timestamp is not None
+                 else 0)
+        stop = (bisect.bisect_right(timestamps, end_timestamp)
+                if end_timestamp is not None
+                else block.size)
+        value_list: List[List[Optional[float]]] = []
+        for column in column_list:
+            if column not in self._column_list:
+                value_list.append([None] * (stop - start))
+                continue
+            column_offset = (offset
+                             + 8 * block.size
+                             * self._column_list.index(column))
+            values = self._unpack(
+                    'd',
+                    column_offset + 8 * start,
+                    stop - start)
+            value_list.append(
+                    [None if math.isnan(value) else value for value in values])
+        return list(zip(timestamps[start:stop], *value_list))
+
+    def _unpack(
+            self,
+            code: str,
+            offset: int,
+            count: int) -> Tuple[Any, ...]:
+        # decoded directly from the mapped pages
+        return struct.unpack_from(
+                '<{0:d}{1}'.format(count, code),
+                self._map,
+                offset)
+
+
+def archive_path(
+        directory: pathlib.Path,
+        module_id: str,
+        timestamp: int) -> pathlib.Path:
+    # <directory>/<module id>/<YYYY-MM>.pyatmo
+    return directory.joinpath(
+            urllib.parse.quote(module_id, safe=''),
+            '{0:%Y-%m}{1}'.format(
+                    datetime.datetime.fromtimestamp(
+                            timestamp,
+                            datetime.timezone.utc),
+                    ARCHIVE_SUFFIX))
+
+
+def _pack(code: str, values: Sequence[Any]) -> bytes:
+    return struct.pack('<{0:d}{1}'.format(len(values), code), *values)
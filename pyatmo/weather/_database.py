@@ -1,37 +1,102 @@
 # -*- coding: utf-8 -*-
 
+import concurrent.futures
 import datetime
 import logging
+import queue
 import re
 import pathlib
+import threading
 import time
-from typing import Any, Dict, List, Optional, Tuple
-import pytz
+from typing import (
+        TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional, Sequence, Tuple,
+        Union)
 import sqlalchemy
-from ._sqlalchemy import SQLLoggingLevel, _DeclarativeBase
-from ._table import Device, Measurements, Module
-from .._client import Client
+from ._aggregate import (
+        aggregate, aggregate_rows, bucket_seconds, register_sqlite_functions,
+        value_partials)
+from ._archive import (
+        ARCHIVE_SUFFIX, ArchiveReader, archive_path, write_archive)
+from ._rollup import ROLLUP_LIST, refresh_rollup, select_rollup
+from ._migration import migrate
+from ._sqlalchemy import SQLiteProfile, SQLLoggingLevel
+from ._storage import SQLStorage, Storage, month_range
+from ._table import Device, Measurements, Module, ModuleSyncState
+from .._client import Client, expand_measure
+from .._client_pool import ClientPool
+from .._metrics import Metrics
+if TYPE_CHECKING:
+    import numpy
+    import pandas
+
+
+# (module id, rows), rows is None when the module is finished
+_Page = Tuple[str, Optional[List[Dict[str, Any]]]]
 
 
 class Database:
     def __init__(
             self,
-            path: pathlib.Path,
-            client: Client,
+            path: Union[pathlib.Path, str],
+            client: Union[Client, ClientPool],
             logger: Optional[logging.Logger] = None,
-            sql_logging_level: SQLLoggingLevel = SQLLoggingLevel.NONE) -> None:
+            sql_logging_level: SQLLoggingLevel = SQLLoggingLevel.NONE,
+            sqlite_profile: Optional[SQLiteProfile] = None,
+            storage: Optional[Storage] = None,
+            metrics: Optional[Metrics] = None) -> None:
+        # path: SQLite database file or engine URL
+        # client: ClientPool to share the requests between accounts
         # logger
         self._logger = logger or logging.getLogger(__name__)
+        # metrics
+        self._metrics = metrics or Metrics()
         # client
         self._client = client
         # sqlalchemy engine
-        self._engine = sqlalchemy.create_engine(
-                'sqlite:///{0}'.format(path.as_posix()),
-                encoding='utf-8',
-                echo=sql_logging_level.sqlalchemy_echo())
-        _DeclarativeBase.metadata.create_all(self._engine)
+        if isinstance(path, str) and sqlite_profile is not None:
+            # the profile opens a SQLite file (pathlib.Path)
+            raise ValueError('sqlite_profile requires a pathlib.Path')
+        if isinstance(path, str):
+            self._engine = sqlalchemy.create_engine(
+                    path,
+                    encoding='utf-8',
+                    echo=sql_logging_level.sqlalchemy_echo())
+        elif sqlite_profile is None:
+            self._engine = sqlalchemy.create_engine(
+                    'sqlite:///{0}'.format(path.as_posix()),
+                    encoding='utf-8',
+                    echo=sql_logging_level.sqlalchemy_echo())
+        else:
+            self._engine = sqlite_profile.create_engine(
+                    path,
+                    encoding='utf-8',
+                    echo=sql_logging_level.sqlalchemy_echo())
+        sqlalchemy.event.listen(
+                self._engine,
+                'connect',
+                register_sqlite_functions)
+        migrate(self._engine, self._logger)
+        # read-only engine for queries running beside the writer
+        self._read_engine = self._engine
+        if (isinstance(path, pathlib.Path)
+                and sqlite_profile is not None
+                and sqlite_profile.reader_pool_size):
+            self._read_engine = sqlite_profile.create_engine(
+                    path,
+                    read_only=True,
+                    encoding='utf-8',
+                    echo=sql_logging_level.sqlalchemy_echo())
+            sqlalchemy.event.listen(
+                    self._read_engine,
+                    'connect',
+                    register_sqlite_functions)
         # sqlalchemy session maker
         self._session_maker = sqlalchemy.orm.sessionmaker(bind=self._engine)
+        self._read_session_maker = sqlalchemy.orm.sessionmaker(
+                bind=self._read_engine)
+        # measurements storage
+        self._storage = storage or SQLStorage()
+        self._storage.bind(self._engine, self._read_engine)
 
     def session(self, **kwargs) -> sqlalchemy.orm.session.Session:
         return self._session_maker(**kwargs)
@@ -39,114 +104,241 @@ class Database:
     def register(
             self,
             device_id: Optional[str] = None,
-            get_favorites: Optional[bool] = None) -> None:
+            get_favorites: Optional[bool] = None
+            ) -> Optional['RegisterResult']:
         # request
         stations_data = self._client.get_stations_data(
                 device_id=device_id,
                 get_favorites=get_favorites)
         if stations_data is None:
             self._logger.error('stations data is none')
-            return
-        session = self.session()
+            return None
+        device_dict: Dict[str, Dict[str, Any]] = {}
+        module_dict: Dict[str, Dict[str, Any]] = {}
         for device_data in stations_data['body']['devices']:
             # device
-            device_argv = {
+            device_dict[device_data['_id']] = {
                     'id': device_data['_id'],
                     'name': device_data['station_name'],
                     'latitude': float(device_data['place']['location'][1]),
                     'longitude': float(device_data['place']['location'][0]),
                     'altitude': float(device_data['place']['altitude']),
                     'timezone': device_data['place']['timezone']}
-            device: Optional[Device] = (
-                    session.query(Device)
-                    .filter_by(id=device_argv['id']).one_or_none())
-            if device is None:
-                device = Device(**device_argv)
-                session.add(device)
-            else:
-                for key, value in device_argv.items():
-                    if key != 'id':
-                        setattr(device, key, value)
             # main module
-            main_module_argv = {
-                    'id': device.id,
-                    'device_id': device.id,
+            module_dict[device_data['_id']] = {
+                    'id': device_data['_id'],
+                    'device_id': device_data['_id'],
                     'name': device_data.get('module_name'),
                     'module_type': device_data['type'],
                     'data_type': ','.join(device_data['data_type'])}
-            main_module: Optional[Module] = (
-                    session.query(Module)
-                    .filter_by(id=main_module_argv['id']).one_or_none())
-            if main_module is None:
-                main_module = Module(**main_module_argv)
-                session.add(main_module)
-            else:
-                for key, value in main_module_argv.items():
-                    if key != 'id':
-                        setattr(main_module, key, value)
             # modules
             for module_data in device_data['modules']:
-                module_argv = {
+                module_dict[module_data['_id']] = {
                         'id': module_data['_id'],
-                        'device_id': device.id,
+                        'device_id': device_data['_id'],
                         'name': module_data.get('module_name'),
                         'module_type': module_data['type'],
                         'data_type': ','.join(module_data['data_type'])}
-                module: Optional[Module] = (
-                    session.query(Module)
-                    .filter_by(id=module_argv['id']).one_or_none())
-                if module is None:
-                    module = Module(**module_argv)
-                    session.add(module)
-                else:
-                    for key, value in module_argv.items():
-                        if key != 'id':
-                            setattr(module, key, value)
-        session.flush()
+        # diff against the registered rows (one query per table)
+        session = self.session()
+        device_table = Device.__table__
+        module_table = Module.__table__
+        existing_device_dict = {
+                row['id']: dict(row)
+                for row in session.execute(sqlalchemy.select([device_table]))}
+        existing_module_dict = {
+                row['id']: dict(row)
+                for row in session.execute(sqlalchemy.select([module_table]))}
+        device_diff = _diff_rows(device_dict, existing_device_dict)
+        module_diff = _diff_rows(module_dict, existing_module_dict)
+        # removed: not in the response for the requested devices
+        removed_device_list = sorted(
+                key for key in existing_device_dict
+                if key not in device_dict
+                and device_id is None
+                and not get_favorites)
+        removed_module_list = sorted(
+                key for key, row in existing_module_dict.items()
+                if key not in module_dict
+                and row['device_id'] in device_dict)
+        # bulk insert & update in one transaction
+        for table, rows_dict, (added_list, changed_list) in (
+                (device_table, device_dict, device_diff),
+                (module_table, module_dict, module_diff)):
+            if added_list:
+                session.execute(
+                        table.insert(),
+                        [rows_dict[key] for key in added_list])
+            if changed_list:
+                session.execute(
+                        table.update()
+                        .where(table.c.id == sqlalchemy.bindparam('_id'))
+                        .values({
+                                column.name: sqlalchemy.bindparam(column.name)
+                                for column in table.columns
+                                if column.name != 'id'}),
+                        [dict(rows_dict[key], _id=key)
+                         for key in changed_list])
         session.commit()
         session.close()
+        result = RegisterResult(
+                added_devices=device_diff[0],
+                changed_devices=device_diff[1],
+                removed_devices=removed_device_list,
+                added_modules=module_diff[0],
+                changed_modules=module_diff[1],
+                removed_modules=removed_module_list)
+        self._logger.info('register: %s', result)
+        return result
 
     def unregister(self, device_id: str) -> None:
+        # measurements, rollups, watermarks, modules & device: Core deletes
+        # in one transaction (the ORM cascade loaded every measurement)
         self._logger.info('unregister device: %s', device_id)
-        session = self.session()
-        device: Optional[Device] = (
-                session
-                .query(Device)
-                .options(
-                        sqlalchemy.orm.joinedload(Device.modules)
-                        .joinedload(Module.measurements, innerjoin=True))
-                .filter_by(id=device_id)
-                .one_or_none())
-        if device is not None:
-            session.delete(device)
-            session.commit()
-        else:
-            self._logger.error('device is not registered')
-        session.close()
+        module_table = Module.__table__
+        device_table = Device.__table__
+        with self._engine.begin() as connection:
+            if connection.execute(
+                    sqlalchemy.select([device_table.c.id])
+                    .where(device_table.c.id == device_id)).first() is None:
+                self._logger.error('device is not registered')
+                return
+            module_id_list = [
+                    module_id for (module_id,) in connection.execute(
+                            sqlalchemy.select([module_table.c.id])
+                            .where(module_table.c.device_id == device_id))]
+            self._storage.delete(connection, module_id_list)
+            for table in [rollup.table for rollup in ROLLUP_LIST] + [
+                    ModuleSyncState.__table__]:
+                connection.execute(table.delete().where(
+                        table.c.module_id.in_(module_id_list)))
+            connection.execute(module_table.delete().where(
+                    module_table.c.device_id == device_id))
+            connection.execute(device_table.delete().where(
+                    device_table.c.id == device_id))
+        # outside of the SQL database: once the deletion is committed
+        self._storage.purge(module_id_list)
 
     def update(self,
                request_limit: Optional[int] = None,
-               min_update_interval: Optional[float] = 600) -> bool:
+               min_update_interval: Optional[float] = 600,
+               max_workers: int = 1) -> bool:
+        start_time = time.perf_counter()
+        # targets
         session = self.session()
+        latest_dict: Dict[str, int] = dict(
+                session.query(
+                        ModuleSyncState.module_id,
+                        ModuleSyncState.latest_timestamp))
+        # columns only: Module.device & Device.modules load eagerly
+        target_list = [
+                _UpdateTarget.create(
+                        module_id,
+                        device_id,
+                        data_type,
+                        timezone,
+                        latest_dict.get(module_id))
+                for module_id, device_id, data_type, timezone
+                in session.query(
+                        Module.id,
+                        Module.device_id,
+                        Module.data_type,
+                        Device.timezone).join(Module.device)]
+        session.close()
+        # fetch measurements in workers
+        counter = _RequestCounter(request_limit)
+        # bounded: the fetchers wait for the writer (backpressure)
+        page_queue: 'queue.Queue[_Page]' = queue.Queue(
+                maxsize=2 * max_workers)
         is_updated = False
-        request_count = 0
-        for module in session.query(Module).all():
-            self._logger.info('update module: %s', module.id)
-            type_list = data_type_to_type_list(module.data_type)
-            header = list(map(to_snake_case, type_list))
-            timezone = pytz.timezone(module.device.timezone)
-            while request_limit is None or request_count < request_limit:
-                # get latest timestamp
-                latest_row: Optional[Tuple[int]] = (
-                        session
-                        .query(Measurements.timestamp)
-                        .filter_by(module_id=module.id)
-                        .order_by(Measurements.timestamp.desc())
-                        .first())
-                latest: Optional[int] = (
-                        int(latest_row[0])
-                        if latest_row is not None
-                        else None)
+        session = self.session()
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix='pyatmo_update') as executor:
+            future_list = [
+                    executor.submit(
+                            self._fetch_measurements,
+                            target,
+                            counter,
+                            min_update_interval,
+                            page_queue)
+                    for target in target_list]
+            # insert into (single writer)
+            running = len(future_list)
+            try:
+                while running:
+                    module_id, rows = page_queue.get()
+                    if rows is None:
+                        running -= 1
+                        continue
+                    self._logger.debug(
+                            'insert %d measurements: %s',
+                            len(rows),
+                            module_id)
+                    is_updated = True
+                    self._metrics.increment(
+                            'pyatmo_update_rows_total',
+                            len(rows),
+                            module_id=module_id)
+                    self._write_rows(session, module_id, rows, latest_dict)
+                    session.commit()
+                    self._metrics.increment(
+                            'pyatmo_update_committed_rows_total',
+                            len(rows),
+                            module_id=module_id)
+            finally:
+                counter.stop()
+                session.close()
+                # on failure: release the fetchers blocked on the queue
+                while running:
+                    if page_queue.get()[1] is None:
+                        running -= 1
+        for future in future_list:
+            future.result()
+        self._metrics.observe(
+                'pyatmo_update_seconds',
+                time.perf_counter() - start_time)
+        return is_updated
+
+    def _write_rows(
+            self,
+            session: sqlalchemy.orm.session.Session,
+            module_id: str,
+            rows: List[Dict[str, Any]],
+            latest_dict: Dict[str, int]) -> None:
+        self._storage.insert(session.connection(), module_id, rows)
+        begin = min(row['timestamp'] for row in rows)
+        end = max(row['timestamp'] for row in rows)
+        if self._storage.source is not None:
+            refresh_rollup(
+                    session.connection(),
+                    module_id,
+                    begin,
+                    end,
+                    self._storage.source)
+        # watermark
+        if module_id not in latest_dict:
+            latest_dict[module_id] = end
+            session.execute(
+                    ModuleSyncState.__table__.insert(),
+                    {'module_id': module_id, 'latest_timestamp': end})
+        elif latest_dict[module_id] < end:
+            latest_dict[module_id] = end
+            session.execute(
+                    ModuleSyncState.__table__.update()
+                    .where(ModuleSyncState.module_id == module_id)
+                    .values(latest_timestamp=end))
+
+    def _fetch_measurements(
+            self,
+            target: '_UpdateTarget',
+            counter: '_RequestCounter',
+            min_update_interval: Optional[float],
+            page_queue: 'queue.Queue[_Page]') -> None:
+        try:
+            self._logger.info('update module: %s', target.module_id)
+            latest = target.latest
+            while True:
                 # check update interval
                 if (latest is not None
                         and min_update_interval is not None
@@ -155,20 +347,25 @@ class Database:
                             'update is skipped because time(%s) has not passed'
                             ' since the latest measurement(%s)',
                             datetime.timedelta(seconds=min_update_interval),
-                            datetime.datetime.fromtimestamp(latest, timezone))
+                            datetime.datetime.fromtimestamp(
+                                    latest,
+                                    target.timezone))
                     break
                 # request
+                if not counter.acquire():
+                    break
                 self._logger.info(
                         'update measurements from %s',
-                        datetime.datetime.fromtimestamp(latest, timezone)
+                        datetime.datetime.fromtimestamp(
+                                latest,
+                                target.timezone)
                         if latest is not None
                         else None)
-                request_count += 1
                 response = self._client.get_measure(
-                        device_id=module.device_id,
-                        module_id=module.id,
+                        device_id=target.device_id,
+                        module_id=target.module_id,
                         scale='max',
-                        type_list=type_list,
+                        type_list=target.type_list,
                         date_begin=latest + 1 if latest is not None else None,
                         optimize=True)
                 if response is None:
@@ -178,25 +375,21 @@ class Database:
                 if not response['body']:
                     self._logger.info('there is no latest measurement')
                     break
-                # insert into
-                is_updated = True
-                for value_set in response['body']:
-                    begin_time: int = value_set['beg_time']
-                    step_time: int = value_set.get('step_time', 0)
-                    for i, value in enumerate(value_set['value']):
-                        data: Dict[str, Any] = {}
-                        data['timestamp'] = begin_time + i * step_time
-                        data['module_id'] = module.id
-                        data.update(zip(header, value))
-                        measurements = Measurements(**data)
-                        session.add(measurements)
-                session.flush()
-                session.commit()
-        session.close()
-        return is_updated
+                rows = measurements_rows(
+                        target.module_id,
+                        target.header,
+                        response['body'])
+                # runs without values
+                if not rows:
+                    self._logger.info('there is no latest measurement')
+                    break
+                page_queue.put((target.module_id, rows))
+                latest = max(row['timestamp'] for row in rows)
+        finally:
+            page_queue.put((target.module_id, None))
 
     def device(self, device_id: str) -> Optional[Device]:
-        session = self.session()
+        session = self._read_session_maker()
         result: Optional[Device] = (
                 session.query(Device)
                 .options(sqlalchemy.orm.joinedload(Device.modules))
@@ -206,7 +399,7 @@ class Database:
         return result
 
     def all_device(self) -> List[Device]:
-        session = self.session()
+        session = self._read_session_maker()
         result: List[Device] = (
                 session.query(Device)
                 .options(sqlalchemy.orm.joinedload(Device.modules))
@@ -220,20 +413,282 @@ class Database:
             module: Module,
             begin_timestamp: Optional[int] = None,
             end_timestamp: Optional[int] = None) -> List[Measurements]:
+        return self._storage.measurements(
+                module,
+                begin_timestamp,
+                end_timestamp)
+
+    def measurement_columns(
+            self,
+            module: Module,
+            begin_timestamp: Optional[int] = None,
+            end_timestamp: Optional[int] = None,
+            column_list: Optional[List[str]] = None
+            ) -> Dict[str, 'numpy.ndarray']:
+        # numpy is an optional dependency: pip install pyatmo[numpy]
+        import numpy
+        if column_list is None:
+            column_list = list(map(
+                    to_snake_case,
+                    data_type_to_type_list(module.data_type)))
+        row_list = self._storage.select(
+                module.id,
+                begin_timestamp,
+                end_timestamp,
+                column_list)
+        value_list = list(zip(*row_list)) or [()] * (len(column_list) + 1)
+        result: Dict[str, numpy.ndarray] = {}
+        result['timestamp'] = numpy.array(value_list[0], dtype=numpy.int64)
+        for column, values in zip(column_list, value_list[1:]):
+            # NULL -> NaN
+            result[column] = numpy.array(values, dtype=numpy.float64)
+        return result
+
+    def measurement_frame(
+            self,
+            module: Module,
+            begin_timestamp: Optional[int] = None,
+            end_timestamp: Optional[int] = None,
+            column_list: Optional[List[str]] = None) -> 'pandas.DataFrame':
+        # pandas is an optional dependency: pip install pyatmo[pandas]
+        import pandas
+        columns = self.measurement_columns(
+                module,
+                begin_timestamp=begin_timestamp,
+                end_timestamp=end_timestamp,
+                column_list=column_list)
+        timestamp = columns.pop('timestamp')
+        return pandas.DataFrame(
+                columns,
+                index=pandas.to_datetime(timestamp, unit='s', utc=True)
+                .rename('timestamp'))
+
+    def aggregate(
+            self,
+            module: Module,
+            begin_timestamp: Optional[int] = None,
+            end_timestamp: Optional[int] = None,
+            bucket: Union[int, str] = '1h',
+            function_list: Optional[Sequence[str]] = None,
+            column_list: Optional[Sequence[str]] = None
+            ) -> List[Dict[str, Any]]:
+        # bucket: seconds or '<n><s|m|min|h|d|w>'
+        if function_list is None:
+            function_list = ['min', 'max', 'avg']
+        if column_list is None:
+            column_list = list(map(
+                    to_snake_case,
+                    data_type_to_type_list(module.data_type)))
+        bucket_size = bucket_seconds(bucket)
+        source = self._storage.source
+        if source is None:
+            # stored outside of the SQL database: aggregated in Python
+            return aggregate_rows(
+                    self._storage.select(
+                            module.id,
+                            begin_timestamp,
+                            end_timestamp,
+                            column_list),
+                    bucket_size,
+                    function_list,
+                    column_list)
+        rollup = select_rollup(bucket_size, begin_timestamp, end_timestamp)
+        with self._read_engine.connect() as connection:
+            return aggregate(
+                    connection,
+                    rollup.table if rollup is not None else source,
+                    rollup.partials
+                    if rollup is not None
+                    else value_partials(source),
+                    module.id,
+                    begin_timestamp,
+                    end_timestamp,
+                    bucket_size,
+                    function_list,
+                    column_list)
+
+    def export_archive(
+            self,
+            directory: pathlib.Path,
+            module_list: Optional[List[Module]] = None
+            ) -> List[pathlib.Path]:
+        # <directory>/<module id>/<YYYY-MM>.pyatmo
+        if module_list is None:
+            module_list = [
+                    module
+                    for device in self.all_device()
+                    for module in device.modules]
+        result: List[pathlib.Path] = []
+        for module in module_list:
+            column_list = list(map(
+                    to_snake_case,
+                    data_type_to_type_list(module.data_type)))
+            month_set = set(
+                    month_range(timestamp)
+                    for (timestamp,) in self._storage.select(
+                            module.id,
+                            None,
+                            None,
+                            []))
+            for begin, end in sorted(month_set):
+                path = archive_path(directory, module.id, begin)
+                self._logger.debug('export archive: %s', path)
+                write_archive(
+                        path,
+                        module.id,
+                        column_list,
+                        self._storage.select(
+                                module.id,
+                                begin,
+                                end - 1,
+                                column_list))
+                result.append(path)
+        return result
+
+    def import_archive(self, directory: pathlib.Path) -> int:
+        # returns the number of rows read (stored rows are ignored)
         session = self.session()
-        query = (session
-                 .query(Measurements)
-                 .filter_by(module_id=module.id)
-                 .options(sqlalchemy.orm.joinedload(Measurements.module))
-                 .order_by(Measurements.timestamp))
-        if begin_timestamp is not None:
-            query = query.filter(Measurements.timestamp >= begin_timestamp)
-        if end_timestamp is not None:
-            query = query.filter(Measurements.timestamp <= end_timestamp)
-        result = query.all()
-        session.close()
+        module_id_set = set(
+                module_id for (module_id,) in session.query(Module.id))
+        latest_dict: Dict[str, int] = dict(
+                session.query(
+                        ModuleSyncState.module_id,
+                        ModuleSyncState.latest_timestamp))
+        result = 0
+        try:
+            for path in sorted(directory.glob('*/*' + ARCHIVE_SUFFIX)):
+                with ArchiveReader(path) as reader:
+                    if reader.module_id not in module_id_set:
+                        self._logger.error(
+                                'module is not registered: %s',
+                                reader.module_id)
+                        continue
+                    header = ['timestamp'] + reader.column_list
+                    rows = [
+                            dict(zip(header, row), module_id=reader.module_id)
+                            for row in reader.read()]
+                if not rows:
+                    continue
+                self._logger.debug(
+                        'import %d measurements: %s',
+                        len(rows),
+                        path)
+                self._write_rows(
+                        session,
+                        rows[0]['module_id'],
+                        rows,
+                        latest_dict)
+                session.commit()
+                result += len(rows)
+        finally:
+            session.close()
         return result
 
+    def rebuild_rollup(self) -> None:
+        self._logger.info('rebuild rollup')
+        source = self._storage.source
+        if source is None:
+            return
+        session = self.session()
+        for module in session.query(Module).all():
+            self._logger.debug('rebuild rollup: %s', module.id)
+            refresh_rollup(
+                    session.connection(),
+                    module.id,
+                    measurements=source)
+        session.commit()
+        session.close()
+
+
+class RegisterResult(NamedTuple):
+    # device/module ids
+    added_devices: List[str]
+    changed_devices: List[str]
+    # registered devices missing from getstationsdata (not unregistered)
+    removed_devices: List[str]
+    added_modules: List[str]
+    changed_modules: List[str]
+    # registered modules missing from their device (not unregistered)
+    removed_modules: List[str]
+
+
+class _UpdateTarget(NamedTuple):
+    module_id: str
+    device_id: str
+    type_list: List[str]
+    header: List[str]
+    timezone: datetime.tzinfo
+    latest: Optional[int]
+
+    @classmethod
+    def create(
+            cls,
+            module_id: str,
+            device_id: str,
+            data_type: str,
+            timezone: str,
+            latest: Optional[int]) -> '_UpdateTarget':
+        import pytz
+        type_list = data_type_to_type_list(data_type)
+        return cls(
+                module_id=module_id,
+                device_id=device_id,
+                type_list=type_list,
+                header=list(map(to_snake_case, type_list)),
+                timezone=pytz.timezone(timezone),
+                latest=latest)
+
+
+class _RequestCounter:
+    def __init__(self, limit: Optional[int]) -> None:
+        self._limit = limit
+        self._count = 0
+        self._is_stopped = False
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            if self._is_stopped:
+                return False
+            if self._limit is not None and self._count >= self._limit:
+                return False
+            self._count += 1
+            return True
+
+    def stop(self) -> None:
+        with self._lock:
+            self._is_stopped = True
+
+
+def _diff_rows(
+        rows_dict: Dict[str, Dict[str, Any]],
+        existing_dict: Dict[str, Dict[str, Any]]
+        ) -> Tuple[List[str], List[str]]:
+    # (added ids, changed ids)
+    added_list: List[str] = []
+    changed_list: List[str] = []
+    for key, row in rows_dict.items():
+        existing = existing_dict.get(key)
+        if existing is None:
+            added_list.append(key)
+        elif any(existing.get(name) != value for name, value in row.items()):
+            changed_list.append(key)
+    return sorted(added_list), sorted(changed_list)
+
+
+def measurements_rows(
+        module_id: str,
+        header: List[str],
+        body: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    result: List[Dict[str, Any]] = []
+    for timestamp, value in expand_measure(body):
+        row: Dict[str, Any] = dict.fromkeys(header)
+        row['timestamp'] = timestamp
+        row['module_id'] = module_id
+        row.update(zip(header, value))
+        result.append(row)
+    return result
+
 
 def to_snake_case(string: str) -> str:
     string = re.sub('(.)([A-Z][a-z]+)', r'\1_\2', string)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from typing import Optional
+import sqlalchemy
+from ._rollup import ROLLUP_LIST, refresh_rollup
+from ._sqlalchemy import _DeclarativeBase
+from ._table import Measurements, Module, ModuleSyncState, SchemaVersion
+
+
+# increment when a table, an index or a migration step is added
+SCHEMA_VERSION = 1
+
+
+def migrate(
+        engine: sqlalchemy.engine.Engine,
+        logger: logging.Logger) -> None:
+    # up to date: one query instead of create_all (a query per table)
+    version = schema_version(engine)
+    if version is not None and version >= SCHEMA_VERSION:
+        if version > SCHEMA_VERSION:
+            logger.warning(
+                    'schema version %s is newer than %s',
+                    version,
+                    SCHEMA_VERSION)
+        return
+    logger.info('migrate: schema version %s -> %s', version, SCHEMA_VERSION)
+    # tables added after the database was created
+    is_rollup_missing = not all(
+            engine.has_table(rollup.table.name)
+            for rollup in ROLLUP_LIST)
+    is_sync_state_missing = not engine.has_table(
+            ModuleSyncState.__tablename__)
+    # create missing tables
+    _DeclarativeBase.metadata.create_all(engine)
+    with engine.begin() as connection:
+        # index on (module_id, timestamp)
+        for index in Measurements.__table__.indexes:
+            connection.execute(sqlalchemy.text(
+                    'CREATE INDEX IF NOT EXISTS {0} ON {1} ({2})'.format(
+                            index.name,
+                            index.table.name,
+                            ', '.join(column.name
+                                      for column in index.columns))))
+        if is_rollup_missing:
+            logger.info('migrate: rebuild rollup')
+            for (module_id,) in connection.execute(
+                    sqlalchemy.select([Module.__table__.c.id])):
+                refresh_rollup(connection, module_id)
+        if is_sync_state_missing:
+            logger.info('migrate: module sync state')
+            measurements = Measurements.__table__
+            connection.execute(
+                    ModuleSyncState.__table__.insert().from_select(
+                            ['module_id', 'latest_timestamp'],
+                            sqlalchemy
+                            .select([
+                                    measurements.c.module_id,
+                                    sqlalchemy.func.max(
+                                            measurements.c.timestamp)])
+                            .group_by(measurements.c.module_id)))
+        # version
+        connection.execute(SchemaVersion.__table__.delete())
+        connection.execute(
+                SchemaVersion.__table__.insert(),
+                {'version': SCHEMA_VERSION})
+
+
+def schema_version(engine: sqlalchemy.engine.Engine) -> Optional[int]:
+    # None: created before versioning (no schema_version table) or empty
+    try:
+        with engine.connect() as connection:
+            return connection.execute(sqlalchemy.select([
+                    sqlalchemy.func.max(
+                            SchemaVersion.__table__.c.version)])).scalar()
+    except sqlalchemy.exc.DBAPIError:
+        return None
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+from typing import Any, Dict, List, NamedTuple, Optional
+import sqlalchemy
+from ._aggregate import PartialColumns, value_partials
+from ._table import (
+        MEASUREMENTS_ANGLE_COLUMNS, MEASUREMENTS_VALUE_COLUMNS, Measurements,
+        MeasurementsDaily, MeasurementsHourly)
+
+
+class Rollup(NamedTuple):
+    table: sqlalchemy.Table
+    bucket: int
+    # aggregated from (None: the measurements of the storage)
+    source: Optional[sqlalchemy.Table]
+
+    @property
+    def partials(self) -> PartialColumns:
+        return rollup_partials(self.table)
+
+    def refresh(
+            self,
+            connection: sqlalchemy.engine.Connection,
+            module_id: str,
+            begin_timestamp: Optional[int] = None,
+            end_timestamp: Optional[int] = None,
+            measurements: sqlalchemy.sql.FromClause = Measurements.__table__
+            ) -> None:
+        # recompute the buckets containing [begin_timestamp, end_timestamp]
+        # measurements: Storage.source
+        if self.source is not None:
+            source: sqlalchemy.sql.FromClause = self.source
+            source_partials = rollup_partials(self.source)
+        else:
+            source = measurements
+            source_partials = value_partials(measurements)
+        delete = self.table.delete().where(
+                self.table.c.module_id == module_id)
+        timestamp = source.c.timestamp - source.c.timestamp % self.bucket
+        select_list: List[Any] = [
+                timestamp.label('timestamp'),
+                source.c.module_id]
+        name_list = ['timestamp', 'module_id']
+        for column in MEASUREMENTS_VALUE_COLUMNS:
+            for key, expression in source_partials(column).items():
+                select_list.append(expression)
+                name_list.append('{0}_{1}'.format(column, key))
+        select = (sqlalchemy
+                  .select(select_list)
+                  .where(source.c.module_id == module_id)
+                  .group_by(timestamp, source.c.module_id))
+        if begin_timestamp is not None:
+            begin = begin_timestamp - begin_timestamp % self.bucket
+            delete = delete.where(self.table.c.timestamp >= begin)
+            select = select.where(source.c.timestamp >= begin)
+        if end_timestamp is not None:
+            end = end_timestamp - end_timestamp % self.bucket + self.bucket
+            delete = delete.where(self.table.c.timestamp < end)
+            select = select.where(source.c.timestamp < end)
+        connection.execute(delete)
+        connection.execute(
+                self.table.insert().from_select(name_list, select))
+
+    def is_applicable(
+            self,
+            bucket: int,
+            begin_timestamp: Optional[int],
+            end_timestamp: Optional[int]) -> bool:
+        # bucket boundaries must coincide with the rollup boundaries
+        return (bucket % self.bucket == 0
+                and (begin_timestamp is None
+                     or begin_timestamp % self.bucket == 0)
+                and (end_timestamp is None
+                     or (end_timestamp + 1) % self.bucket == 0))
+
+
+def rollup_partials(table: sqlalchemy.Table) -> PartialColumns:
+    def partials(column: str) -> Dict[str, Any]:
+        def value(key: str) -> sqlalchemy.Column:
+            return table.c['{0}_{1}'.format(column, key)]
+        result: Dict[str, Any] = {
+                'count': sqlalchemy.func.sum(value('count')),
+                'min': sqlalchemy.func.min(value('min')),
+                'max': sqlalchemy.func.max(value('max')),
+                'sum': sqlalchemy.func.sum(value('sum'))}
+        if column in MEASUREMENTS_ANGLE_COLUMNS:
+            result['sin'] = sqlalchemy.func.sum(value('sin'))
+            result['cos'] = sqlalchemy.func.sum(value('cos'))
+        return result
+    return partials
+
+
+# in order of refresh: finer to coarser
+ROLLUP_LIST = [
+        Rollup(
+                table=MeasurementsHourly.__table__,
+                bucket=MeasurementsHourly.bucket,
+                source=None),
+        Rollup(
+                table=MeasurementsDaily.__table__,
+                bucket=MeasurementsDaily.bucket,
+                source=MeasurementsHourly.__table__)]
+
+
+def refresh_rollup(
+        connection: sqlalchemy.engine.Connection,
+        module_id: str,
+        begin_timestamp: Optional[int] = None,
+        end_timestamp: Optional[int] = None,
+        measurements: sqlalchemy.sql.FromClause = Measurements.__table__
+        ) -> None:
+    for rollup in ROLLUP_LIST:
+        rollup.refresh(
+                connection,
+                module_id,
+                begin_timestamp,
+                end_timestamp,
+                measurements)
+
+
+def select_rollup(
+        bucket: int,
+        begin_timestamp: Optional[int],
+        end_timestamp: Optional[int]) -> Optional[Rollup]:
+    # coarsest rollup satisfying the resolution
+    for rollup in reversed(ROLLUP_LIST):
+        if rollup.is_applicable(bucket, begin_timestamp, end_timestamp):
+            return rollup
+    return None
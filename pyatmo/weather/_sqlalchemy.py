@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 
 import enum
-from typing import Union
+import pathlib
+import urllib.parse
+from typing import Any, List, NamedTuple, Optional, Union
+import sqlalchemy
 import sqlalchemy.ext.declarative
 
 
@@ -18,4 +21,74 @@ class SQLLoggingLevel(enum.Enum):
         return False
 
 
+class SQLiteProfile(NamedTuple):
+    # PRAGMA journal_mode / synchronous / mmap_size / cache_size / temp_store
+    journal_mode: Optional[str] = None
+    synchronous: Optional[str] = None
+    mmap_size: Optional[int] = None
+    cache_size: Optional[int] = None
+    temp_store: Optional[str] = None
+    # milliseconds to wait for a lock instead of 'database is locked'
+    busy_timeout: Optional[int] = None
+    # read-only connections used by queries (0: share the writer)
+    reader_pool_size: int = 0
+
+    @classmethod
+    def performance(cls) -> 'SQLiteProfile':
+        return cls(
+                journal_mode='wal',
+                synchronous='normal',
+                mmap_size=256 * 1024 * 1024,
+                cache_size=-64 * 1024,
+                temp_store='memory',
+                busy_timeout=5000,
+                reader_pool_size=4)
+
+    def pragma_list(self, read_only: bool = False) -> List[str]:
+        result: List[str] = []
+        # journal mode is persistent and set by the writer
+        if self.journal_mode is not None and not read_only:
+            result.append('journal_mode = {0}'.format(self.journal_mode))
+        if self.synchronous is not None:
+            result.append('synchronous = {0}'.format(self.synchronous))
+        if self.mmap_size is not None:
+            result.append('mmap_size = {0:d}'.format(self.mmap_size))
+        if self.cache_size is not None:
+            result.append('cache_size = {0:d}'.format(self.cache_size))
+        if self.temp_store is not None:
+            result.append('temp_store = {0}'.format(self.temp_store))
+        if self.busy_timeout is not None:
+            result.append('busy_timeout = {0:d}'.format(self.busy_timeout))
+        if read_only:
+            result.append('query_only = 1')
+        return result
+
+    def create_engine(
+            self,
+            path: pathlib.Path,
+            read_only: bool = False,
+            **kwargs) -> sqlalchemy.engine.Engine:
+        if read_only:
+            url = 'sqlite:///file:{0}?mode=ro&uri=true'.format(
+                    urllib.parse.quote(path.as_posix()))
+        else:
+            url = 'sqlite:///{0}'.format(path.as_posix())
+        # keep connections open so that PRAGMAs run once per connection
+        engine = sqlalchemy.create_engine(
+                url,
+                poolclass=sqlalchemy.pool.QueuePool,
+                pool_size=max(1, self.reader_pool_size) if read_only else 1,
+                connect_args={'check_same_thread': False},
+                **kwargs)
+        pragma_list = self.pragma_list(read_only=read_only)
+
+        def on_connect(dbapi_connection: Any, connection_record: Any) -> None:
+            cursor = dbapi_connection.cursor()
+            for pragma in pragma_list:
+                cursor.execute('PRAGMA {0}'.format(pragma))
+            cursor.close()
+        sqlalchemy.event.listen(engine, 'connect', on_connect)
+        return engine
+
+
 _DeclarativeBase = sqlalchemy.ext.declarative.declarative_base()
@@ -0,0 +1,452 @@
+# -*- coding: utf-8 -*-
+
+import abc
+import csv
+import datetime
+import io
+import os
+import pathlib
+import shutil
+import tempfile
+import urllib.parse
+from typing import (
+        Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple)
+import sqlalchemy
+from ._table import (
+        MEASUREMENTS_VALUE_COLUMNS, Measurements, MeasurementsLong, Module)
+
+
+# dialects which ignore the rows already stored on insert
+SQL_DIALECTS = ('sqlite', 'postgresql')
+
+
+class Storage(abc.ABC):
+    @property
+    def source(self) -> Optional[sqlalchemy.sql.FromClause]:
+        # (module_id, timestamp, *value columns) in the SQL database:
+        # source of the rollups & aggregate, None if stored elsewhere
+        return None
+
+    def bind(
+            self,
+            engine: sqlalchemy.engine.Engine,
+            read_engine: sqlalchemy.engine.Engine) -> None:
+        pass
+
+    @abc.abstractmethod
+    def insert(
+            self,
+            connection: sqlalchemy.engine.Connection,
+            module_id: str,
+            rows: List[Dict[str, Any]]) -> None:
+        # rows already stored are ignored
+        pass
+
+    @abc.abstractmethod
+    def select(
+            self,
+            module_id: str,
+            begin_timestamp: Optional[int],
+            end_timestamp: Optional[int],
+            column_list: Sequence[str]) -> List[Tuple[Any, ...]]:
+        # [(timestamp, *columns)] ordered by timestamp
+        pass
+
+    @abc.abstractmethod
+    def delete(
+            self,
+            connection: sqlalchemy.engine.Connection,
+            module_id_list: List[str]) -> None:
+        # before the modules are deleted in the same transaction
+        pass
+
+    def purge(self, module_id_list: List[str]) -> None:
+        # after the transaction of delete is committed:
+        # data outside of the SQL database
+        pass
+
+    def measurements(
+            self,
+            module: Module,
+            begin_timestamp: Optional[int],
+            end_timestamp: Optional[int]) -> List[Measurements]:
+        # transient objects
+        return [
+                Measurements(
+                        module_id=module.id,
+                        module=module,
+                        **dict(zip(('timestamp',) + MEASUREMENTS_VALUE_COLUMNS,
+                                   row)))
+                for row in self.select(
+                        module.id,
+                        begin_timestamp,
+                        end_timestamp,
+                        MEASUREMENTS_VALUE_COLUMNS)]
+
+
+class SQLStorage(Storage):
+    def __init__(self) -> None:
+        self._read_engine: Optional[sqlalchemy.engine.Engine] = None
+        self._read_session_maker: Optional[sqlalchemy.orm.sessionmaker] = None
+
+    def bind(
+            self,
+            engine: sqlalchemy.engine.Engine,
+            read_engine: sqlalchemy.engine.Engine) -> None:
+        check_dialect(engine)
+        self._read_engine = read_engine
+        self._read_session_maker = sqlalchemy.orm.sessionmaker(
+                bind=read_engine)
+
+    @property
+    def source(self) -> Optional[sqlalchemy.sql.FromClause]:
+        return Measurements.__table__
+
+    def insert(
+            self,
+            connection: sqlalchemy.engine.Connection,
+            module_id: str,
+            rows: List[Dict[str, Any]]) -> None:
+        table = Measurements.__table__
+        dialect = connection.dialect.name
+        if dialect == 'sqlite':
+            connection.execute(table.insert().prefix_with('OR IGNORE'), rows)
+        else:
+            create_partitions(connection, rows)
+            copy_measurements(connection, rows)
+
+    def select(
+            self,
+            module_id: str,
+            begin_timestamp: Optional[int],
+            end_timestamp: Optional[int],
+            column_list: Sequence[str]) -> List[Tuple[Any, ...]]:
+        assert self._read_engine is not None
+        table = Measurements.__table__
+        query = (sqlalchemy
+                 .select([table.c.timestamp]
+                         + [table.c[column] for column in column_list])
+                 .where(table.c.module_id == module_id)
+                 .order_by(table.c.timestamp))
+        if begin_timestamp is not None:
+            query = query.where(table.c.timestamp >= begin_timestamp)
+        if end_timestamp is not None:
+            query = query.where(table.c.timestamp <= end_timestamp)
+        with self._read_engine.connect() as connection:
+            return [tuple(row) for row in connection.execute(query)]
+
+    def delete(
+            self,
+            connection: sqlalchemy.engine.Connection,
+            module_id_list: List[str]) -> None:
+        table = Measurements.__table__
+        connection.execute(table.delete().where(
+                table.c.module_id.in_(module_id_list)))
+
+    def measurements(
+            self,
+            module: Module,
+            begin_timestamp: Optional[int],
+            end_timestamp: Optional[int]) -> List[Measurements]:
+        assert self._read_session_maker is not None
+        session = self._read_session_maker()
+        query = (session
+                 .query(Measurements)
+                 .filter_by(module_id=module.id)
+                 .options(sqlalchemy.orm.joinedload(Measurements.module))
+                 .order_by(Measurements.timestamp))
+        if begin_timestamp is not None:
+            query = query.filter(Measurements.timestamp >= begin_timestamp)
+        if end_timestamp is not None:
+            query = query.filter(Measurements.timestamp <= end_timestamp)
+        result = query.all()
+        session.close()
+        return result
+
+
+class LongStorage(Storage):
+    # measurements_long: (module_id, timestamp, type, value)
+    # only non-NULL values are stored
+    def __init__(self) -> None:
+        self._read_engine: Optional[sqlalchemy.engine.Engine] = None
+        # pivot to the measurements columns: the filters on module_id &
+        # timestamp are pushed down to the primary key by the database
+        table = MeasurementsLong.__table__
+        self._source = (
+                sqlalchemy
+                .select([table.c.module_id, table.c.timestamp] + [
+                        sqlalchemy.func.max(sqlalchemy.case(
+                                [(table.c.type == type_code,
+                                  table.c.value)]))
+                        .label(column)
+                        for type_code, column
+                        in enumerate(MEASUREMENTS_VALUE_COLUMNS)])
+                .group_by(table.c.module_id, table.c.timestamp)
+                .alias('measurements_pivot'))
+
+    def bind(
+            self,
+            engine: sqlalchemy.engine.Engine,
+            read_engine: sqlalchemy.engine.Engine) -> None:
+        check_dialect(engine)
+        self._read_engine = read_engine
+
+    @property
+    def source(self) -> Optional[sqlalchemy.sql.FromClause]:
+        return self._source
+
+    def insert(
+            self,
+            connection: sqlalchemy.engine.Connection,
+            module_id: str,
+            rows: List[Dict[str, Any]]) -> None:
+        table = MeasurementsLong.__table__
+        value_rows = [
+                {'module_id': module_id,
+                 'timestamp': row['timestamp'],
+                 'type': type_code,
+                 'value': row[column]}
+                for row in rows
+                for type_code, column in enumerate(MEASUREMENTS_VALUE_COLUMNS)
+                if row.get(column) is not None]
+        if not value_rows:
+            return
+        dialect = connection.dialect.name
+        if dialect == 'sqlite':
+            connection.execute(
+                    table.insert().prefix_with('OR IGNORE'),
+                    value_rows)
+        else:
+            import sqlalchemy.dialects.postgresql
+            connection.execute(
+                    sqlalchemy.dialects.postgresql.insert(table)
+                    .on_conflict_do_nothing(),
+                    value_rows)
+
+    def select(
+            self,
+            module_id: str,
+            begin_timestamp: Optional[int],
+            end_timestamp: Optional[int],
+            column_list: Sequence[str]) -> List[Tuple[Any, ...]]:
+        # pivot: MAX(CASE WHEN type = <code> THEN value END) AS <column>
+        assert self._read_engine is not None
+        table = MeasurementsLong.__table__
+        type_list = [
+                MEASUREMENTS_VALUE_COLUMNS.index(column)
+                for column in column_list]
+        query = (sqlalchemy
+                 .select([table.c.timestamp] + [
+                         sqlalchemy.func.max(sqlalchemy.case(
+                                 [(table.c.type == type_code,
+                                   table.c.value)]))
+                         .label(column)
+                         for type_code, column in zip(type_list, column_list)])
+                 .where(table.c.module_id == module_id)
+                 .group_by(table.c.timestamp)
+                 .order_by(table.c.timestamp))
+        if type_list:
+            query = query.where(table.c.type.in_(type_list))
+        if begin_timestamp is not None:
+            query = query.where(table.c.timestamp >= begin_timestamp)
+        if end_timestamp is not None:
+            query = query.where(table.c.timestamp <= end_timestamp)
+        with self._read_engine.connect() as connection:
+            return [tuple(row) for row in connection.execute(query)]
+
+    def delete(
+            self,
+            connection: sqlalchemy.engine.Connection,
+            module_id_list: List[str]) -> None:
+        table = MeasurementsLong.__table__
+        connection.execute(table.delete().where(
+                table.c.module_id.in_(module_id_list)))
+
+
+class ParquetStorage(Storage):
+    # <directory>/<module id>/<YYYY-MM>.parquet
+    def __init__(self, directory: pathlib.Path) -> None:
+        # pyarrow is an optional dependency: pip install pyatmo[parquet]
+        import pyarrow
+        import pyarrow.parquet
+        self._pyarrow = pyarrow
+        self._parquet = pyarrow.parquet
+        self._directory = directory
+        self._schema = pyarrow.schema(
+                [('timestamp', pyarrow.int64())]
+                + [(column, pyarrow.float64())
+                   for column in MEASUREMENTS_VALUE_COLUMNS])
+
+    def insert(
+            self,
+            connection: sqlalchemy.engine.Connection,
+            module_id: str,
+            rows: List[Dict[str, Any]]) -> None:
+        for (begin, _), month_rows in group_by_month(rows):
+            path = self._path(module_id, begin)
+            existing = None
+            timestamp_set: Set[int] = set()
+            if path.exists():
+                existing = self._parquet.read_table(path, schema=self._schema)
+                timestamp_set.update(existing.column('timestamp').to_pylist())
+            # stored or duplicated in rows: the first one is kept
+            new_rows: List[Dict[str, Any]] = []
+            for row in month_rows:
+                if row['timestamp'] not in timestamp_set:
+                    timestamp_set.add(row['timestamp'])
+                    new_rows.append(
+                            {name: row.get(name)
+                             for name in self._schema.names})
+            if not new_rows:
+                continue
+            table = self._pyarrow.Table.from_pylist(
+                    new_rows,
+                    schema=self._schema)
+            if existing is not None:
+                table = self._pyarrow.concat_tables([existing, table])
+            self._write_table(path, table.sort_by('timestamp'))
+
+    def select(
+            self,
+            module_id: str,
+            begin_timestamp: Optional[int],
+            end_timestamp: Optional[int],
+            column_list: Sequence[str]) -> List[Tuple[Any, ...]]:
+        filters: List[Tuple[str, str, int]] = []
+        if begin_timestamp is not None:
+            filters.append(('timestamp', '>=', begin_timestamp))
+        if end_timestamp is not None:
+            filters.append(('timestamp', '<=', end_timestamp))
+        result: List[Tuple[Any, ...]] = []
+        for path in sorted(self._module_directory(module_id).glob(
+                '*.parquet')):
+            begin, end = month_range(_month_timestamp(path.stem))
+            if ((begin_timestamp is not None and end <= begin_timestamp)
+                    or (end_timestamp is not None and end_timestamp < begin)):
+                continue
+            table = self._parquet.read_table(
+                    path,
+                    columns=['timestamp'] + list(column_list),
+                    filters=filters or None)
+            result.extend(zip(*(table.column(name).to_pylist()
+                                for name in table.column_names)))
+        return result
+
+    def delete(
+            self,
+            connection: sqlalchemy.engine.Connection,
+            module_id_list: List[str]) -> None:
+        # the files are deleted by purge: kept if the transaction fails
+        pass
+
+    def purge(self, module_id_list: List[str]) -> None:
+        for module_id in module_id_list:
+            directory = self._module_directory(module_id)
+            if directory.exists():
+                shutil.rmtree(directory)
+
+    def _write_table(self, path: pathlib.Path, table: Any) -> None:
+        # atomic replace: readers never see a partial file
+        # unique temporary file per write: concurrent writers
+        path.parent.mkdir(parents=True, exist_ok=True)
+        file_descriptor, temporary_name = tempfile.mkstemp(
+                dir=str(path.parent),
+                prefix='{0}.'.format(path.name),
+                suffix='.tmp')
+        os.close(file_descriptor)
+        try:
+            self._parquet.write_table(table, temporary_name)
+            os.replace(temporary_name, str(path))
+        except BaseException:
+            os.unlink(temporary_name)
+            raise
+
+    def _module_directory(self, module_id: str) -> pathlib.Path:
+        return self._directory.joinpath(
+                urllib.parse.quote(module_id, safe=''))
+
+    def _path(self, module_id: str, timestamp: int) -> pathlib.Path:
+        return self._module_directory(module_id).joinpath(
+                '{0:%Y-%m}.parquet'.format(datetime.datetime.fromtimestamp(
+                        timestamp,
+                        datetime.timezone.utc)))
+
+
+def check_dialect(engine: sqlalchemy.engine.Engine) -> None:
+    # other dialects would raise IntegrityError on overlapping windows
+    if engine.dialect.name not in SQL_DIALECTS:
+        raise ValueError('unsupported dialect: {0}'.format(
+                engine.dialect.name))
+
+
+def month_range(timestamp: int) -> Tuple[int, int]:
+    # [begin, end) of the month (UTC) containing timestamp
+    date = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+    begin = date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    end = (begin + datetime.timedelta(days=32)).replace(day=1)
+    return int(begin.timestamp()), int(end.timestamp())
+
+
+def group_by_month(
+        rows: List[Dict[str, Any]]
+        ) -> Iterator[Tuple[Tuple[int, int], List[Dict[str, Any]]]]:
+    group: Dict[Tuple[int, int], List[Dict[str, Any]]] = {}
+    for row in rows:
+        group.setdefault(month_range(row['timestamp']), []).append(row)
+    return iter(sorted(group.items()))
+
+
+def create_partitions(
+        connection: sqlalchemy.engine.Connection,
+        rows: List[Dict[str, Any]]) -> None:
+    # PostgreSQL: measurements is partitioned by month (RANGE (timestamp))
+    table = Measurements.__table__
+    for (begin, end), _ in group_by_month(rows):
+        connection.execute(sqlalchemy.text(
+                'CREATE TABLE IF NOT EXISTS {0}_{1:%Y%m} PARTITION OF {0}'
+                ' FOR VALUES FROM ({2:d}) TO ({3:d})'.format(
+                        table.name,
+                        datetime.datetime.fromtimestamp(
+                                begin,
+                                datetime.timezone.utc),
+                        begin,
+                        end)))
+
+
+def copy_measurements(
+        connection: sqlalchemy.engine.Connection,
+        rows: List[Dict[str, Any]]) -> None:
+    # PostgreSQL: COPY into a temporary table and merge it ignoring conflicts
+    table = Measurements.__table__
+    name_list = [column.name for column in table.columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        # empty unquoted field: NULL
+        writer.writerow(
+                ['' if row.get(name) is None else row[name]
+                 for name in name_list])
+    buffer.seek(0)
+    names = ', '.join(name_list)
+    connection.execute(sqlalchemy.text(
+            'CREATE TEMPORARY TABLE IF NOT EXISTS {0}_copy'
+            ' (LIKE {0} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS'.format(
+                    table.name)))
+    cursor = connection.connection.cursor()
+    cursor.copy_expert(
+            'COPY {0}_copy ({1}) FROM STDIN WITH (FORMAT csv)'.format(
+                    table.name,
+                    names),
+            buffer)
+    cursor.close()
+    connection.execute(sqlalchemy.text(
+            'INSERT INTO {0} ({1}) SELECT {1} FROM {0}_copy'
+            ' ON CONFLICT DO NOTHING'.format(table.name, names)))
+    connection.execute(sqlalchemy.text(
+            'TRUNCATE {0}_copy'.format(table.name)))
+
+
+def _month_timestamp(stem: str) -> int:
+    return int(datetime.datetime.strptime(stem, '%Y-%m')
+               .replace(tzinfo=datetime.timezone.utc)
+               .timestamp())
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+from typing import Any, Dict
 import sqlalchemy
 from ._sqlalchemy import _DeclarativeBase
 
@@ -69,6 +70,14 @@ class Module(_DeclarativeBase):
 class Measurements(_DeclarativeBase):
     # table name
     __tablename__ = 'measurements'
+    # index: range reads per module
+    # PostgreSQL: partitioned by month (see _storage.create_partitions)
+    __table_args__ = (
+            sqlalchemy.Index(
+                    'ix_measurements_module_id_timestamp',
+                    'module_id',
+                    'timestamp'),
+            {'postgresql_partition_by': 'RANGE (timestamp)'})
     # column
     timestamp = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
     module_id = sqlalchemy.Column(
@@ -99,3 +108,110 @@ class Measurements(_DeclarativeBase):
                         '{0}={1}'.format(column.key,
                                          repr(getattr(self, column.key)))
                         for column in mapper.column_attrs))
+
+
+class ModuleSyncState(_DeclarativeBase):
+    # table name
+    __tablename__ = 'module_sync_state'
+    # column
+    module_id = sqlalchemy.Column(
+            sqlalchemy.String,
+            sqlalchemy.ForeignKey('modules.id'),
+            primary_key=True)
+    latest_timestamp = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)
+
+    def __repr__(self) -> str:
+        mapper = sqlalchemy.inspect(self.__class__)
+        return '{0}.{1}({2})'.format(
+                self.__class__.__module__,
+                self.__class__.__name__,
+                ', '.join(
+                        '{0}={1}'.format(column.key,
+                                         repr(getattr(self, column.key)))
+                        for column in mapper.column_attrs))
+
+
+class SchemaVersion(_DeclarativeBase):
+    # table name
+    __tablename__ = 'schema_version'
+    # column: a single row
+    version = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+
+    def __repr__(self) -> str:
+        mapper = sqlalchemy.inspect(self.__class__)
+        return '{0}.{1}({2})'.format(
+                self.__class__.__module__,
+                self.__class__.__name__,
+                ', '.join(
+                        '{0}={1}'.format(column.key,
+                                         repr(getattr(self, column.key)))
+                        for column in mapper.column_attrs))
+
+
+# numeric columns of Measurements (temperature ... gust_angle)
+MEASUREMENTS_VALUE_COLUMNS = tuple(
+        column.name for column in Measurements.__table__.columns
+        if column.name not in ('timestamp', 'module_id'))
+# angles in degrees: averaged as circular mean
+MEASUREMENTS_ANGLE_COLUMNS = ('wind_angle', 'gust_angle')
+
+
+class MeasurementsLong(_DeclarativeBase):
+    # table name
+    __tablename__ = 'measurements_long'
+    # SQLite: clustered by the primary key
+    __table_args__ = {'sqlite_with_rowid': False}
+    # column
+    module_id = sqlalchemy.Column(
+            sqlalchemy.String,
+            sqlalchemy.ForeignKey('modules.id'),
+            primary_key=True)
+    timestamp = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    # index in MEASUREMENTS_VALUE_COLUMNS
+    type = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    value = sqlalchemy.Column(sqlalchemy.Float, nullable=False)
+
+    def __repr__(self) -> str:
+        mapper = sqlalchemy.inspect(self.__class__)
+        return '{0}.{1}({2})'.format(
+                self.__class__.__module__,
+                self.__class__.__name__,
+                ', '.join(
+                        '{0}={1}'.format(column.key,
+                                         repr(getattr(self, column.key)))
+                        for column in mapper.column_attrs))
+
+
+def _rollup_class(name: str, table_name: str, bucket: int) -> Any:
+    # count/min/max/sum (+ sum of sin/cos for angles) per column & bucket
+    attributes: Dict[str, Any] = {
+            '__tablename__': table_name,
+            'bucket': bucket,
+            'timestamp': sqlalchemy.Column(
+                    sqlalchemy.Integer,
+                    primary_key=True),
+            'module_id': sqlalchemy.Column(
+                    sqlalchemy.String,
+                    sqlalchemy.ForeignKey('modules.id'),
+                    primary_key=True),
+            '__repr__': Measurements.__repr__}
+    for column in MEASUREMENTS_VALUE_COLUMNS:
+        attributes['{0}_count'.format(column)] = sqlalchemy.Column(
+                sqlalchemy.Integer)
+        key_list = ['min', 'max', 'sum']
+        if column in MEASUREMENTS_ANGLE_COLUMNS:
+            key_list.extend(['sin', 'cos'])
+        for key in key_list:
+            attributes['{0}_{1}'.format(column, key)] = sqlalchemy.Column(
+                    sqlalchemy.Float)
+    return type(name, (_DeclarativeBase,), attributes)
+
+
+MeasurementsHourly = _rollup_class(
+        'MeasurementsHourly',
+        'measurements_hourly',
+        3600)
+MeasurementsDaily = _rollup_class(
+        'MeasurementsDaily',
+        'measurements_daily',
+        86400)
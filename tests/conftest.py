@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import pathlib
+from typing import Iterator
+import pytest
+import sqlalchemy
+import pyatmo
+import pyatmo.weather
+from benchmark.dataset import Dataset
+from benchmark.stub_server import PASSWORD, StubServer, account_username
+
+
+@pytest.fixture(scope='session')
+def dataset() -> Dataset:
+    return Dataset.generate(
+            stations=2,
+            days=2.0,
+            public_stations=100,
+            seed=1)
+
+
+@pytest.fixture
+def server(dataset: Dataset) -> Iterator[StubServer]:
+    with StubServer(dataset) as stub:
+        yield stub
+
+
+@pytest.fixture
+def client(server: StubServer) -> Iterator[pyatmo.Client]:
+    client = create_client(server)
+    yield client
+    client.close()
+
+
+# PostgreSQL database emptied by the tests (e.g. postgresql:///pyatmo_test)
+POSTGRESQL_URL_VARIABLE = 'PYATMO_TEST_POSTGRESQL_URL'
+
+
+@pytest.fixture(params=['sql', 'long', 'parquet', 'postgresql'])
+def database(
+        request: pytest.FixtureRequest,
+        tmp_path: pathlib.Path,
+        client: pyatmo.Client) -> Iterator[pyatmo.weather.Database]:
+    # storages: SQLite (SQLStorage, LongStorage), Parquet files &
+    # PostgreSQL (SQLStorage) when PYATMO_TEST_POSTGRESQL_URL is set
+    path = tmp_path.joinpath('weather.sqlite3')
+    if request.param == 'sql':
+        yield pyatmo.weather.Database(path, client)
+    elif request.param == 'long':
+        yield pyatmo.weather.Database(
+                path,
+                client,
+                storage=pyatmo.weather.LongStorage())
+    elif request.param == 'parquet':
+        pytest.importorskip('pyarrow')
+        yield pyatmo.weather.Database(
+                path,
+                client,
+                storage=pyatmo.weather.ParquetStorage(
+                        tmp_path.joinpath('parquet')))
+    else:
+        url = os.environ.get(POSTGRESQL_URL_VARIABLE)
+        if not url:
+            pytest.skip('{0} is not set'.format(POSTGRESQL_URL_VARIABLE))
+        pytest.importorskip('psycopg2')
+        _drop_all(url)
+        yield pyatmo.weather.Database(url, client)
+        _drop_all(url)
+
+
+def _drop_all(url: str) -> None:
+    # tables, monthly partitions & schema version of a previous run
+    engine = sqlalchemy.create_engine(url)
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text(
+                'DROP SCHEMA public CASCADE; CREATE SCHEMA public'))
+    engine.dispose()
+
+
+def create_client(server: StubServer, **kwargs) -> pyatmo.Client:
+    # authorized, no rate limit, no retry
+    username = kwargs.pop('username', account_username(0))
+    kwargs.setdefault('request_interval', None)
+    kwargs.setdefault('max_retries', 0)
+    kwargs.setdefault('token_refresh_margin', None)
+    client = pyatmo.Client(
+            'client_id',
+            'client_secret',
+            base_url=server.url,
+            logger=logging.getLogger('pyatmo.test'),
+            **kwargs)
+    client.authorize(username, PASSWORD)
+    return client
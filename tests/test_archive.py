@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import json
+import pathlib
+import struct
+from typing import Any, List, Optional, Tuple
+import pytest
+from pyatmo.weather._archive import ArchiveReader, write_archive
+
+
+_COLUMN_LIST = ['temperature', 'humidity']
+
+
+def _rows(timestamp_list: List[int]) -> List[Tuple[Any, ...]]:
+    # humidity: NULL for every third row
+    return [
+            (timestamp,
+             float(i),
+             None if i % 3 == 0 else float(i) / 2)
+            for i, timestamp in enumerate(timestamp_list)]
+
+
+def _write(
+        path: pathlib.Path,
+        rows: List[Tuple[Any, ...]],
+        block_size: int) -> None:
+    write_archive(path, 'module', _COLUMN_LIST, rows, block_size=block_size)
+
+
+def _expected(
+        rows: List[Tuple[Any, ...]],
+        begin: Optional[int],
+        end: Optional[int]) -> List[Tuple[Any, ...]]:
+    return [
+            row for row in rows
+            if ((begin is None or begin <= row[0])
+                and (end is None or row[0] <= end))]
+
+
+@pytest.mark.parametrize('begin,end', [
+        (None, None),
+        # within a block
+        (1300, 1600),
+        # across blocks
+        (1900, 4400),
+        # bounds between rows
+        (1950, 2950),
+        # before and after every block
+        (0, 999),
+        (100000, None)])
+def test_read_range(
+        tmp_path: pathlib.Path,
+        begin: Optional[int],
+        end: Optional[int]) -> None:
+    path = tmp_path.joinpath('archive.pyatmo')
+    rows = _rows(list(range(1000, 6000, 100)))
+    _write(path, rows, 8)
+    with ArchiveReader(path) as reader:
+        assert reader.module_id == 'module'
+        assert reader.column_list == _COLUMN_LIST
+        assert len(reader) == len(rows)
+        assert reader.read(begin, end) == _expected(rows, begin, end)
+
+
+def test_read_skip_block(
+        tmp_path: pathlib.Path,
+        monkeypatch: pytest.MonkeyPatch) -> None:
+    path = tmp_path.joinpath('archive.pyatmo')
+    rows = _rows(list(range(1000, 6000, 100)))
+    _write(path, rows, 8)
+    decoded: List[int] = []
+    read_block = ArchiveReader._read_block
+
+    def _read_block(self: ArchiveReader, block: Any, *args: Any) -> Any:
+        decoded.append(block.begin)
+        return read_block(self, block, *args)
+
+    monkeypatch.setattr(ArchiveReader, '_read_block', _read_block)
+    with ArchiveReader(path) as reader:
+        # 1000 + 800 * i: first timestamp of the i-th block
+        assert reader.read(2700, 3400) == _expected(rows, 2700, 3400)
+        assert decoded == [2600, 3400]
+        decoded.clear()
+        assert reader.read(6000, None) == []
+        assert decoded == []
+
+
+def test_read_column(tmp_path: pathlib.Path) -> None:
+    path = tmp_path.joinpath('archive.pyatmo')
+    rows = _rows(list(range(1000, 2000, 100)))
+    _write(path, rows, 4)
+    with ArchiveReader(path) as reader:
+        # unknown column: NULL
+        assert reader.read(column_list=['humidity', 'pressure']) == [
+                (row[0], row[2], None) for row in rows]
+
+
+def test_delta_size(tmp_path: pathlib.Path) -> None:
+    path = tmp_path.joinpath('archive.pyatmo')
+    # 1st block: uint16 deltas, 2nd block: uint32 deltas
+    timestamp_list = [0, 60, 120, 0x10000, 0x20000, 0x30000]
+    rows = _rows(timestamp_list)
+    _write(path, rows, 3)
+    with ArchiveReader(path) as reader:
+        assert reader.read() == rows
+        assert reader.read(100, 0x10000) == rows[2:4]
+    # fixed width little endian: independent of the platform
+    data = path.read_bytes()
+    (header_length,) = struct.unpack_from('<I', data, 8)
+    header = json.loads(data[12:12 + header_length])
+    assert [block['delta_size'] for block in header['block_list']] == [2, 4]
+    assert len(data) == (
+            12 + header_length
+            + (8 + 2 * 2 + 8 * 3 * len(_COLUMN_LIST))
+            + (8 + 4 * 2 + 8 * 3 * len(_COLUMN_LIST)))
+    offset = 12 + header_length
+    assert struct.unpack_from('<q2H3d', data, offset) == (
+            0, 60, 60, 0.0, 1.0, 2.0)
+
+
+def test_not_archive(tmp_path: pathlib.Path) -> None:
+    path = tmp_path.joinpath('archive.pyatmo')
+    path.write_bytes(b'\x00' * 64)
+    with pytest.raises(ValueError):
+        ArchiveReader(path)
+
+
+def test_replace(tmp_path: pathlib.Path) -> None:
+    path = tmp_path.joinpath('archive.pyatmo')
+    _write(path, _rows([1000, 1100]), 8)
+    rows = _rows([2000, 2100, 2200])
+    _write(path, rows, 8)
+    with ArchiveReader(path) as reader:
+        assert reader.read() == rows
+    # no temporary file left behind
+    assert list(tmp_path.iterdir()) == [path]
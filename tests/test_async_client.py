@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import socket
+from typing import Any, Dict, List, Optional
+import pytest
+import pyatmo
+from pyatmo._request import AsyncRequest
+from benchmark.dataset import Dataset
+from benchmark.stub_server import PASSWORD, StubServer, account_username
+from conftest import create_client
+
+
+aiohttp = pytest.importorskip('aiohttp')
+
+
+def _create_async_client(
+        server: StubServer,
+        **kwargs: Any) -> pyatmo.AsyncClient:
+    # not authorized, no rate limit, no retry
+    kwargs.setdefault('request_interval', None)
+    kwargs.setdefault('max_retries', 0)
+    kwargs.setdefault('token_refresh_margin', None)
+    return pyatmo.AsyncClient(
+            'client_id',
+            'client_secret',
+            base_url=server.url,
+            logger=logging.getLogger('pyatmo.test'),
+            **kwargs)
+
+
+def _unused_url() -> str:
+    # nothing listens on the port: connection refused
+    with socket.socket() as unused_socket:
+        unused_socket.bind(('127.0.0.1', 0))
+        port = unused_socket.getsockname()[1]
+    return 'http://127.0.0.1:{0}/api/getmeasure'.format(port)
+
+
+def test_stations_data(server: StubServer) -> None:
+    client = create_client(server)
+    expected = client.get_stations_data()
+    client.close()
+
+    async def run() -> Optional[Dict[str, Any]]:
+        async_client = _create_async_client(server)
+        try:
+            await async_client.authorize(account_username(0), PASSWORD)
+            return await async_client.get_stations_data()
+        finally:
+            await async_client.close()
+
+    result = asyncio.run(run())
+    assert result is not None and expected is not None
+    assert result['body'] == expected['body']
+
+
+def test_measure(dataset: Dataset, server: StubServer) -> None:
+    module = dataset.stations[0].modules[0]
+
+    async def run() -> List[Optional[Dict[str, Any]]]:
+        async_client = _create_async_client(server, pool_size=4)
+        try:
+            await async_client.authorize(account_username(0), PASSWORD)
+            # 10 distinct requests, each sent 3 times concurrently
+            return await asyncio.gather(*(
+                    async_client.get_measure(
+                            device_id=module.device_id,
+                            module_id=module.id,
+                            scale='max',
+                            type_list=module.data_type,
+                            date_begin=(dataset.begin
+                                        + (i % 10) * dataset.step),
+                            limit=1)
+                    for i in range(30)))
+        finally:
+            await async_client.close()
+
+    result_list = asyncio.run(run())
+    assert all(result is not None for result in result_list)
+    assert result_list[:10] == result_list[10:20] == result_list[20:]
+    # identical concurrent requests: coalesced
+    assert server.request_count['/api/getmeasure'] == 10
+    assert server.connection_count <= 1 + 4
+
+
+def test_timeout(dataset: Dataset) -> None:
+    metrics = pyatmo.InMemoryMetrics()
+
+    async def run(url: str) -> None:
+        request = AsyncRequest(
+                timeout=0.1,
+                max_retries=2,
+                backoff_factor=0.0,
+                metrics=metrics)
+        try:
+            await request.request('post', url, data={})
+        finally:
+            await request.close()
+
+    with StubServer(dataset, latency=1.0) as server:
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(run(server.url + '/api/getmeasure'))
+        # retried like a connection error
+        assert server.request_count['/api/getmeasure'] == 3
+    snapshot = metrics.snapshot()
+    assert snapshot.counter(
+            'pyatmo_requests_total',
+            endpoint='getmeasure',
+            status='error') == 3.0
+    assert snapshot.counter(
+            'pyatmo_request_retries_total',
+            endpoint='getmeasure') == 2.0
+
+
+def test_connection_error() -> None:
+    metrics = pyatmo.InMemoryMetrics()
+    url = _unused_url()
+
+    async def run() -> None:
+        request = AsyncRequest(
+                max_retries=1,
+                backoff_factor=0.0,
+                metrics=metrics)
+        try:
+            await request.request('post', url, data={})
+        finally:
+            await request.close()
+
+    with pytest.raises(aiohttp.ClientConnectionError):
+        asyncio.run(run())
+    assert metrics.snapshot().counter(
+            'pyatmo_requests_total',
+            endpoint='getmeasure',
+            status='error') == 2.0
+
+
+def test_usage_reached(server: StubServer, dataset: Dataset) -> None:
+    rate_limiter = pyatmo.RateLimiter([])
+
+    async def run(url: str) -> int:
+        request = AsyncRequest(rate_limiter=rate_limiter, max_retries=0)
+        try:
+            response = await request.request(
+                    'post',
+                    url + '/api/getmeasure',
+                    data={})
+            return response.status_code
+        finally:
+            await request.close()
+
+    # 403 (invalid access token): not throttled
+    assert asyncio.run(run(server.url)) == 403
+    assert rate_limiter.scale == 1.0
+    # 429 (user usage reached)
+    with StubServer(dataset, error_rate=1.0) as error_server:
+        assert asyncio.run(run(error_server.url)) == 429
+    assert rate_limiter.scale == 0.5
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+import concurrent.futures
+import os
+import pathlib
+import threading
+import time
+from typing import Any, Dict, List, Optional
+import pyatmo
+from benchmark.dataset import Dataset
+from benchmark.stub_server import StubServer
+from conftest import create_client
+
+
+_URL = 'https://api.netatmo.com/api/getmeasure'
+
+
+def test_disk_tier(tmp_path: pathlib.Path) -> None:
+    cache = pyatmo.ResponseCache(directory=tmp_path)
+    cache.set(_URL, {'date_begin': 0}, 'immutable', is_immutable=True)
+    cache.set(_URL, {'date_begin': 1}, 'expiring')
+    # another process
+    other = pyatmo.ResponseCache(directory=tmp_path)
+    assert other.get(_URL, {'date_begin': 0}) == 'immutable'
+    assert other.get(_URL, {'date_begin': 1}) == 'expiring'
+    assert other.get(_URL, {'date_begin': 2}) is None
+    other.clear()
+    assert not list(tmp_path.iterdir())
+
+
+def test_concurrent_write(tmp_path: pathlib.Path) -> None:
+    cache = pyatmo.ResponseCache(directory=tmp_path)
+
+    def write(i: int) -> None:
+        for _ in range(20):
+            cache.set(_URL, {'date_begin': 0}, 'text', is_immutable=True)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(write, range(16)))
+    assert [path.suffix for path in tmp_path.iterdir()] == ['.json']
+
+
+def test_concurrent_client(
+        tmp_path: pathlib.Path,
+        server: StubServer) -> None:
+    client = create_client(
+            server,
+            cache=pyatmo.ResponseCache(directory=tmp_path))
+
+    def call(i: int) -> bool:
+        return client.get_public_data(1.0, 1.0, -1.0, -1.0) is not None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+        assert all(executor.map(call, range(16)))
+    client.close()
+
+
+def test_prune_expired(tmp_path: pathlib.Path) -> None:
+    cache = pyatmo.ResponseCache(
+            ttl={'getmeasure': 60.0},
+            directory=tmp_path)
+    cache.set(_URL, {'date_begin': 0}, 'immutable', is_immutable=True)
+    cache.set(_URL, {'date_begin': 1}, 'expiring')
+    assert len(list(tmp_path.iterdir())) == 2
+    # expired 1 second ago
+    for path in tmp_path.glob('*.ttl.json'):
+        os.utime(path, (time.time() - 1, time.time() - 1))
+    cache.prune()
+    assert [path.name.endswith('.ttl.json')
+            for path in tmp_path.iterdir()] == [False]
+
+
+def test_prune_max_directory_bytes(tmp_path: pathlib.Path) -> None:
+    cache = pyatmo.ResponseCache(
+            directory=tmp_path,
+            max_directory_bytes=10 * 1100)
+    path_list: List[pathlib.Path] = []
+    for i in range(20):
+        cache.set(_URL, {'date_begin': i}, 'x' * 1000, is_immutable=True)
+        path = (set(tmp_path.iterdir()) - set(path_list)).pop()
+        # used i seconds after the epoch
+        os.utime(path, (i, i))
+        path_list.append(path)
+    cache.prune()
+    # the most recently used files are kept
+    remaining_list = sorted(tmp_path.iterdir(), key=path_list.index)
+    assert remaining_list == path_list[-len(remaining_list):]
+    assert 0 < sum(path.stat().st_size for path in remaining_list) <= (
+            10 * 1100)
+
+
+def test_coalesced_write(
+        tmp_path: pathlib.Path,
+        dataset: Dataset) -> None:
+    # coalesced callers: one request, one cache write
+    set_list: List[str] = []
+
+    class Cache(pyatmo.ResponseCache):
+        def set(self, url: str, *args: Any, **kwargs: Any) -> None:
+            set_list.append(url)
+            super().set(url, *args, **kwargs)
+
+    with StubServer(dataset, latency=0.2) as server:
+        client = create_client(server, cache=Cache(directory=tmp_path))
+        barrier = threading.Barrier(16)
+
+        def call(i: int) -> Optional[Dict[str, Any]]:
+            barrier.wait()
+            return client.get_public_data(1.0, 1.0, -1.0, -1.0)
+
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=16) as executor:
+            result_list = list(executor.map(call, range(16)))
+        client.close()
+    assert all(result == result_list[0] for result in result_list)
+    # distinct dicts
+    assert len({id(result) for result in result_list}) == 16
+    assert client.single_flight_stats.executed == 1
+    assert server.request_count['/api/getpublicdata'] == 1
+    assert len(set_list) == 1
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import pathlib
+from typing import Any, Dict, Iterator, List, Optional
+import pytest
+import pyatmo
+import pyatmo.weather
+from benchmark.dataset import Dataset
+from benchmark.stub_server import StubServer, account_username
+from conftest import create_client
+
+
+@pytest.fixture
+def favorite_server(dataset: Dataset) -> Iterator[StubServer]:
+    # account 0 owns station 0 & has station 1 (account 1) as a favorite
+    with StubServer(
+            dataset,
+            accounts=2,
+            favorites={0: [dataset.stations[1].id]}) as stub:
+        yield stub
+
+
+def _create_pool(
+        server: StubServer,
+        account_list: List[int]) -> pyatmo.ClientPool:
+    return pyatmo.ClientPool([
+            create_client(server, username=account_username(account))
+            for account in account_list])
+
+
+def _get_measure(
+        pool: pyatmo.ClientPool,
+        dataset: Dataset,
+        station: int) -> Optional[Dict[str, Any]]:
+    module = dataset.stations[station].modules[0]
+    return pool.get_measure(
+            device_id=module.device_id,
+            module_id=module.id,
+            scale='max',
+            type_list=module.data_type,
+            limit=1)
+
+
+def test_owner(dataset: Dataset, favorite_server: StubServer) -> None:
+    pool = _create_pool(favorite_server, [0, 1])
+    # the favorite yields to its owner
+    assert pool.owner(dataset.stations[1].id) is pool.clients[1]
+    assert pool.owner(dataset.stations[0].id) is pool.clients[0]
+    assert _get_measure(pool, dataset, 1) is not None
+    pool.close()
+
+
+def test_favorite(dataset: Dataset, favorite_server: StubServer) -> None:
+    # the owner of the favorite is not in the pool
+    pool = _create_pool(favorite_server, [0])
+    assert pool.owner(dataset.stations[1].id) is pool.clients[0]
+    assert _get_measure(pool, dataset, 1) is not None
+    pool.close()
+
+
+def test_not_found(favorite_server: StubServer) -> None:
+    pool = _create_pool(favorite_server, [0, 1])
+    for _ in range(3):
+        assert pool.owner('70:ee:50:ff:ff:ff') is None
+    # looked up once per account
+    assert favorite_server.request_count['/api/getstationsdata'] == 2
+    pool.close()
+
+
+def test_database_favorite(
+        tmp_path: pathlib.Path,
+        dataset: Dataset,
+        favorite_server: StubServer) -> None:
+    path = tmp_path.joinpath('weather.sqlite3')
+    pool = _create_pool(favorite_server, [0])
+    database = pyatmo.weather.Database(path, pool)
+    assert database.register(get_favorites=True) is not None
+    pool.close()
+    # a new process
+    pool = _create_pool(favorite_server, [0])
+    database = pyatmo.weather.Database(path, pool)
+    assert database.update(min_update_interval=None)
+    for station in dataset.stations:
+        device = database.device(station.id)
+        assert device is not None
+        for module in device.modules:
+            assert database.measurements(module)
+    pool.close()
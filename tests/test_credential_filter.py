@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from typing import Iterator, List
+import pytest
+import pyatmo
+from pyatmo._oauth import CredentialFilter
+from benchmark.stub_server import StubServer
+from conftest import create_client
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.message_list: List[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.message_list.append(self.format(record))
+
+
+class _Counter:
+    # number of str() calls
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.count = 0
+
+    def __str__(self) -> str:
+        self.count += 1
+        return self.text
+
+
+@pytest.fixture
+def handler() -> Iterator[_ListHandler]:
+    logger = logging.getLogger('pyatmo.test.credential_filter')
+    handler = _ListHandler()
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    yield handler
+    logger.removeHandler(handler)
+    logger.setLevel(logging.NOTSET)
+
+
+def _logger() -> logging.Logger:
+    return logging.getLogger('pyatmo.test.credential_filter')
+
+
+def test_message(handler: _ListHandler) -> None:
+    credential_filter = CredentialFilter()
+    credential_filter.register_credential('secret', 'PASSWORD')
+    handler.addFilter(credential_filter)
+    _logger().info('password: secret')
+    assert handler.message_list == ['password: ***PASSWORD***']
+
+
+def test_args(handler: _ListHandler) -> None:
+    credential_filter = CredentialFilter()
+    credential_filter.register_credential('secret', 'PASSWORD')
+    credential_filter.register_credential('secret-token', 'ACCESS_TOKEN')
+    handler.addFilter(credential_filter)
+    _logger().info('data: %s %d', 'secret-token', 1)
+    _logger().info('data: %s', {'password': 'secret'})
+    _logger().info('password: %(password)s', {'password': 'secret'})
+    # longest credential first
+    assert handler.message_list == [
+            'data: ***ACCESS_TOKEN*** 1',
+            'data: {\'password\': \'***PASSWORD***\'}',
+            'password: ***PASSWORD***']
+
+
+def test_scope(handler: _ListHandler) -> None:
+    # each client redacts its own credentials on its own handlers
+    filter_a = CredentialFilter()
+    filter_a.register_credential('secret-a', 'PASSWORD')
+    filter_b = CredentialFilter()
+    filter_b.register_credential('secret-b', 'PASSWORD')
+    other_handler = _ListHandler()
+    other_logger = logging.getLogger('pyatmo.test.credential_filter.other')
+    other_logger.addHandler(other_handler)
+    other_logger.propagate = False
+    try:
+        handler.addFilter(filter_a)
+        other_handler.addFilter(filter_b)
+        _logger().info('%s %s', 'secret-a', 'secret-b')
+        other_logger.warning('%s %s', 'secret-a', 'secret-b')
+        assert handler.message_list == ['***PASSWORD*** secret-b']
+        assert other_handler.message_list == ['secret-a ***PASSWORD***']
+        # shared handler: both filters apply
+        handler.addFilter(filter_b)
+        _logger().info('%s %s', 'secret-a', 'secret-b')
+        assert handler.message_list[-1] == '***PASSWORD*** ***PASSWORD***'
+    finally:
+        other_logger.removeHandler(other_handler)
+        other_logger.propagate = True
+
+
+def test_refresh(server: StubServer) -> None:
+    client = create_client(server)
+    try:
+        credential_filter = client._credential_filter
+        old_token = client._oauth.access_token
+        old_refresh_token = client._oauth._refresh_token
+        assert old_token is not None and old_refresh_token is not None
+        client._oauth.refresh_token()
+        new_token = client._oauth.access_token
+        assert new_token is not None and new_token != old_token
+        # the old tokens are not credentials anymore
+        assert credential_filter.redact(old_token) == old_token
+        assert (credential_filter.redact(old_refresh_token)
+                == old_refresh_token)
+        assert credential_filter.redact(new_token) == '***ACCESS_TOKEN***'
+        assert (credential_filter.redact('client_secret')
+                == '***CLIENT_SECRET***')
+    finally:
+        client.close()
+
+
+def test_lazy(handler: _ListHandler) -> None:
+    credential_filter = CredentialFilter()
+    credential_filter.register_credential('secret', 'PASSWORD')
+    handler.addFilter(credential_filter)
+    # disabled level: neither filtered nor formatted
+    _logger().setLevel(logging.INFO)
+    counter = _Counter('secret')
+    _logger().debug('value: %s', counter)
+    assert counter.count == 0
+    assert handler.message_list == []
+    # filtered: formatted once, when emitted
+    record = _logger().makeRecord(
+            _logger().name, logging.INFO, __file__, 0,
+            'value: %s', (counter,), None)
+    assert credential_filter.filter(record)
+    assert counter.count == 0
+    assert record.getMessage() == 'value: ***PASSWORD***'
+    assert record.getMessage() == 'value: ***PASSWORD***'
+    assert counter.count == 1
+
+
+def test_client_close() -> None:
+    logger = logging.getLogger('pyatmo.test.credential_filter.client')
+    handler = _ListHandler()
+    logger.addHandler(handler)
+    try:
+        client = pyatmo.Client(
+                'client_id',
+                'client_secret',
+                token_refresh_margin=None,
+                logger=logger)
+        assert len(handler.filters) == 1
+        client.close()
+        # the handler outlives the client
+        assert handler.filters == []
+    finally:
+        logger.removeHandler(handler)
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+
+import math
+import pathlib
+import threading
+from typing import Any, Dict, List, Optional
+import pytest
+import sqlalchemy
+import pyatmo
+import pyatmo.weather
+from benchmark.dataset import Dataset
+from benchmark.stub_server import StubServer
+
+
+def _count(database: pyatmo.weather.Database, table: sqlalchemy.Table) -> int:
+    session = database.session()
+    result = session.execute(
+            sqlalchemy.select([sqlalchemy.func.count()]).select_from(table))
+    count = result.scalar()
+    session.close()
+    return count
+
+
+def test_register(
+        dataset: Dataset,
+        database: pyatmo.weather.Database) -> None:
+    result = database.register()
+    assert result is not None
+    assert result.added_devices == sorted(
+            station.id for station in dataset.stations)
+    assert len(result.added_modules) == sum(
+            len(station.modules) for station in dataset.stations)
+    # no change
+    result = database.register()
+    assert result is not None
+    assert not result.added_devices and not result.added_modules
+    assert not result.removed_devices and not result.removed_modules
+    device = database.device(dataset.stations[0].id)
+    assert device is not None
+    assert device.name == dataset.stations[0].name
+
+
+def test_update(
+        dataset: Dataset,
+        server: StubServer,
+        database: pyatmo.weather.Database) -> None:
+    database.register()
+    assert database.update(min_update_interval=None, max_workers=2)
+    for device in database.all_device():
+        for module in device.modules:
+            station_module = dataset.module(module.id)
+            assert station_module is not None
+            expected = list(dataset.timestamps(station_module[1], None, None))
+            measurements = database.measurements(module)
+            assert [row.timestamp for row in measurements] == expected
+            # a window
+            begin, end = expected[10], expected[20]
+            assert [row.timestamp
+                    for row in database.measurements(module, begin, end)] == (
+                    expected[10:21])
+    # up to date: nothing to fetch
+    request_count = server.request_count['/api/getmeasure']
+    assert not database.update(min_update_interval=None)
+    assert server.request_count['/api/getmeasure'] == request_count + sum(
+            len(station.modules) for station in dataset.stations)
+
+
+def test_unregister(
+        tmp_path: pathlib.Path,
+        dataset: Dataset,
+        database: pyatmo.weather.Database) -> None:
+    database.register()
+    database.update(min_update_interval=None)
+    station = dataset.stations[0]
+    database.export_archive(tmp_path.joinpath('archive'))
+    database.unregister(station.id)
+    assert database.device(station.id) is None
+    assert _count(database, pyatmo.weather.Device.__table__) == (
+            len(dataset.stations) - 1)
+    assert _count(database, pyatmo.weather.Module.__table__) == sum(
+            len(other.modules) for other in dataset.stations[1:])
+    for module in station.modules:
+        session = database.session()
+        assert session.query(pyatmo.weather.Measurements).filter_by(
+                module_id=module.id).count() == 0
+        assert session.query(pyatmo.weather.ModuleSyncState).filter_by(
+                module_id=module.id).count() == 0
+        session.close()
+    # the archive of the unregistered device is not imported
+    assert database.import_archive(tmp_path.joinpath('archive')) == sum(
+            len(list(dataset.timestamps(module, None, None)))
+            for other in dataset.stations[1:]
+            for module in other.modules)
+    assert _count(database, pyatmo.weather.Module.__table__) == sum(
+            len(other.modules) for other in dataset.stations[1:])
+
+
+@pytest.mark.parametrize('bucket, size, is_aligned', [
+        ('1h', 3600, True),
+        ('1h', 3600, False),
+        ('1d', 86400, True),
+        ('45min', 2700, False)])
+def test_aggregate(
+        dataset: Dataset,
+        database: pyatmo.weather.Database,
+        bucket: str,
+        size: int,
+        is_aligned: bool) -> None:
+    database.register()
+    database.update(min_update_interval=None)
+    # aligned: read from the rollups by the SQL storages
+    begin = dataset.begin - dataset.begin % 86400 + 86400
+    end = begin + 86400 - 1
+    if not is_aligned:
+        begin, end = begin + 600, end - 600
+    column_list = ['temperature', 'rain', 'wind_strength', 'wind_angle']
+    function_list = ['min', 'max', 'avg', 'count']
+    for device in database.all_device():
+        for module in device.modules:
+            expected = _expected_aggregate(
+                    [(row.timestamp,
+                      [getattr(row, column) for column in column_list])
+                     for row in database.measurements(module, begin, end)],
+                    size,
+                    column_list)
+            assert expected
+            result = database.aggregate(
+                    module,
+                    begin,
+                    end,
+                    bucket=bucket,
+                    function_list=function_list,
+                    column_list=column_list)
+            _assert_rows(result, expected)
+            database.rebuild_rollup()
+            _assert_rows(
+                    database.aggregate(
+                            module,
+                            begin,
+                            end,
+                            bucket=bucket,
+                            function_list=function_list,
+                            column_list=column_list),
+                    expected)
+
+
+def _expected_aggregate(
+        rows: List[Any],
+        bucket: int,
+        column_list: List[str]) -> List[Dict[str, Any]]:
+    bucket_dict: Dict[int, List[Any]] = {}
+    for timestamp, values in rows:
+        bucket_dict.setdefault(timestamp - timestamp % bucket, []).append(
+                values)
+    result: List[Dict[str, Any]] = []
+    for timestamp in sorted(bucket_dict):
+        expected: Dict[str, Any] = {'timestamp': timestamp}
+        for i, column in enumerate(column_list):
+            value_list = [
+                    values[i] for values in bucket_dict[timestamp]
+                    if values[i] is not None]
+            expected[column + '_min'] = min(value_list, default=None)
+            expected[column + '_max'] = max(value_list, default=None)
+            expected[column + '_count'] = len(value_list)
+            expected[column + '_avg'] = _mean(column, value_list)
+        result.append(expected)
+    return result
+
+
+def _mean(column: str, value_list: List[float]) -> Optional[float]:
+    if not value_list:
+        return None
+    if column != 'wind_angle':
+        return sum(value_list) / len(value_list)
+    # circular mean
+    return math.degrees(math.atan2(
+            sum(math.sin(math.radians(value)) for value in value_list),
+            sum(math.cos(math.radians(value)) for value in value_list))) % 360
+
+
+def _assert_rows(
+        result: List[Dict[str, Any]],
+        expected: List[Dict[str, Any]]) -> None:
+    assert [row.keys() for row in result] == [row.keys() for row in expected]
+    for row, expected_row in zip(result, expected):
+        for key, value in expected_row.items():
+            if value is None:
+                assert row[key] is None, key
+            else:
+                assert row[key] == pytest.approx(value), key
+
+
+def _outdoor_module(
+        dataset: Dataset,
+        database: pyatmo.weather.Database) -> Any:
+    # (Module, StationModule) of the outdoor module (temperature, humidity)
+    station_module = dataset.stations[0].modules[1]
+    assert station_module.module_type == 'NAModule1'
+    device = database.device(station_module.device_id)
+    assert device is not None
+    module = next(
+            module for module in device.modules
+            if module.id == station_module.id)
+    return module, station_module
+
+
+def test_measurement_columns(
+        dataset: Dataset,
+        database: pyatmo.weather.Database) -> None:
+    numpy = pytest.importorskip('numpy')
+    database.register()
+    database.update(min_update_interval=None)
+    module, station_module = _outdoor_module(dataset, database)
+    expected = list(dataset.timestamps(station_module, None, None))
+    begin, end = expected[10], expected[20]
+    columns = database.measurement_columns(module, begin, end)
+    assert list(columns) == ['timestamp', 'temperature', 'humidity']
+    assert columns['timestamp'].dtype == numpy.int64
+    assert columns['timestamp'].tolist() == expected[10:21]
+    for i, column in enumerate(['temperature', 'humidity']):
+        assert columns[column].dtype == numpy.float64
+        assert columns[column].tolist() == pytest.approx([
+                dataset.values(
+                        station_module,
+                        station_module.data_type,
+                        timestamp)[i]
+                for timestamp in expected[10:21]])
+    # not measured by the module: NaN
+    columns = database.measurement_columns(
+            module,
+            begin,
+            end,
+            column_list=['co2', 'temperature'])
+    assert list(columns) == ['timestamp', 'co2', 'temperature']
+    assert columns['co2'].dtype == numpy.float64
+    assert len(columns['co2']) == 11
+    assert numpy.isnan(columns['co2']).all()
+    assert not numpy.isnan(columns['temperature']).any()
+    # empty window: typed empty arrays
+    columns = database.measurement_columns(module, 0, expected[0] - 1)
+    assert all(len(values) == 0 for values in columns.values())
+    assert columns['timestamp'].dtype == numpy.int64
+    assert columns['temperature'].dtype == numpy.float64
+
+
+def test_measurement_frame(
+        dataset: Dataset,
+        database: pyatmo.weather.Database) -> None:
+    pandas = pytest.importorskip('pandas')
+    database.register()
+    database.update(min_update_interval=None)
+    module, station_module = _outdoor_module(dataset, database)
+    expected = list(dataset.timestamps(station_module, None, None))
+    frame = database.measurement_frame(
+            module,
+            expected[10],
+            expected[20],
+            column_list=['temperature', 'co2'])
+    assert list(frame.columns) == ['temperature', 'co2']
+    assert frame.index.name == 'timestamp'
+    assert str(frame.index.tz) == 'UTC'
+    assert frame.index.equals(pandas.DatetimeIndex(
+            pandas.to_datetime(expected[10:21], unit='s', utc=True)))
+    assert (frame.dtypes == 'float64').all()
+    assert frame['co2'].isna().all()
+    assert frame['temperature'].notna().all()
+    # whole range
+    assert len(database.measurement_frame(module)) == len(expected)
+
+
+def test_update_writer_failure(
+        monkeypatch: pytest.MonkeyPatch,
+        database: pyatmo.weather.Database) -> None:
+    # the fetchers blocked on the full page queue are released
+    database.register()
+
+    def write_rows(*args: Any) -> None:
+        raise RuntimeError('write rows')
+
+    monkeypatch.setattr(database, '_write_rows', write_rows)
+    result: List[BaseException] = []
+
+    def update() -> None:
+        try:
+            database.update(min_update_interval=None, max_workers=2)
+        except RuntimeError as error:
+            result.append(error)
+
+    thread = threading.Thread(target=update, daemon=True)
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive()
+    assert [str(error) for error in result] == ['write rows']
+
+
+def test_update_empty_values(
+        monkeypatch: pytest.MonkeyPatch,
+        client: pyatmo.Client,
+        database: pyatmo.weather.Database) -> None:
+    # a non-empty body of runs without values
+    database.register()
+    monkeypatch.setattr(
+            client,
+            'get_measure',
+            lambda **kwargs: {
+                    'body': [{'beg_time': 0, 'step_time': 300, 'value': []}],
+                    'status': 'ok'})
+    assert not database.update(min_update_interval=None)
+
+
+def test_sqlite_profile_url(
+        tmp_path: pathlib.Path,
+        client: pyatmo.Client) -> None:
+    url = 'sqlite:///{0}'.format(tmp_path.joinpath('weather.sqlite3'))
+    with pytest.raises(ValueError):
+        pyatmo.weather.Database(
+                url,
+                client,
+                sqlite_profile=pyatmo.weather.SQLiteProfile.performance())
+    pyatmo.weather.Database(url, client)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+import pathlib
+import time
+from typing import Iterator, List, Optional
+import pytest
+import pyatmo
+from pyatmo._client import is_past_measure
+from benchmark.dataset import Dataset
+from benchmark.stub_server import MEASURE_LIMIT, StubServer
+from conftest import create_client
+
+
+@pytest.fixture(scope='module')
+def long_dataset() -> Dataset:
+    # more than 2 pages per module
+    return Dataset.generate(
+            stations=1,
+            days=8.0,
+            public_stations=0,
+            seed=1)
+
+
+@pytest.fixture
+def long_server(long_dataset: Dataset) -> Iterator[StubServer]:
+    with StubServer(long_dataset) as stub:
+        yield stub
+
+
+def test_iter_measure(long_dataset: Dataset, long_server: StubServer) -> None:
+    module = long_dataset.stations[0].modules[1]
+    timestamp_list = list(long_dataset.timestamps(module))
+    assert len(timestamp_list) > 2 * MEASURE_LIMIT
+    client = create_client(long_server)
+    batch_list = list(client.iter_measure(
+            device_id=module.device_id,
+            module_id=module.id,
+            scale='max',
+            type_list=module.data_type,
+            batch_size=100))
+    client.close()
+    # every measurement once, in order, across the pages
+    assert all(len(batch) == 100 for batch in batch_list[:-1])
+    assert 0 < len(batch_list[-1]) <= 100
+    row_list = [row for batch in batch_list for row in batch]
+    assert [timestamp for timestamp, _ in row_list] == timestamp_list
+    assert all(
+            value == long_dataset.values(module, module.data_type, timestamp)
+            for timestamp, value in row_list)
+    # full pages, the last partial page & the empty page
+    assert long_server.request_count['/api/getmeasure'] == (
+            len(timestamp_list) // MEASURE_LIMIT + 2)
+
+
+def test_iter_measure_window(
+        long_dataset: Dataset,
+        long_server: StubServer) -> None:
+    module = long_dataset.stations[0].modules[0]
+    timestamp_list = list(long_dataset.timestamps(module))
+    # bounds within pages: date_end stops the paging
+    date_begin = timestamp_list[100] - 1
+    date_end = timestamp_list[100 + MEASURE_LIMIT + 10]
+    client = create_client(long_server)
+    row_list = [
+            row
+            for batch in client.iter_measure(
+                    device_id=module.device_id,
+                    module_id=module.id,
+                    scale='max',
+                    type_list=module.data_type,
+                    date_begin=date_begin,
+                    date_end=date_end)
+            for row in batch]
+    client.close()
+    assert [timestamp for timestamp, _ in row_list] == (
+            timestamp_list[100:100 + MEASURE_LIMIT + 11])
+    assert long_server.request_count['/api/getmeasure'] == 2
+
+
+def test_is_past_measure() -> None:
+    # uploads are delayed up to 10 minutes
+    now = int(time.time())
+    assert not is_past_measure(None)
+    assert not is_past_measure(now)
+    assert not is_past_measure(now - 590)
+    assert is_past_measure(now - 610)
+
+
+def _cache_suffix_list(directory: pathlib.Path) -> List[str]:
+    return sorted(
+            path.name.split('.', 1)[1] for path in directory.iterdir())
+
+
+@pytest.mark.parametrize('date_end,suffix', [
+        # the dataset ends on 2024-01-01: immutable
+        ('dataset_end', 'json'),
+        # recent or open-ended: expiring
+        ('now', 'ttl.json'),
+        (None, 'ttl.json')])
+def test_cache_boundary(
+        dataset: Dataset,
+        server: StubServer,
+        tmp_path: pathlib.Path,
+        date_end: Optional[str],
+        suffix: str) -> None:
+    module = dataset.stations[0].modules[0]
+    end = {
+            'dataset_end': dataset.end,
+            'now': int(time.time()),
+            None: None}[date_end]
+    client = create_client(
+            server,
+            cache=pyatmo.ResponseCache(directory=tmp_path))
+    response_list = [
+            client.get_measure(
+                    device_id=module.device_id,
+                    module_id=module.id,
+                    scale='max',
+                    type_list=module.data_type,
+                    date_begin=dataset.begin,
+                    date_end=end,
+                    limit=10)
+            for _ in range(2)]
+    client.close()
+    assert response_list[0] is not None
+    assert response_list[0] == response_list[1]
+    assert _cache_suffix_list(tmp_path) == [suffix]
+    # the second call is served from the cache in both cases
+    assert server.request_count['/api/getmeasure'] == 1
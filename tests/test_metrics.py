@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+import concurrent.futures
+import time
+from typing import Any, Dict, List, Tuple
+import pytest
+import pyatmo
+import pyatmo._request
+from pyatmo._metrics import Histogram, MetricsSnapshot
+from pyatmo._request import record_request
+from benchmark.stub_server import StubServer
+from conftest import create_client
+
+
+def test_in_memory() -> None:
+    metrics = pyatmo.InMemoryMetrics(buckets=(1.0, 0.125))
+    metrics.increment('requests', endpoint='a', status='200')
+    # label order does not matter
+    metrics.increment('requests', 2.0, status='200', endpoint='a')
+    metrics.increment('requests', endpoint='b', status='200')
+    for value in (0.0625, 0.125, 0.5, 4.0):
+        metrics.observe('seconds', value)
+    snapshot = metrics.snapshot()
+    assert snapshot.counter('requests', endpoint='a', status='200') == 3.0
+    assert snapshot.counter('requests', endpoint='b', status='200') == 1.0
+    assert snapshot.counter('requests', endpoint='c', status='200') == 0.0
+    # sorted bounds, cumulative counts (le), +Inf: samples
+    assert snapshot.histogram('seconds') == Histogram(
+            buckets=(0.125, 1.0),
+            counts=(2, 3),
+            total=4.6875,
+            samples=4)
+    assert snapshot.histogram('seconds', endpoint='a') is None
+    # a snapshot is a copy
+    metrics.increment('requests', endpoint='b', status='200')
+    assert snapshot.counter('requests', endpoint='b', status='200') == 1.0
+    metrics.reset()
+    assert metrics.snapshot() == MetricsSnapshot({}, {})
+
+
+def test_in_memory_threads() -> None:
+    metrics = pyatmo.InMemoryMetrics()
+
+    def record(i: int) -> None:
+        for _ in range(1000):
+            metrics.increment('total')
+            metrics.observe('seconds', 0.01)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(record, range(8)))
+    snapshot = metrics.snapshot()
+    assert snapshot.counter('total') == 8000.0
+    histogram = snapshot.histogram('seconds')
+    assert histogram is not None and histogram.samples == 8000
+
+
+def test_prometheus_text() -> None:
+    metrics = pyatmo.PrometheusMetrics(buckets=(0.1, 1.0))
+    metrics.increment('pyatmo_requests_total', endpoint='getmeasure')
+    metrics.increment('pyatmo_requests_total', endpoint='a"b\\c\nd')
+    metrics.observe('pyatmo_request_seconds', 0.5, endpoint='getmeasure')
+    assert metrics.text() == (
+            '# TYPE pyatmo_requests_total counter\n'
+            'pyatmo_requests_total{endpoint="a\\"b\\\\c\\nd"} 1.0\n'
+            'pyatmo_requests_total{endpoint="getmeasure"} 1.0\n'
+            '# TYPE pyatmo_request_seconds histogram\n'
+            'pyatmo_request_seconds_bucket'
+            '{endpoint="getmeasure",le="0.1"} 0\n'
+            'pyatmo_request_seconds_bucket'
+            '{endpoint="getmeasure",le="1.0"} 1\n'
+            'pyatmo_request_seconds_bucket'
+            '{endpoint="getmeasure",le="+Inf"} 1\n'
+            'pyatmo_request_seconds_sum{endpoint="getmeasure"} 0.5\n'
+            'pyatmo_request_seconds_count{endpoint="getmeasure"} 1\n')
+    assert pyatmo.PrometheusMetrics().text() == ''
+
+
+def test_callback() -> None:
+    call_list: List[Tuple[str, str, float, Dict[str, str]]] = []
+    metrics = pyatmo.CallbackMetrics(
+            lambda *args: call_list.append(args))  # type: ignore
+    assert metrics.enabled
+    metrics.increment('total', endpoint='getmeasure')
+    metrics.observe('seconds', 0.5)
+    assert call_list == [
+            ('counter', 'total', 1.0, {'endpoint': 'getmeasure'}),
+            ('histogram', 'seconds', 0.5, {})]
+
+
+def test_null(monkeypatch: pytest.MonkeyPatch) -> None:
+    metrics = pyatmo.Metrics()
+    assert not metrics.enabled
+    metrics.increment('total')
+    metrics.observe('seconds', 0.5)
+
+    def endpoint_name(*args: Any) -> str:
+        raise AssertionError('not short-circuited')
+
+    # disabled: no label is computed
+    monkeypatch.setattr(pyatmo._request, 'endpoint_name', endpoint_name)
+    record_request(
+            metrics,
+            'https://api.netatmo.com/api/getmeasure',
+            time.perf_counter(),
+            200,
+            0)
+    with pytest.raises(AssertionError):
+        record_request(
+                pyatmo.InMemoryMetrics(),
+                'https://api.netatmo.com/api/getmeasure',
+                time.perf_counter(),
+                200,
+                0)
+
+
+def test_client(server: StubServer) -> None:
+    metrics = pyatmo.InMemoryMetrics()
+    client = create_client(server, metrics=metrics)
+    assert client.get_stations_data() is not None
+    client.close()
+    snapshot = metrics.snapshot()
+    for endpoint in ('token', 'getstationsdata'):
+        assert snapshot.counter(
+                'pyatmo_requests_total',
+                endpoint=endpoint,
+                status='200') == 1.0
+        histogram = snapshot.histogram(
+                'pyatmo_request_seconds',
+                endpoint=endpoint)
+        assert histogram is not None and histogram.samples == 1
+        assert snapshot.counter(
+                'pyatmo_response_bytes_total',
+                endpoint=endpoint) > 0
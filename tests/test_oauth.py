@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+import concurrent.futures
+import logging
+import pathlib
+import threading
+import time
+from typing import Any, Callable, Iterator, Optional
+import pytest
+import pyatmo._oauth
+from pyatmo._oauth import OAuth
+from pyatmo._request import Request
+from pyatmo._token_store import TokenStore
+from benchmark.dataset import Dataset
+from benchmark.stub_server import PASSWORD, StubServer, account_username
+
+
+_TOKEN_PATH = '/oauth2/token'
+
+
+def _create_oauth(
+        server: StubServer,
+        token_file: Optional[pathlib.Path] = None,
+        refresh_margin: Optional[float] = None) -> OAuth:
+    oauth = OAuth(
+            'client_id',
+            'client_secret',
+            token_file=token_file,
+            request=Request(max_retries=0),
+            base_url=server.url,
+            refresh_margin=refresh_margin,
+            logger=logging.getLogger('pyatmo.test.oauth'))
+    oauth.get_access_token(account_username(0), PASSWORD)
+    return oauth
+
+
+def _wait(condition: Callable[[], bool], timeout: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+@pytest.fixture
+def short_server(dataset: Dataset) -> Iterator[StubServer]:
+    # tokens refreshed in the background after 2 seconds
+    with StubServer(dataset, token_lifetime=4) as stub:
+        yield stub
+
+
+def test_background_refresh(
+        short_server: StubServer,
+        tmp_path: pathlib.Path) -> None:
+    token_file = tmp_path.joinpath('token.yaml')
+    oauth = _create_oauth(
+            short_server,
+            token_file=token_file,
+            refresh_margin=3.0)
+    access_token = oauth.access_token
+    try:
+        # no API call: refreshed by the thread before the expiration
+        assert _wait(lambda: oauth._access_token != access_token)
+        assert not oauth.is_expired
+        assert short_server.request_count[_TOKEN_PATH] >= 2
+        assert _wait(lambda: (
+                TokenStore(token_file).read() or {}).get('access_token')
+                == oauth._access_token)
+    finally:
+        oauth.close()
+    refresher = oauth._refresher
+    assert refresher is not None
+    assert not refresher.is_alive()
+
+
+def test_background_refresh_error(
+        short_server: StubServer,
+        monkeypatch: pytest.MonkeyPatch,
+        caplog: pytest.LogCaptureFixture) -> None:
+    monkeypatch.setattr(pyatmo._oauth, '_REFRESH_RETRY_INTERVAL', 0.1)
+    request_refresh = OAuth._request_refresh
+    error_list = [OSError('connection reset')]
+
+    def _request_refresh(self: OAuth) -> bool:
+        if error_list:
+            raise error_list.pop()
+        return request_refresh(self)
+
+    monkeypatch.setattr(OAuth, '_request_refresh', _request_refresh)
+    oauth = _create_oauth(short_server, refresh_margin=3.0)
+    access_token = oauth.access_token
+    try:
+        # the refresher survives the error and retries
+        assert _wait(lambda: oauth._access_token != access_token)
+        assert not error_list
+        assert any(
+                record.exc_info is not None
+                and isinstance(record.exc_info[1], OSError)
+                for record in caplog.records)
+    finally:
+        oauth.close()
+
+
+def test_close(short_server: StubServer, tmp_path: pathlib.Path) -> None:
+    token_file = tmp_path.joinpath('token.yaml')
+    oauth = _create_oauth(
+            short_server,
+            token_file=token_file,
+            refresh_margin=3.0)
+    oauth.close()
+    refresher = oauth._refresher
+    assert refresher is not None
+    assert not refresher.is_alive()
+    # closed: the token file is not written anymore
+    data = TokenStore(token_file).read()
+    assert data is not None
+    oauth.refresh_token()
+    assert oauth._access_token != data['access_token']
+    assert TokenStore(token_file).read() == data
+
+
+def test_refresh_token_single_flight(dataset: Dataset) -> None:
+    # slow responses: every thread reads the token during the refresh
+    with StubServer(dataset, latency=0.2) as server:
+        oauth = _create_oauth(server)
+        access_token = oauth.access_token
+        barrier = threading.Barrier(8)
+
+        def _refresh(*args: Any) -> None:
+            barrier.wait()
+            oauth.refresh_token()
+
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            list(executor.map(_refresh, range(8)))
+        oauth.close()
+        # password grant & one refresh (refresh tokens are single use)
+        assert server.request_count[_TOKEN_PATH] == 2
+        assert oauth.access_token != access_token
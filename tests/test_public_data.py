@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+import pytest
+from pyatmo._client import iter_public_data
+from pyatmo._public_data import BoundingBox
+from benchmark.dataset import Dataset
+from benchmark.stub_server import PUBLIC_DATA_LIMIT, StubServer
+from conftest import create_client
+
+
+_LOGGER = logging.getLogger('pyatmo.test')
+
+
+def _station(station_id: str) -> Dict[str, Any]:
+    return {'_id': station_id}
+
+
+def test_split() -> None:
+    # more stations than a response holds: split until complete
+    public_dataset = Dataset.generate(
+            stations=1,
+            days=1.0,
+            public_stations=3 * PUBLIC_DATA_LIMIT,
+            seed=1)
+    with StubServer(public_dataset) as server:
+        client = create_client(server)
+        station_list = list(client.iter_public_data(
+                lat_ne=51.0,
+                lon_ne=8.0,
+                lat_sw=43.0,
+                lon_sw=-2.0,
+                tile_limit=PUBLIC_DATA_LIMIT))
+        client.close()
+        # root & at least its 4 sub-tiles
+        assert server.request_count['/api/getpublicdata'] >= 5
+    id_list = [station['_id'] for station in station_list]
+    assert len(id_list) == len(set(id_list))
+    assert set(id_list) == {
+            station.id for station in public_dataset.public_stations}
+
+
+def test_small_area(dataset: Dataset, server: StubServer) -> None:
+    # a tile below the limit is not split
+    client = create_client(server)
+    station_list = list(client.iter_public_data(
+            lat_ne=51.0,
+            lon_ne=8.0,
+            lat_sw=43.0,
+            lon_sw=-2.0))
+    client.close()
+    assert server.request_count['/api/getpublicdata'] == 1
+    assert len(station_list) == len(dataset.public_stations)
+
+
+def test_dedup() -> None:
+    # tiles share their edges: a station on an edge is in several tiles
+    box_list: List[BoundingBox] = []
+
+    def get_public_data(*box: float, **kwargs: Any) -> Dict[str, Any]:
+        box_list.append(BoundingBox(*box))
+        if len(box_list) == 1:
+            return {'body': [_station('root-{0}'.format(i))
+                             for i in range(4)]}
+        return {'body': [_station('edge'), _station('root-0')]}
+
+    station_list = list(iter_public_data(
+            get_public_data,
+            _LOGGER,
+            10.0,
+            10.0,
+            0.0,
+            0.0,
+            tile_limit=4,
+            max_depth=1))
+    assert [station['_id'] for station in station_list] == [
+            'root-0', 'root-1', 'root-2', 'root-3', 'edge']
+    # root, then the quadtree split of the root
+    assert box_list[0] == BoundingBox(10.0, 10.0, 0.0, 0.0)
+    assert sorted(box_list[1:]) == sorted(box_list[0].split())
+
+
+def test_max_depth() -> None:
+    # always full: split up to max_depth only
+    call_list: List[int] = []
+    lock = threading.Lock()
+
+    def get_public_data(*box: float, **kwargs: Any) -> Dict[str, Any]:
+        with lock:
+            call_list.append(len(call_list))
+            return {'body': [_station('station-{0}-{1}'.format(
+                                     len(call_list), i))
+                             for i in range(2)]}
+
+    station_list = list(iter_public_data(
+            get_public_data,
+            _LOGGER,
+            10.0,
+            10.0,
+            0.0,
+            0.0,
+            tile_limit=2,
+            max_depth=2))
+    assert len(call_list) == 1 + 4 + 16
+    assert len(station_list) == 2 * len(call_list)
+
+
+def test_fan_out(caplog: pytest.LogCaptureFixture) -> None:
+    # sub-tiles are fetched concurrently by max_workers threads
+    root = BoundingBox(10.0, 10.0, 0.0, 0.0)
+    lock = threading.Lock()
+    running = [0]
+    max_running = [0]
+    thread_name_set = set()
+
+    def get_public_data(
+            *box: float,
+            **kwargs: Any) -> Optional[Dict[str, Any]]:
+        with lock:
+            running[0] += 1
+            max_running[0] = max(max_running[0], running[0])
+            thread_name_set.add(threading.current_thread().name)
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        tile = BoundingBox(*box)
+        if tile == root:
+            return {'body': [_station(str(i)) for i in range(3)]}
+        # failed tile: skipped
+        if tile == root.split()[0]:
+            return None
+        return {'body': [_station(str(tile))]}
+
+    station_list = list(iter_public_data(
+            get_public_data,
+            _LOGGER,
+            *root,
+            tile_limit=3,
+            max_depth=1,
+            max_workers=4))
+    assert max_running[0] == 4
+    assert all(name.startswith('pyatmo_public_data')
+               for name in thread_name_set)
+    # root & 3 of the 4 sub-tiles
+    assert len(station_list) == 3 + 3
+    assert any('tile is skipped' in record.getMessage()
+               for record in caplog.records)
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+import json
+from typing import Any, List, Union
+import pytest
+import requests
+from pyatmo import InMemoryMetrics
+from pyatmo._oauth import OAuth
+from pyatmo._rate_limiter import RateLimiter, TokenBucket
+from pyatmo._request import Request
+
+
+_URL = 'http://127.0.0.1/api/getmeasure'
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class _Session:
+    # responses (or exceptions) in order
+    def __init__(self, result_list: List[Union[int, Exception]]) -> None:
+        self.result_list = result_list
+        self.url_list: List[str] = []
+
+    def request(self, method: str, url: str, **kwargs: Any) -> Any:
+        self.url_list.append(url)
+        result = self.result_list.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return _response(result)
+
+    def close(self) -> None:
+        pass
+
+
+def _response(status_code: int) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    if status_code == 403:
+        body: Any = {'error': {'code': 26, 'message': 'User usage reached'}}
+    elif status_code >= 400:
+        body = {'error': {'code': 0, 'message': 'error'}}
+    else:
+        body = {'status': 'ok', 'body': {}}
+    response._content = json.dumps(body).encode('utf-8')
+    return response
+
+
+def test_debt() -> None:
+    clock = _Clock()
+    rate_limiter = RateLimiter([TokenBucket(1.0, 2)], clock=clock)
+    # burst, then the debt of the queued requests
+    assert rate_limiter.reserve() == 0.0
+    assert rate_limiter.reserve() == 0.0
+    assert rate_limiter.delay() == pytest.approx(1.0)
+    assert rate_limiter.reserve() == pytest.approx(1.0)
+    assert rate_limiter.reserve() == pytest.approx(2.0)
+    assert rate_limiter.delay() == pytest.approx(3.0)
+    # the debt is paid back over time
+    clock.now += 1.5
+    assert rate_limiter.delay() == pytest.approx(1.5)
+    assert rate_limiter.reserve() == pytest.approx(1.5)
+    clock.now += 100.0
+    assert rate_limiter.delay() == 0.0
+    assert rate_limiter.reserve() == 0.0
+    assert rate_limiter.reserve() == 0.0
+    assert rate_limiter.reserve() == pytest.approx(1.0)
+
+
+def test_multi_bucket() -> None:
+    clock = _Clock()
+    rate_limiter = RateLimiter.create(
+            request_interval=0.5,
+            requests_per_10s=3,
+            clock=clock)
+    # interval bucket: 2 per second, 10 s bucket: 3 + 0.3 per second
+    assert rate_limiter.reserve() == 0.0
+    assert rate_limiter.reserve() == pytest.approx(0.5)
+    clock.now += 1.0
+    assert rate_limiter.reserve() == 0.0
+    # the 10 s bucket is the limit: 3 - 3 + 0.6 - 1 tokens
+    clock.now += 1.0
+    assert rate_limiter.reserve() == pytest.approx(0.4 / 0.3)
+
+
+def test_no_bucket() -> None:
+    rate_limiter = RateLimiter.create(request_interval=None)
+    assert all(rate_limiter.reserve() == 0.0 for _ in range(100))
+
+
+def test_throttle_recover() -> None:
+    clock = _Clock()
+    rate_limiter = RateLimiter([TokenBucket(1.0, 5)], clock=clock)
+    assert rate_limiter.reserve() == 0.0
+    # usage reached: drained & half rate
+    rate_limiter.throttle()
+    assert rate_limiter.scale == 0.5
+    assert rate_limiter.reserve() == pytest.approx(2.0)
+    for _ in range(10):
+        rate_limiter.throttle()
+    assert rate_limiter.scale == 1.0 / 32
+    # additive increase
+    rate_limiter.recover()
+    assert rate_limiter.scale == pytest.approx(1.0 / 32 + 1.0 / 16)
+    for _ in range(20):
+        rate_limiter.recover()
+    assert rate_limiter.scale == 1.0
+
+
+@pytest.mark.parametrize('status_code,is_throttled', [
+        (200, False),
+        (429, True),
+        # error code 26: user usage reached
+        (403, True),
+        (400, False)])
+def test_request_adapt(status_code: int, is_throttled: bool) -> None:
+    rate_limiter = RateLimiter([], clock=_Clock())
+    rate_limiter.throttle()
+    metrics = InMemoryMetrics()
+    request = Request(
+            rate_limiter=rate_limiter,
+            session=_Session([status_code]),  # type: ignore
+            metrics=metrics)
+    assert request.request('post', _URL).status_code == status_code
+    assert rate_limiter.scale == (0.25 if is_throttled else 0.5 + 1.0 / 16)
+    assert (metrics.snapshot().counter('pyatmo_rate_limiter_throttle_total')
+            == (1.0 if is_throttled else 0.0))
+
+
+def test_request_retry() -> None:
+    # each retry is rate limited & recorded
+    rate_limiter = RateLimiter([TokenBucket(1.0, 10)], clock=_Clock())
+    metrics = InMemoryMetrics()
+    session = _Session([requests.ConnectionError(), 503, 200])
+    request = Request(
+            rate_limiter=rate_limiter,
+            session=session,  # type: ignore
+            max_retries=3,
+            backoff_factor=0.0,
+            metrics=metrics)
+    assert request.request('post', _URL).status_code == 200
+    assert session.url_list == [_URL] * 3
+    assert rate_limiter._bucket_list[0].tokens == pytest.approx(7.0)
+    snapshot = metrics.snapshot()
+    histogram = snapshot.histogram('pyatmo_rate_limiter_wait_seconds')
+    assert histogram is not None and histogram.samples == 3
+    assert snapshot.counter(
+            'pyatmo_request_retries_total',
+            endpoint='getmeasure') == 2.0
+    for status in ['error', '503', '200']:
+        assert snapshot.counter(
+                'pyatmo_requests_total',
+                endpoint='getmeasure',
+                status=status) == 1.0
+
+
+def test_request_max_retries() -> None:
+    session = _Session([503, 502, 200])
+    request = Request(
+            session=session,  # type: ignore
+            max_retries=1,
+            backoff_factor=0.0)
+    assert request.request('post', _URL).status_code == 502
+    session = _Session([requests.ConnectionError()] * 2)
+    request = Request(
+            session=session,  # type: ignore
+            max_retries=1,
+            backoff_factor=0.0)
+    with pytest.raises(requests.ConnectionError):
+        request.request('post', _URL)
+    assert len(session.url_list) == 2
+    # not transient: raised at once
+    session = _Session([requests.TooManyRedirects(), 200])
+    request = Request(
+            session=session,  # type: ignore
+            max_retries=1,
+            backoff_factor=0.0)
+    with pytest.raises(requests.TooManyRedirects):
+        request.request('post', _URL)
+
+
+@pytest.mark.parametrize('result', [503, requests.ConnectionError()])
+def test_token_not_retried(result: Union[int, Exception]) -> None:
+    # a single-use refresh token must not be sent twice
+    session = _Session([result, 200])
+    oauth = OAuth(
+            'client_id',
+            'client_secret',
+            request=Request(
+                    session=session,  # type: ignore
+                    max_retries=3,
+                    backoff_factor=0.0),
+            base_url='http://127.0.0.1',
+            refresh_margin=None)
+    if isinstance(result, Exception):
+        with pytest.raises(requests.ConnectionError):
+            oauth.get_access_token('username', 'password')
+    else:
+        oauth.get_access_token('username', 'password')
+    assert session.url_list == ['http://127.0.0.1/oauth2/token']
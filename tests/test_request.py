@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+import concurrent.futures
+from benchmark.dataset import Dataset
+from benchmark.stub_server import StubServer
+from conftest import create_client
+
+
+def test_connection_reuse(dataset: Dataset, server: StubServer) -> None:
+    client = create_client(server)
+    module = dataset.stations[0].modules[0]
+    for i in range(20):
+        response = client.get_measure(
+                device_id=module.device_id,
+                module_id=module.id,
+                scale='max',
+                type_list=module.data_type,
+                date_begin=dataset.begin + i * dataset.step,
+                limit=1)
+        assert response is not None
+    client.close()
+    # token & 20 getmeasure requests on a single connection
+    assert server.request_count['/api/getmeasure'] == 20
+    assert server.connection_count == 1
+
+
+def test_connection_pool_size(dataset: Dataset, server: StubServer) -> None:
+    client = create_client(server, pool_size=4)
+    module = dataset.stations[0].modules[0]
+
+    def call(i: int) -> bool:
+        return client.get_measure(
+                device_id=module.device_id,
+                module_id=module.id,
+                scale='max',
+                type_list=module.data_type,
+                date_begin=dataset.begin + i * dataset.step,
+                limit=1) is not None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        assert all(executor.map(call, range(100)))
+    client.close()
+    # at most one connection per worker
+    assert server.request_count['/api/getmeasure'] == 100
+    assert server.connection_count <= 4
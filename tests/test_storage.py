@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import pathlib
+from typing import Any, Dict, List
+import pytest
+import sqlalchemy
+import pyatmo
+import pyatmo.weather
+from benchmark.dataset import Dataset
+
+
+def _rows(module_id: str, timestamp_list: List[int]) -> List[Dict[str, Any]]:
+    return [
+            {'module_id': module_id,
+             'timestamp': timestamp,
+             'temperature': float(i)}
+            for i, timestamp in enumerate(timestamp_list)]
+
+
+def test_abstract() -> None:
+    with pytest.raises(TypeError):
+        pyatmo.weather.Storage()  # type: ignore
+
+
+@pytest.mark.parametrize('storage_class', [
+        pyatmo.weather.SQLStorage,
+        pyatmo.weather.LongStorage])
+def test_unsupported_dialect(storage_class: Any) -> None:
+    engine = sqlalchemy.create_engine(
+            'mysql://',
+            strategy='mock',
+            executor=lambda *args, **kwargs: None)
+    with pytest.raises(ValueError):
+        storage_class().bind(engine, engine)
+
+
+def test_overlapping_import(
+        tmp_path: pathlib.Path,
+        database: pyatmo.weather.Database) -> None:
+    # rows already stored are ignored by every storage
+    database.register()
+    database.update(min_update_interval=None)
+    module = database.all_device()[0].modules[0]
+    expected = [row.timestamp for row in database.measurements(module)]
+    database.export_archive(tmp_path.joinpath('archive'))
+    for _ in range(2):
+        assert database.import_archive(tmp_path.joinpath('archive')) > 0
+    assert [row.timestamp for row in database.measurements(module)] == (
+            expected)
+
+
+def test_parquet_duplicated_rows(tmp_path: pathlib.Path) -> None:
+    pytest.importorskip('pyarrow')
+    storage = pyatmo.weather.ParquetStorage(tmp_path)
+    timestamp = 1704067200
+    storage.insert(
+            None,  # type: ignore
+            'module',
+            _rows('module', [timestamp, timestamp + 300, timestamp]))
+    storage.insert(
+            None,  # type: ignore
+            'module',
+            _rows('module', [timestamp + 300, timestamp + 600]))
+    assert storage.select('module', None, None, ['temperature']) == [
+            (timestamp, 0.0),
+            (timestamp + 300, 1.0),
+            (timestamp + 600, 1.0)]
+    # no temporary file left
+    assert [path.suffix for path in tmp_path.glob('*/*')] == ['.parquet']
+
+
+def test_parquet_unregister_rollback(
+        monkeypatch: pytest.MonkeyPatch,
+        tmp_path: pathlib.Path,
+        dataset: Dataset,
+        client: pyatmo.Client) -> None:
+    pytest.importorskip('pyarrow')
+    directory = tmp_path.joinpath('parquet')
+    database = pyatmo.weather.Database(
+            tmp_path.joinpath('weather.sqlite3'),
+            client,
+            storage=pyatmo.weather.ParquetStorage(directory))
+    database.register()
+    database.update(min_update_interval=None)
+    file_list = sorted(directory.glob('*/*.parquet'))
+    assert file_list
+
+    def fail(*args: Any) -> None:
+        raise RuntimeError('rollback')
+
+    # the transaction fails after Storage.delete
+    monkeypatch.setattr(
+            pyatmo.weather.ModuleSyncState.__table__,
+            'delete',
+            fail)
+    with pytest.raises(RuntimeError):
+        database.unregister(dataset.stations[0].id)
+    monkeypatch.undo()
+    assert database.device(dataset.stations[0].id) is not None
+    assert sorted(directory.glob('*/*.parquet')) == file_list
+    database.unregister(dataset.stations[0].id)
+    assert sorted(directory.glob('*/*.parquet')) != file_list
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+import os
+import pathlib
+import stat
+import pytest
+from pyatmo._token_store import TokenStore
+
+
+_DATA = {'access_token': 'access', 'refresh_token': 'refresh'}
+
+
+def _mode(path: pathlib.Path) -> int:
+    return stat.S_IMODE(path.stat().st_mode)
+
+
+def test_read_write(tmp_path: pathlib.Path) -> None:
+    store = TokenStore(tmp_path.joinpath('token.yaml'))
+    assert not store.exists()
+    assert store.read() is None
+    with store.lock():
+        store.write(_DATA)
+    assert store.read() == _DATA
+    assert [path.name for path in tmp_path.glob('*.tmp')] == []
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='POSIX file mode')
+def test_new_file_mode(tmp_path: pathlib.Path) -> None:
+    path = tmp_path.joinpath('token.yaml')
+    TokenStore(path).write(_DATA)
+    assert _mode(path) == 0o600
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='POSIX file mode')
+@pytest.mark.parametrize('mode', [0o600, 0o640])
+def test_keep_file_mode(tmp_path: pathlib.Path, mode: int) -> None:
+    path = tmp_path.joinpath('token.yaml')
+    path.write_text('{}')
+    path.chmod(mode)
+    TokenStore(path).write(_DATA)
+    assert _mode(path) == mode
+    assert TokenStore(path).read() == _DATA